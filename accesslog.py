@@ -0,0 +1,97 @@
+#!/usr/bin/env python3
+"""
+Non-blocking structured access log for the User Management REST API
+
+The request thread only builds a small tuple and puts it on a bounded
+in-memory queue. A background thread takes entries off the queue in
+batches, renders them as JSON lines and appends each batch to the log
+file with a single write. When the queue is full (the disk can't keep
+up) entries are dropped and counted rather than slowing requests down.
+The queue and writer thread live in linequeue.py.
+
+Configuration (create_app() settings, see app.default_config()):
+    ACCESS_LOG         log file path; access logging is off when unset
+    ACCESS_LOG_SAMPLE  fraction of requests to log, 0..1 (default 1);
+                       5xx responses are always logged
+    ACCESS_LOG_QUEUE   queue capacity in entries (default 10000)
+"""
+
+import json
+import random
+import time
+from datetime import datetime, timezone
+
+from flask import request
+
+from linequeue import QueuedLineWriter
+from tracing import REQUEST_ID_ENVIRON, current_trace
+
+# WSGI environ key holding the request's start time (perf_counter_ns)
+START_ENVIRON = 'user_api.access_log.start_ns'
+
+
+class AccessLogger(QueuedLineWriter):
+    """Bounded queue plus a background batch writer for access log entries"""
+
+    def __init__(self, path=None, sample_rate=1.0, queue_size=10000):
+        super().__init__(path, format_entry, queue_size, name='access-log')
+        self.sample_rate = sample_rate
+        self.sampled_out = 0
+
+    def init_app(self, app):
+        app.before_request(self._before_request)
+        app.after_request(self._after_request)
+
+    # Request path
+
+    def _before_request(self):
+        # Timed here rather than taken from the trace, so durations are
+        # logged with tracing switched off too
+        request.environ[START_ENVIRON] = time.perf_counter_ns()
+
+    def _after_request(self, response):
+        if self.path is None:
+            return response
+        status = response.status_code
+        if self.sample_rate < 1.0 and status < 500 and random.random() >= self.sample_rate:
+            self.sampled_out += 1
+            return response
+        environ = request.environ
+        start_ns = environ.get(START_ENVIRON)
+        duration_ns = time.perf_counter_ns() - start_ns if start_ns is not None else None
+        trace = current_trace()
+        request_id = trace.request_id if trace is not None else environ.get(REQUEST_ID_ENVIRON)
+        self.log((
+            time.time(), request.method, request.path, environ.get('QUERY_STRING', ''),
+            status, duration_ns, response.content_length, request_id,
+            request.remote_addr, environ.get('HTTP_USER_AGENT')
+        ))
+        return response
+
+    def stats(self):
+        """Counters for /health"""
+        return {
+            "enabled": self.path is not None,
+            "sample_rate": self.sample_rate,
+            "sampled_out": self.sampled_out,
+            **super().stats()
+        }
+
+
+def format_entry(entry):
+    """Render a queued entry as one JSON line"""
+    (timestamp, method, path, query, status, duration_ns, size,
+     request_id, remote_addr, user_agent) = entry
+    record = {
+        "ts": datetime.fromtimestamp(timestamp, timezone.utc).isoformat(timespec='milliseconds'),
+        "method": method,
+        "path": path,
+        "query": query or None,
+        "status": status,
+        "duration_ms": round(duration_ns / 1e6, 3) if duration_ns is not None else None,
+        "bytes": size,
+        "request_id": request_id,
+        "remote_addr": remote_addr,
+        "user_agent": user_agent
+    }
+    return json.dumps(record, separators=(',', ':')) + '\n'
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+"""
+Incrementally maintained aggregates for the User Management REST API
+
+Every write to the user store updates these counters, so endpoints that
+only need totals (/, /health, list page counts, HEAD /users) can read them
+in O(1) instead of walking users_db.
+"""
+
+from collections import Counter
+from datetime import datetime
+
+# User fields the aggregates depend on
+AGGREGATED_FIELDS = ('department', 'age')
+
+
+class UserAggregates:
+    """Running totals over all stored users"""
+
+    def __init__(self):
+        self.clear()
+
+    def clear(self):
+        """Reset every aggregate to its empty state"""
+        self.total = 0
+        self.department_counts = Counter()
+        self.age_counts = Counter()
+        self.age_count = 0
+        self.age_sum = 0
+        self.age_min = None
+        self.age_max = None
+        self.last_modified = datetime.now().isoformat()
+
+    def touch(self):
+        """Record that the store changed"""
+        self.last_modified = datetime.now().isoformat()
+
+    def add(self, user):
+        """Account for a user being added to the store"""
+        self.total += 1
+        self.department_counts[user.get('department') or ''] += 1
+
+        age = user.get('age')
+        if _is_age(age):
+            self.age_counts[age] += 1
+            self.age_count += 1
+            self.age_sum += age
+            if self.age_min is None or age < self.age_min:
+                self.age_min = age
+            if self.age_max is None or age > self.age_max:
+                self.age_max = age
+        self.touch()
+
+    def remove(self, user):
+        """Account for a user being removed from the store"""
+        self.total -= 1
+        department = user.get('department') or ''
+        self.department_counts[department] -= 1
+        if self.department_counts[department] <= 0:
+            del self.department_counts[department]
+
+        age = user.get('age')
+        if _is_age(age):
+            self.age_count -= 1
+            self.age_sum -= age
+            self.age_counts[age] -= 1
+            if self.age_counts[age] <= 0:
+                del self.age_counts[age]
+                # Only rescan the distinct ages when an extreme disappears
+                if age == self.age_min:
+                    self.age_min = min(self.age_counts) if self.age_counts else None
+                if age == self.age_max:
+                    self.age_max = max(self.age_counts) if self.age_counts else None
+        self.touch()
+
+    def rebuild(self, users):
+        """Recompute every aggregate from scratch in one pass over `users`"""
+        self.clear()
+        departments = []
+        ages = []
+        for user in users:
+            departments.append(user.get('department') or '')
+            age = user.get('age')
+            if _is_age(age):
+                ages.append(age)
+        self.total = len(departments)
+        self.department_counts = Counter(departments)
+        self.age_counts = Counter(ages)
+        self.age_count = len(ages)
+        self.age_sum = sum(ages)
+        if ages:
+            self.age_min = min(self.age_counts)
+            self.age_max = max(self.age_counts)
+
+    def to_dict(self):
+        """Aggregates in the shape returned by the API"""
+        return {
+            "total_users": self.total,
+            "departments": dict(self.department_counts),
+            "age": {
+                "min": self.age_min,
+                "max": self.age_max,
+                "sum": self.age_sum,
+                "average": round(self.age_sum / self.age_count, 2) if self.age_count else None
+            },
+            "last_modified": self.last_modified
+        }
+
+
+def _is_age(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
@@ -10,90 +10,387 @@ Author: Python Developer Intern
 Date: September 26, 2025
 """
 
-from flask import Flask, request, jsonify
+from flask import Blueprint, Flask, current_app, has_app_context, request, url_for
 from datetime import datetime
+import functools
+import hmac
 import json
 import os
+import tempfile
+import threading
+import time
 
-# Initialize Flask application
-app = Flask(__name__)
-app.config['JSON_SORT_KEYS'] = False
+from accesslog import AccessLogger
+from formats import UnsupportedBodyError, has_body, read_body, render, wants_minimal, wants_msgpack
+from indexes import parse_sort, encode_cursor, decode_cursor
+from singleflight import SingleFlight
+from store import UserStore, BatchError, DuplicateEmailError, UserNotFoundError
+from tracing import Tracer, record_phase, span
+from validation import user_validator, flatten_errors
 
-# In-memory storage for users (as specified in requirements)
-users_db = {}
-user_counter = 1
+# Routes live on a blueprint so create_app() can build any number of apps
+api = Blueprint('user_api', __name__)
+
+# Upper bound on operations accepted by a single POST /batch
+MAX_BATCH_OPERATIONS = 10000
+
+# Seed file extensions POST /imports understands
+IMPORT_EXTENSIONS = ('.ndjson', '.jsonl', '.csv')
+
+# Largest synthetic-<N> dataset an (unauthenticated) POST /reset may load
+MAX_RESET_SYNTHETIC_USERS = 100000
+
+# Methods a READ_ONLY app still serves; everything else is a write
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+# ?snapshot= values that pin a new snapshot (these requests are never coalesced)
+NEW_SNAPSHOT_VALUES = ('new', 'true', '1')
+
+def default_config():
+    """create_app() settings, taken from the environment.
+
+    DATASET            named dataset loaded at startup (USER_DATASET; None: empty)
+    STORE_TIER         'memory' or 'tiered' (USER_STORE_TIER, see tiered.py)
+    STORE_HOT_MB       tiered mode's in-memory budget (USER_STORE_HOT_MB)
+    STORE_SPILL_PATH   tiered mode's SQLite file (USER_STORE_SPILL_PATH)
+    TRACING            per-request phase tracing and X-Request-ID handling
+    TRACE_FILE         OTLP/JSON export file (USER_TRACE_FILE)
+    SLOW_REQUEST_MS    slow-request log threshold (USER_SLOW_REQUEST_MS)
+    ACCESS_LOG         JSON-lines access log file (USER_ACCESS_LOG; None: off)
+    ACCESS_LOG_SAMPLE  fraction of requests logged (USER_ACCESS_LOG_SAMPLE)
+    ACCESS_LOG_QUEUE   access log queue capacity (USER_ACCESS_LOG_QUEUE)
+    SINGLE_FLIGHT      coalesce identical concurrent reads
+    DEBUG_TOKEN        enables /debug with this X-Debug-Token (USER_DEBUG_TOKEN)
+    IMPORT_DIR         directory POST /imports may read (USER_IMPORT_DIR)
+    IMPORT_WORKERS     background import threads (USER_IMPORT_WORKERS)
+    READ_ONLY          refuse writes with 503 (serve.py --read-only replicas)
+    """
+    env = os.environ.get
+    return {
+        'JSON_SORT_KEYS': False,
+        'DATASET': env('USER_DATASET') or None,
+        'STORE_TIER': env('USER_STORE_TIER', 'memory'),
+        'STORE_HOT_MB': float(env('USER_STORE_HOT_MB', '64')),
+        'STORE_SPILL_PATH': env('USER_STORE_SPILL_PATH') or None,
+        'TRACING': True,
+        'TRACE_FILE': env('USER_TRACE_FILE') or None,
+        'SLOW_REQUEST_MS': float(env('USER_SLOW_REQUEST_MS', '500')),
+        'ACCESS_LOG': env('USER_ACCESS_LOG') or None,
+        'ACCESS_LOG_SAMPLE': float(env('USER_ACCESS_LOG_SAMPLE', '1')),
+        'ACCESS_LOG_QUEUE': int(env('USER_ACCESS_LOG_QUEUE', '10000')),
+        'SINGLE_FLIGHT': True,
+        'DEBUG_TOKEN': env('USER_DEBUG_TOKEN') or None,
+        'IMPORT_DIR': env('USER_IMPORT_DIR') or env('USER_DATASET_DIR', 'datasets'),
+        'IMPORT_WORKERS': int(env('USER_IMPORT_WORKERS', '2')),
+        'READ_ONLY': False,
+    }
+
+class lazy:
+    """Build an attribute on first access, once even if threads race for it.
+
+    Afterwards the value sits in the instance __dict__, which shadows this
+    (non-data) descriptor, so later reads cost a plain attribute lookup.
+    """
+
+    def __init__(self, build):
+        self.build = build
+        self.name = build.__name__
+        self.lock = threading.RLock()
+        functools.update_wrapper(self, build)
+
+    def __get__(self, obj, owner=None):
+        if obj is None:
+            return self
+        with self.lock:
+            if self.name not in obj.__dict__:
+                obj.__dict__[self.name] = self.build(obj)
+        return obj.__dict__[self.name]
+
+class AppState:
+    """Everything one app instance owns; each part is built on first use"""
+
+    def __init__(self, config):
+        self.config = config
+        # One /debug session at a time
+        self.debug_lock = threading.Lock()
+
+    @lazy
+    def store(self):
+        """In-memory storage for users (as specified in requirements).
+
+        Records, sorted indexes and aggregates, published as versioned
+        snapshots. STORE_TIER='tiered' keeps only hot records in memory
+        (see tiered.py).
+        """
+        tier = None
+        if self.config['STORE_TIER'] == 'tiered':
+            from tiered import TieredRecords
+            tier = TieredRecords(int(self.config['STORE_HOT_MB'] * 1024 * 1024),
+                                 self.config['STORE_SPILL_PATH'])
+        return UserStore(tier)
+
+    @lazy
+    def importer(self):
+        """Background imports (POST /imports), written through the same store"""
+        from imports import ImportManager
+        return ImportManager(self.store, user_validator, self.config['IMPORT_WORKERS'])
+
+    @lazy
+    def single_flight(self):
+        """Identical concurrent reads share one computed response"""
+        return SingleFlight()
+
+    @lazy
+    def tracer(self):
+        """Per-request phase tracing, OTLP/JSON export and the slow-request log"""
+        return Tracer(self.config['TRACE_FILE'], self.config['SLOW_REQUEST_MS'])
+
+    @lazy
+    def access_log(self):
+        """JSON-lines access log; requests only pay for a non-blocking enqueue"""
+        return AccessLogger(self.config['ACCESS_LOG'], self.config['ACCESS_LOG_SAMPLE'],
+                            self.config['ACCESS_LOG_QUEUE'])
+
+    def built(self):
+        """Names of the parts built so far"""
+        return sorted(name for name, value in vars(type(self)).items()
+                      if isinstance(value, lazy) and name in self.__dict__)
+
+    def load_dataset(self, name, max_synthetic=None):
+        """Replace the store with a named dataset (see datasets.py).
+
+        Raises UnknownDatasetError (a KeyError) for an unknown name and
+        ValueError for a dataset that can't be read or loaded.
+        """
+        from datasets import resolve_dataset, MAX_SYNTHETIC_USERS
+        users = resolve_dataset(name, max_synthetic or MAX_SYNTHETIC_USERS)
+        self.replace_users(users, validate=name not in ('sample', 'empty'))
+
+    def replace_users(self, users, validate=False):
+        """Replace every stored user at once (see UserStore.load).
+
+        Raises ValueError for invalid records (when validate is set) or
+        duplicate ids/emails.
+        """
+        if validate:
+            failures = user_validator.validate_many(users)
+            if failures:
+                position, errors = failures[0]
+                raise ValueError(
+                    f"{len(failures)} invalid record(s); record {position}: "
+                    f"{'; '.join(flatten_errors(errors))}"
+                )
+        self.store.load(users)
+
+    def close(self):
+        """Stop imports, flush the logs and release the store's spill file before exit"""
+        if 'importer' in self.__dict__:
+            self.importer.shutdown()
+        if 'access_log' in self.__dict__:
+            self.access_log.close()
+        if 'tracer' in self.__dict__:
+            self.tracer.close()
+        if 'store' in self.__dict__:
+            self.store.close()
+
+def create_app(config=None):
+    """Build an app instance.
+
+    `config` overrides default_config(). Nothing heavier than the Flask
+    app itself is built here: the store, importer, coalescing and logging
+    are created on first use, and tracing and the access log only hook
+    into requests when the config turns them on. A DATASET is loaded
+    right away (so pre-fork servers load it once, before forking).
+    """
+    app = Flask(__name__)
+    app.config.update(default_config())
+    app.config.update(config or {})
+    state = app.extensions['user_api'] = AppState(app.config)
+    if app.config['TRACING']:
+        state.tracer.init_app(app)
+    if app.config['ACCESS_LOG']:
+        state.access_log.init_app(app)
+    if app.config['READ_ONLY']:
+        app.before_request(refuse_writes)
+    app.register_blueprint(api)
+    if app.config['DATASET']:
+        state.load_dataset(app.config['DATASET'])
+    return app
+
+_default_app = None
+_default_lock = threading.Lock()
+
+def default_app():
+    """The module-level app (``app.app``), created on first use"""
+    global _default_app
+    with _default_lock:
+        if _default_app is None:
+            _default_app = create_app()
+    return _default_app
+
+def get_state(app=None):
+    """The AppState of `app`, else of the app handling this request, else the default app"""
+    if app is None:
+        app = current_app if has_app_context() else default_app()
+    return app.extensions['user_api']
+
+def __getattr__(name):
+    # `from app import app`, `app.store` and friends keep working for
+    # scripts and tests; they refer to the default app
+    if name == 'app':
+        return default_app()
+    if name in ('store', 'importer', 'single_flight', 'tracer', 'access_log'):
+        return getattr(get_state(default_app()), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
 # Sample data for demonstration
 def initialize_sample_data():
     """Initialize some sample users for testing"""
-    global user_counter, users_db
-
-    sample_users = [
-        {
-            "name": "John Doe",
-            "email": "john.doe@example.com",
-            "age": 28,
-            "department": "Engineering"
-        },
-        {
-            "name": "Jane Smith", 
-            "email": "jane.smith@example.com",
-            "age": 25,
-            "department": "Marketing"
-        },
-        {
-            "name": "Mike Johnson",
-            "email": "mike.johnson@example.com", 
-            "age": 32,
-            "department": "Sales"
-        }
-    ]
+    from datasets import sample_users
+    replace_users(sample_users())
+
+def load_dataset(name, max_synthetic=None):
+    """Replace the store with a named dataset (see AppState.load_dataset)"""
+    get_state().load_dataset(name, max_synthetic)
 
-    for user_data in sample_users:
-        user_data.update({
-            "id": user_counter,
-            "created_at": datetime.now().isoformat(),
-            "updated_at": datetime.now().isoformat()
-        })
-        users_db[user_counter] = user_data
-        user_counter += 1
+def replace_users(users, validate=False):
+    """Replace every stored user at once (see AppState.replace_users)"""
+    get_state().replace_users(users, validate)
 
 # Helper functions
 def validate_user_data(data, is_update=False):
-    """Validate user data for required fields"""
-    required_fields = ['name', 'email']
-    if not is_update:
-        required_fields.extend(['age'])
+    """Validate user data and return a list of error messages.
+
+    Kept for existing callers; routes use user_validator directly to get
+    structured per-field errors.
+    """
+    return flatten_errors(user_validator.validate(data, partial=is_update))
+
+def get_user_by_id(user_id):
+    """Get user by ID from the database"""
+    return get_state().store.get(user_id)
+
+def resolve_snapshot():
+    """Pick the snapshot a listing reads from, based on ?snapshot=.
+
+    Returns (snapshot, token). 'snapshot=new' (or 'true'/'1') pins the latest
+    version and returns a fresh token; any other value is a token from an
+    earlier page. Without the parameter the latest snapshot is used
+    unpinned. Raises LookupError for unknown or expired tokens.
+    """
+    store = get_state().store
+    token = request.args.get('snapshot')
+    if not token:
+        return store.snapshot(), None
+    if token in NEW_SNAPSHOT_VALUES:
+        snapshot = store.snapshot()
+        return snapshot, store.pin(snapshot)
+    snapshot = store.pinned(token)
+    if snapshot is None:
+        raise LookupError(token)
+    return snapshot, token
 
+def parse_batch_operations(operations):
+    """Check and normalize POST /batch operations before touching the store.
+
+    Returns (parsed, errors): parsed is a list of (op, user_id, data) tuples
+    for UserStore.batch, errors a list of per-operation problems.
+    """
+    parsed = []
     errors = []
+    for position, operation in enumerate(operations):
+        if not isinstance(operation, dict):
+            errors.append({"operation": position, "errors": {"_body": ["Operation must be a JSON object"]}})
+            continue
+        op = operation.get('op')
+        user_id = operation.get('id')
+        data = operation.get('data')
 
-    for field in required_fields:
-        if field not in data or not data[field]:
-            errors.append(f"'{field}' is required")
+        problems = {}
+        if op not in ('create', 'update', 'delete'):
+            problems["op"] = ["'op' must be one of create, update, delete"]
+        if op in ('update', 'delete') and (not isinstance(user_id, int) or isinstance(user_id, bool)):
+            problems["id"] = ["'id' must be an integer user ID"]
+        if op in ('create', 'update'):
+            if not data:
+                problems["data"] = ["'data' is required"]
+            else:
+                problems.update(user_validator.validate(data, partial=(op == 'update')))
 
-    # Email validation (basic)
-    if 'email' in data and data['email']:
-        if '@' not in data['email'] or '.' not in data['email']:
-            errors.append("Invalid email format")
+        if problems:
+            errors.append({"operation": position, "errors": problems})
+        else:
+            parsed.append((op, user_id, data))
+    return parsed, errors
 
-    # Age validation
-    if 'age' in data and data['age'] is not None:
-        if not isinstance(data['age'], int) or data['age'] < 0:
-            errors.append("Age must be a positive integer")
+def coalesced(view):
+    """Let identical in-flight reads of a route share one computed response.
 
-    return errors
+    Requests are identical when method, path, query string, negotiated
+    format and store version all match. The leader's response is frozen
+    to (body, status, headers) and every follower gets its own Response
+    built from those bytes; the leader returns its response unchanged.
+    """
+    @functools.wraps(view)
+    def wrapper(*args, **kwargs):
+        state = get_state()
+        if not state.config['SINGLE_FLIGHT'] or request.args.get('snapshot') in NEW_SNAPSHOT_VALUES:
+            return view(*args, **kwargs)
+        key = (request.method, request.path, request.query_string,
+               wants_msgpack(), state.store.version)
 
-def get_user_by_id(user_id):
-    """Get user by ID from the database"""
-    return users_db.get(user_id)
+        def compute():
+            response = current_app.make_response(view(*args, **kwargs))
+            frozen = (response.get_data(), response.status_code, list(response.headers.items()))
+            return response, frozen
+
+        start = time.perf_counter_ns()
+        (response, frozen), shared = state.single_flight.do(request.url_rule.rule, key, compute)
+        if not shared:
+            return response
+        # Followers spent this time waiting for the leader
+        record_phase('coalesced', start)
+        body, status, headers = frozen
+        return current_app.response_class(body, status=status, headers=headers)
+    return wrapper
+
+def parse_request_body():
+    """Decode a JSON or MessagePack body; return (data, error_response)"""
+    try:
+        with span('parse'):
+            return read_body(), None
+    except UnsupportedBodyError as e:
+        return None, create_error_response(str(e), 415)
+    except ValueError as e:
+        return None, create_error_response(str(e), 400)
+
+def refuse_writes():
+    """before_request hook of READ_ONLY apps: answer any write with 503"""
+    if request.method not in READ_METHODS:
+        return create_error_response(
+            "This server is a read-only replica; writes are disabled", 503
+        )
+    return None
 
-def create_error_response(message, status_code):
+def create_error_response(message, status_code, errors=None):
     """Create standardized error response"""
-    return jsonify({
+    response = {
         "error": True,
         "message": message,
         "timestamp": datetime.now().isoformat()
-    }), status_code
+    }
+    if errors:
+        response["errors"] = errors
+    with span('serialize'):
+        return render(response, status_code)
+
+def create_validation_error_response(errors):
+    """Create a 400 response carrying structured per-field validation errors"""
+    return create_error_response(
+        f"Validation errors: {'; '.join(flatten_errors(errors))}",
+        400,
+        errors
+    )
 
 def create_success_response(data, message=None, status_code=200):
     """Create standardized success response"""
@@ -104,11 +401,25 @@ def create_success_response(data, message=None, status_code=200):
     }
     if message:
         response["message"] = message
-    return jsonify(response), status_code
+    with span('serialize'):
+        return render(response, status_code)
+
+def create_minimal_response(status_code=204, data=None, location=None):
+    """Answer a write sent with Prefer: return=minimal: no body, or only `data`"""
+    with span('serialize'):
+        if data is None:
+            response = current_app.response_class(status=status_code)
+            del response.headers['Content-Type']
+        else:
+            response, status_code = render(data, status_code)
+    response.headers['Preference-Applied'] = 'return=minimal'
+    if location:
+        response.headers['Location'] = location
+    return response, status_code
 
 # API Routes
 
-@app.route('/', methods=['GET'])
+@api.route('/', methods=['GET'])
 def api_home():
     """API home endpoint with welcome message and available endpoints"""
     endpoints = {
@@ -117,10 +428,17 @@ def api_home():
         "endpoints": {
             "GET /": "API information",
             "GET /users": "Get all users",
+            "HEAD /users": "Get the user count (X-Total-Count header)",
             "GET /users/<id>": "Get user by ID", 
             "POST /users": "Create new user",
             "PUT /users/<id>": "Update user by ID",
+            "PATCH /users/<id>": "Change only some fields (JSON Merge Patch)",
             "DELETE /users/<id>": "Delete user by ID",
+            "POST /batch": "Apply create/update/delete operations atomically",
+            "DELETE /snapshots/<token>": "Release a pinned snapshot",
+            "POST /imports": "Start a background import (file upload or {\"path\": ...})",
+            "GET /imports/<id>": "Import progress, throughput and errors",
+            "DELETE /imports/<id>": "Cancel an import",
             "GET /health": "API health check"
         },
         "sample_request": {
@@ -131,60 +449,146 @@ def api_home():
                 "department": "Engineering"
             }
         },
-        "total_users": len(users_db)
+        "total_users": get_state().store.snapshot().count
     }
     return create_success_response(endpoints)
 
-@app.route('/health', methods=['GET'])
+@api.route('/health', methods=['GET'])
 def health_check():
     """API health check endpoint"""
+    state = get_state()
+    store = state.store
+    # Totals come from one published snapshot, never from mid-write aggregates
+    snapshot = store.snapshot()
+    # Don't build an access logger just to report that logging is off
+    if 'access_log' in state.__dict__ or state.config['ACCESS_LOG']:
+        access_log = state.access_log.stats()
+    else:
+        access_log = {"enabled": False}
     health_data = {
         "status": "healthy",
         "api_version": "1.0.0",
-        "total_users": len(users_db),
-        "uptime": "running"
+        "total_users": snapshot.count,
+        "uptime": "running",
+        "stats": snapshot.stats,
+        "store": store.pin_stats(),
+        "storage": store.storage_stats(),
+        "single_flight": state.single_flight.stats(),
+        "access_log": access_log,
+        "trace_export": state.tracer.stats() if 'tracer' in state.__dict__ else None
     }
     return create_success_response(health_data)
 
-@app.route('/users', methods=['GET'])
+@api.route('/users', methods=['GET'])
+@coalesced
 def get_all_users():
     """GET endpoint to retrieve all users"""
     try:
+        # Every page is read from one immutable snapshot, optionally pinned
+        # with ?snapshot= so later pages see the same version
+        try:
+            snapshot, token = resolve_snapshot()
+        except LookupError:
+            return create_error_response("Snapshot expired or unknown; start again with ?snapshot=new", 410)
+
+        # HEAD /users only reports the count, without building a body
+        if request.method == 'HEAD':
+            return '', 200, {"X-Total-Count": str(snapshot.count)}
+
         # Support for pagination (optional enhancement)
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 10, type=int)
+        if page < 1 or per_page < 1:
+            return create_error_response("'page' and 'per_page' must be positive integers", 400)
+
+        # Sorted or cursor-paged listing is served from the sort indexes
+        sort_param = request.args.get('sort')
+        cursor = request.args.get('cursor')
+        if sort_param or cursor:
+            return get_sorted_users(snapshot, token, sort_param, cursor, page, per_page)
 
-        users_list = list(users_db.values())
+        total = snapshot.count
 
-        if not users_list:
+        if not total:
             return create_success_response(
-                {"users": [], "total": 0},
+                with_snapshot({"users": [], "total": 0}, snapshot, token),
                 "No users found"
             )
 
-        # Simple pagination
+        # Simple pagination, only walking as far as the requested page
         start_idx = (page - 1) * per_page
-        end_idx = start_idx + per_page
-        paginated_users = users_list[start_idx:end_idx]
+        with span('store'):
+            paginated_users = snapshot.users(start_idx, per_page)
 
         response_data = {
             "users": paginated_users,
-            "total": len(users_list),
+            "total": total,
             "page": page,
             "per_page": per_page,
-            "pages": (len(users_list) + per_page - 1) // per_page
+            "pages": (total + per_page - 1) // per_page
         }
 
-        return create_success_response(response_data)
+        return create_success_response(with_snapshot(response_data, snapshot, token))
 
     except Exception as e:
         return create_error_response(f"Internal server error: {str(e)}", 500)
 
-@app.route('/users/<int:user_id>', methods=['GET'])
+def with_snapshot(response_data, snapshot, token):
+    """Add the pinned snapshot token and version to a listing response"""
+    if token:
+        response_data["snapshot"] = token
+        response_data["version"] = snapshot.version
+    return response_data
+
+def get_sorted_users(snapshot, token, sort_param, cursor, page, per_page):
+    """Serve one page of users in index order (?sort=name|-age|created_at)"""
+    after = None
+    try:
+        if cursor:
+            field, descending, after = decode_cursor(cursor)
+            if sort_param and parse_sort(sort_param) != (field, descending):
+                return create_error_response("Cursor does not match the 'sort' parameter", 400)
+            sort_param = f"{'-' if descending else ''}{field}"
+        field, descending = parse_sort(sort_param)
+    except ValueError as e:
+        return create_error_response(str(e), 400)
+
+    index = snapshot.indexes[field]
+    total = len(index)
+    if not total:
+        return create_success_response(
+            with_snapshot({"users": [], "total": 0}, snapshot, token),
+            "No users found"
+        )
+
+    with span('store'):
+        user_ids = index.page(per_page, offset=(page - 1) * per_page, after=after, reverse=descending)
+        page_users = [snapshot.get(user_id) for user_id in user_ids]
+
+    next_cursor = None
+    if len(page_users) == per_page:
+        next_cursor = encode_cursor(field, descending, index.key_for(page_users[-1]))
+
+    response_data = {
+        "users": page_users,
+        "total": total,
+        "per_page": per_page,
+        "sort": sort_param,
+        "next_cursor": next_cursor
+    }
+    if not cursor:
+        response_data["page"] = page
+        response_data["pages"] = (total + per_page - 1) // per_page
+
+    return create_success_response(with_snapshot(response_data, snapshot, token))
+
+@api.route('/users/<int:user_id>', methods=['GET'])
+@coalesced
 def get_user(user_id):
     """GET endpoint to retrieve a specific user by ID"""
     try:
-        user = get_user_by_id(user_id)
+        with span('store'):
+            user = get_user_by_id(user_id)
 
         if not user:
             return create_error_response(f"User with ID {user_id} not found", 404)
@@ -194,44 +598,38 @@ def get_user(user_id):
     except Exception as e:
         return create_error_response(f"Internal server error: {str(e)}", 500)
 
-@app.route('/users', methods=['POST'])
+@api.route('/users', methods=['POST'])
 def create_user():
     """POST endpoint to create a new user"""
     try:
-        # Check if request contains JSON data
-        if not request.is_json:
-            return create_error_response("Request must contain JSON data", 400)
+        # Check if request contains JSON (or MessagePack) data
+        if not has_body():
+            return create_error_response("Request must contain JSON or MessagePack data", 400)
 
-        data = request.get_json()
+        data, error = parse_request_body()
+        if error:
+            return error
 
         if not data:
             return create_error_response("Request body is empty", 400)
 
         # Validate user data
-        validation_errors = validate_user_data(data)
+        with span('validate'):
+            validation_errors = user_validator.validate(data)
         if validation_errors:
-            return create_error_response(f"Validation errors: {'; '.join(validation_errors)}", 400)
-
-        # Check if email already exists
-        for existing_user in users_db.values():
-            if existing_user['email'] == data['email']:
-                return create_error_response("User with this email already exists", 400)
-
-        # Create new user
-        global user_counter
-        new_user = {
-            "id": user_counter,
-            "name": data['name'],
-            "email": data['email'],
-            "age": data['age'],
-            "department": data.get('department', ''),
-            "created_at": datetime.now().isoformat(),
-            "updated_at": datetime.now().isoformat()
-        }
+            return create_validation_error_response(validation_errors)
 
-        users_db[user_counter] = new_user
-        user_counter += 1
+        # Create new user (the store rejects duplicate emails atomically)
+        try:
+            with span('store'):
+                new_user = get_state().store.create(data)
+        except DuplicateEmailError:
+            return create_error_response("User with this email already exists", 400)
 
+        if wants_minimal():
+            return create_minimal_response(
+                201, {"id": new_user['id']}, url_for('user_api.get_user', user_id=new_user['id'])
+            )
         return create_success_response(
             new_user, 
             f"User created successfully with ID {new_user['id']}", 
@@ -241,63 +639,117 @@ def create_user():
     except Exception as e:
         return create_error_response(f"Internal server error: {str(e)}", 500)
 
-@app.route('/users/<int:user_id>', methods=['PUT'])
+@api.route('/users/<int:user_id>', methods=['PUT'])
 def update_user(user_id):
     """PUT endpoint to update an existing user"""
     try:
         # Check if user exists
-        user = get_user_by_id(user_id)
+        with span('store'):
+            user = get_user_by_id(user_id)
         if not user:
             return create_error_response(f"User with ID {user_id} not found", 404)
 
-        # Check if request contains JSON data
-        if not request.is_json:
-            return create_error_response("Request must contain JSON data", 400)
+        # Check if request contains JSON (or MessagePack) data
+        if not has_body():
+            return create_error_response("Request must contain JSON or MessagePack data", 400)
 
-        data = request.get_json()
+        data, error = parse_request_body()
+        if error:
+            return error
 
         if not data:
             return create_error_response("Request body is empty", 400)
 
         # Validate user data (for updates, fields are optional)
-        validation_errors = validate_user_data(data, is_update=True)
+        with span('validate'):
+            validation_errors = user_validator.validate(data, partial=True)
         if validation_errors:
-            return create_error_response(f"Validation errors: {'; '.join(validation_errors)}", 400)
+            return create_validation_error_response(validation_errors)
 
-        # Check if email already exists (if email is being updated)
-        if 'email' in data and data['email'] != user['email']:
-            for existing_user in users_db.values():
-                if existing_user['email'] == data['email']:
-                    return create_error_response("User with this email already exists", 400)
+        # Update user fields; the store re-indexes only the ones that changed
+        # and rejects an email that already belongs to someone else
+        try:
+            with span('store'):
+                user = get_state().store.update(user_id, data)
+        except DuplicateEmailError:
+            return create_error_response("User with this email already exists", 400)
+        except UserNotFoundError:
+            return create_error_response(f"User with ID {user_id} not found", 404)
 
-        # Update user fields
-        updatable_fields = ['name', 'email', 'age', 'department']
-        for field in updatable_fields:
-            if field in data:
-                user[field] = data[field]
+        if wants_minimal():
+            return create_minimal_response()
+        return create_success_response(
+            user,
+            f"User with ID {user_id} updated successfully"
+        )
+
+    except Exception as e:
+        return create_error_response(f"Internal server error: {str(e)}", 500)
 
-        user['updated_at'] = datetime.now().isoformat()
+@api.route('/users/<int:user_id>', methods=['PATCH'])
+def patch_user(user_id):
+    """PATCH endpoint applying a JSON Merge Patch (RFC 7396) to a user"""
+    try:
+        # Check if user exists
+        with span('store'):
+            user = get_user_by_id(user_id)
+        if not user:
+            return create_error_response(f"User with ID {user_id} not found", 404)
 
+        # application/merge-patch+json counts as JSON, as does MessagePack
+        if not has_body():
+            return create_error_response("Request must contain JSON or MessagePack data", 400)
+
+        data, error = parse_request_body()
+        if error:
+            return error
+
+        # null removes an optional field; other values are checked as in PUT
+        with span('validate'):
+            validation_errors = user_validator.validate_patch(data)
+        if validation_errors:
+            return create_validation_error_response(validation_errors)
+
+        # Only the fields whose value changes are written and re-indexed
+        try:
+            with span('store'):
+                user, changed = get_state().store.patch(user_id, data)
+        except DuplicateEmailError:
+            return create_error_response("User with this email already exists", 400)
+        except UserNotFoundError:
+            return create_error_response(f"User with ID {user_id} not found", 404)
+
+        if wants_minimal():
+            return create_minimal_response()
+        if not changed:
+            return create_success_response(user, f"User with ID {user_id} unchanged")
         return create_success_response(
             user,
-            f"User with ID {user_id} updated successfully"
+            f"User with ID {user_id} updated successfully ({', '.join(changed)})"
         )
 
     except Exception as e:
         return create_error_response(f"Internal server error: {str(e)}", 500)
 
-@app.route('/users/<int:user_id>', methods=['DELETE'])
+@api.route('/users/<int:user_id>', methods=['DELETE'])
 def delete_user(user_id):
     """DELETE endpoint to remove a user"""
     try:
         # Check if user exists
-        user = get_user_by_id(user_id)
+        with span('store'):
+            user = get_user_by_id(user_id)
         if not user:
             return create_error_response(f"User with ID {user_id} not found", 404)
 
         # Delete user
-        deleted_user = users_db.pop(user_id)
+        try:
+            with span('store'):
+                deleted_user = get_state().store.delete(user_id)
+        except UserNotFoundError:
+            return create_error_response(f"User with ID {user_id} not found", 404)
 
+        if wants_minimal():
+            return create_minimal_response()
         return create_success_response(
             {"deleted_user": deleted_user},
             f"User with ID {user_id} deleted successfully"
@@ -306,42 +758,261 @@ def delete_user(user_id):
     except Exception as e:
         return create_error_response(f"Internal server error: {str(e)}", 500)
 
+@api.route('/batch', methods=['POST'])
+def run_batch():
+    """POST endpoint to apply an ordered list of operations all-or-nothing"""
+    try:
+        if not has_body():
+            return create_error_response("Request must contain JSON or MessagePack data", 400)
+
+        data, error = parse_request_body()
+        if error:
+            return error
+        operations = data.get('operations') if isinstance(data, dict) else None
+
+        if not isinstance(operations, list) or not operations:
+            return create_error_response("'operations' must be a non-empty list", 400)
+        if len(operations) > MAX_BATCH_OPERATIONS:
+            return create_error_response(
+                f"A batch may contain at most {MAX_BATCH_OPERATIONS} operations", 400
+            )
+
+        # Reject the whole batch up front if any operation is malformed
+        with span('validate'):
+            parsed, errors = parse_batch_operations(operations)
+        if errors:
+            return create_error_response(
+                f"Batch rejected: {len(errors)} invalid operation(s)", 400, errors
+            )
+
+        try:
+            with span('store'):
+                results, version = get_state().store.batch(parsed)
+        except BatchError as e:
+            op, user_id, _ = parsed[e.position]
+            if isinstance(e.cause, UserNotFoundError):
+                reason, status_code = f"User with ID {user_id} not found", 404
+            elif isinstance(e.cause, DuplicateEmailError):
+                reason, status_code = "User with this email already exists", 400
+            else:
+                reason, status_code = str(e.cause), 400
+            return create_error_response(
+                f"Batch rolled back: operation {e.position} ({op}) failed: {reason}",
+                status_code,
+                [{"operation": e.position, "errors": {"_operation": [reason]}}]
+            )
+
+        statuses = {'create': 201, 'update': 200, 'delete': 200}
+        response_data = {
+            "results": [
+                {
+                    "op": op,
+                    "status": statuses[op],
+                    "data": {"deleted_user": user} if op == 'delete' else user
+                }
+                for (op, _, _), user in zip(parsed, results)
+            ],
+            "version": version
+        }
+        return create_success_response(
+            response_data,
+            f"Batch of {len(results)} operation(s) applied"
+        )
+
+    except Exception as e:
+        return create_error_response(f"Internal server error: {str(e)}", 500)
+
+def resolve_import_path(name):
+    """Map a POST /imports path to a seed file inside IMPORT_DIR, or None if not allowed"""
+    root = os.path.realpath(current_app.config['IMPORT_DIR'])
+    path = os.path.realpath(os.path.join(root, name))
+    if not path.startswith(root + os.sep) or not path.endswith(IMPORT_EXTENSIONS):
+        return None
+    return path
+
+@api.route('/imports', methods=['POST'])
+def start_import():
+    """POST endpoint to import users in the background from an upload or a local file"""
+    try:
+        upload = request.files.get('file')
+        if upload is not None and upload.filename:
+            if not upload.filename.lower().endswith(IMPORT_EXTENSIONS):
+                return create_error_response(
+                    f"Upload must be one of: {', '.join(IMPORT_EXTENSIONS)}", 400
+                )
+            # Spool the upload to disk so the job can stream it after we return
+            extension = os.path.splitext(upload.filename.lower())[1]
+            handle, path = tempfile.mkstemp(prefix='users-import-', suffix=extension)
+            os.close(handle)
+            upload.save(path)
+            source, cleanup = upload.filename, True
+        else:
+            data = None
+            if has_body():
+                data, error = parse_request_body()
+                if error:
+                    return error
+            name = data.get('path') if isinstance(data, dict) else None
+            if not isinstance(name, str) or not name:
+                return create_error_response("Send a 'file' upload or a JSON body with a 'path'", 400)
+            path = resolve_import_path(name)
+            if path is None:
+                import_dir = current_app.config['IMPORT_DIR']
+                return create_error_response(
+                    f"'path' must name a {'/'.join(IMPORT_EXTENSIONS)} file inside '{import_dir}'", 400
+                )
+            if not os.path.isfile(path):
+                return create_error_response(f"Import file '{name}' not found", 404)
+            source, cleanup = name, False
+
+        from imports import ImportQueueFullError
+        try:
+            job = get_state().importer.submit(path, source, cleanup)
+        except ImportQueueFullError as e:
+            if cleanup:
+                os.remove(path)
+            return create_error_response(str(e), 429)
+
+        return create_success_response(job.to_dict(), f"Import {job.id} queued", 202)
+
+    except Exception as e:
+        return create_error_response(f"Internal server error: {str(e)}", 500)
+
+@api.route('/imports', methods=['GET'])
+def list_imports():
+    """GET endpoint listing recent imports"""
+    return create_success_response({"imports": [job.to_dict() for job in get_state().importer.jobs()]})
+
+@api.route('/imports/<job_id>', methods=['GET'])
+def get_import(job_id):
+    """GET endpoint reporting an import's progress, throughput and errors"""
+    job = get_state().importer.get(job_id)
+    if job is None:
+        return create_error_response(f"Import {job_id} not found", 404)
+    return create_success_response(job.to_dict())
+
+@api.route('/imports/<job_id>', methods=['DELETE'])
+def cancel_import(job_id):
+    """DELETE endpoint to cancel an import after its current chunk"""
+    job = get_state().importer.cancel(job_id)
+    if job is None:
+        return create_error_response(f"Import {job_id} not found", 404)
+    return create_success_response(job.to_dict(), f"Import {job_id} cancellation requested")
+
+@api.route('/snapshots/<token>', methods=['DELETE'])
+def release_snapshot(token):
+    """DELETE endpoint to release a pinned snapshot before it expires"""
+    if not get_state().store.release(token):
+        return create_error_response("Snapshot expired or unknown", 404)
+    return create_success_response({"snapshot": token}, "Snapshot released")
+
 # Error handlers
-@app.errorhandler(404)
+@api.app_errorhandler(404)
 def not_found(error):
     """Handle 404 errors"""
     return create_error_response("Endpoint not found", 404)
 
-@app.errorhandler(405)
+@api.app_errorhandler(405)
 def method_not_allowed(error):
     """Handle 405 errors"""
     return create_error_response("Method not allowed for this endpoint", 405)
 
-@app.errorhandler(500)
+@api.app_errorhandler(500)
 def internal_error(error):
     """Handle 500 errors"""
     return create_error_response("Internal server error", 500)
 
+# Debug endpoints (guarded by USER_DEBUG_TOKEN)
+def check_debug_access():
+    """Return an error response if the caller may not use /debug, else None"""
+    token = current_app.config['DEBUG_TOKEN']
+    if not token:
+        return create_error_response("Endpoint not found", 404)
+    supplied = request.headers.get('X-Debug-Token', '').encode()
+    if not hmac.compare_digest(supplied, token.encode()):
+        return create_error_response("Missing or invalid X-Debug-Token", 403)
+    return None
+
+@api.route('/debug/profile', methods=['GET'])
+def debug_profile():
+    """Sample live traffic for ?seconds=N and return collapsed stacks"""
+    denied = check_debug_access()
+    if denied:
+        return denied
+
+    from profiling import MAX_PROFILE_SECONDS, sample_profile
+    seconds = request.args.get('seconds', 5, type=float)
+    interval_ms = request.args.get('interval_ms', 5, type=float)
+    if not 0 < seconds <= MAX_PROFILE_SECONDS:
+        return create_error_response(f"'seconds' must be between 0 and {MAX_PROFILE_SECONDS}", 400)
+    if not 1 <= interval_ms <= 1000:
+        return create_error_response("'interval_ms' must be between 1 and 1000", 400)
+
+    debug_lock = get_state().debug_lock
+    if not debug_lock.acquire(blocking=False):
+        return create_error_response("Another debug session is running", 409)
+    try:
+        stacks = sample_profile(seconds, interval_ms / 1000)
+    finally:
+        debug_lock.release()
+    return stacks, 200, {"Content-Type": "text/plain; charset=utf-8"}
+
+@api.route('/debug/memory', methods=['GET'])
+def debug_memory():
+    """Report top allocation sites (?trace_seconds=N) and per-structure sizes"""
+    denied = check_debug_access()
+    if denied:
+        return denied
+
+    from profiling import MAX_TRACE_SECONDS, memory_report
+    state = get_state()
+    top = request.args.get('top', 20, type=int)
+    trace_seconds = request.args.get('trace_seconds', 0, type=float)
+    if not 0 <= trace_seconds <= MAX_TRACE_SECONDS:
+        return create_error_response(f"'trace_seconds' must be between 0 and {MAX_TRACE_SECONDS}", 400)
+
+    if not state.debug_lock.acquire(blocking=False):
+        return create_error_response("Another debug session is running", 409)
+    try:
+        # Only caches that are already built; the report doesn't create any
+        built = state.built()
+        extra = {}
+        if 'single_flight' in built:
+            extra['single_flight_calls'] = state.single_flight.in_flight()
+        if 'importer' in built:
+            extra['import_jobs'] = state.importer.jobs()
+        report = memory_report(state.store, max(top, 1), trace_seconds, extra)
+    finally:
+        state.debug_lock.release()
+    return create_success_response(report)
+
 # Development utilities
-@app.route('/reset', methods=['POST'])
+@api.route('/reset', methods=['POST'])
 def reset_data():
-    """Reset all data to initial state (development only)"""
-    global users_db, user_counter
-    users_db = {}
-    user_counter = 1
-    initialize_sample_data()
+    """Reset all data to a named dataset, 'sample' by default (development only)"""
+    data = request.get_json(silent=True) or {}
+    dataset = request.args.get('dataset') or (data.get('dataset') if isinstance(data, dict) else None) or 'sample'
+
+    from datasets import UnknownDatasetError
+    try:
+        load_dataset(dataset, MAX_RESET_SYNTHETIC_USERS)
+    except UnknownDatasetError:
+        return create_error_response(f"Unknown dataset '{dataset}'", 404)
+    except ValueError as e:
+        return create_error_response(f"Dataset '{dataset}' could not be loaded: {e}", 400)
 
     return create_success_response(
-        {"total_users": len(users_db)},
+        {"total_users": get_state().store.snapshot().count, "dataset": dataset},
         "Database reset successfully"
     )
 
 if __name__ == '__main__':
-    # Initialize sample data
-    initialize_sample_data()
+    # Load the startup dataset (sample data unless USER_DATASET says otherwise)
+    dataset = os.environ.get('USER_DATASET', 'sample')
+    app = create_app({'DATASET': dataset})
 
     print("🚀 Starting User Management REST API...")
-    print("📋 Sample users loaded for testing")
+    print(f"📋 Dataset '{dataset}' loaded ({get_state(app).store.stats.total:,} users)")
     print("🌐 API will be available at: http://localhost:5000")
     print("📖 API documentation at: http://localhost:5000/")
     print("\n🔧 Available endpoints:")
@@ -351,6 +1022,7 @@ if __name__ == '__main__':
     print("   PUT    /users/<id>   - Update user")
     print("   DELETE /users/<id>   - Delete user")
     print("\n⏹️  Press Ctrl+C to stop the server")
+    print("🏭 For production, use: python serve.py (add --read-only --workers 4 for read replicas)")
 
-    # Run the Flask application
+    # Run the Flask application (development server)
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Response format benchmark for User Management REST API
+Compares JSON (as Flask encodes it) with MessagePack: payload size and
+encode/decode time for a single user, a default page and a large page,
+all wrapped in the standard response envelope.
+
+Usage: python bench_formats.py [iterations]
+"""
+
+import gc
+import json
+import sys
+import time
+from datetime import datetime
+
+from datasets import generate_users
+
+try:
+    import msgpack
+except ImportError:  # optional dependency
+    msgpack = None
+
+
+def envelope(data):
+    """The standard success envelope from create_success_response()"""
+    return {"error": False, "data": data, "timestamp": datetime.now().isoformat()}
+
+
+def build_payloads():
+    users = list(generate_users(1000))
+    return {
+        "single user": envelope(users[0]),
+        "page of 10": envelope({"users": users[:10], "total": 1000, "page": 1, "per_page": 10}),
+        "page of 1000": envelope({"users": users, "total": 1000, "page": 1, "per_page": 1000}),
+    }
+
+
+def measure(func, iterations, repeats=5):
+    """Best time per call of several runs with the GC paused, like timeit"""
+    elapsed = float('inf')
+    gc.disable()
+    try:
+        for _ in range(repeats):
+            start = time.perf_counter()
+            for _ in range(iterations):
+                func()
+            elapsed = min(elapsed, time.perf_counter() - start)
+    finally:
+        gc.enable()
+    return elapsed / iterations
+
+
+def run_benchmark(iterations=2000):
+    """Print size, encode and decode cost of each payload in each format"""
+    # Flask's default JSON provider settings (ensure_ascii, compact separators)
+    json_encode = lambda payload: json.dumps(payload, separators=(',', ':')).encode()
+    formats = [("json", json_encode, json.loads)]
+    if msgpack is not None:
+        formats.append(("msgpack",
+                        lambda payload: msgpack.packb(payload, use_bin_type=True),
+                        lambda body: msgpack.unpackb(body, raw=False)))
+    else:
+        print("⚠️  msgpack is not installed (pip install msgpack); showing JSON only\n")
+
+    print(f"{'payload':14} {'format':8} {'bytes':>9} {'encode µs':>11} {'decode µs':>11}")
+    for name, payload in build_payloads().items():
+        runs = max(iterations // max(len(json_encode(payload)) // 1000, 1), 20)
+        results = {}
+        for label, encode, decode in formats:
+            body = encode(payload)
+            assert decode(body)["data"] == payload["data"]
+            results[label] = (len(body), measure(lambda: encode(payload), runs),
+                              measure(lambda: decode(body), runs))
+            size, enc, dec = results[label]
+            print(f"{name:14} {label:8} {size:9,} {enc * 1e6:11.1f} {dec * 1e6:11.1f}")
+        if "msgpack" in results:
+            (js, je, jd), (ms, me, md) = results["json"], results["msgpack"]
+            print(f"{'':14} {'ratio':8} {ms / js:9.2f} {me / je:11.2f} {md / jd:11.2f}")
+
+
+if __name__ == "__main__":
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 2000)
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+"""
+Cold-start benchmark for User Management REST API
+
+Starts fresh interpreters and times what a new worker pays before it can
+answer: importing Flask, importing app.py (everything beyond Flask),
+create_app() and the first request. The same interpreters also time a
+bare Flask app with one route (create + first request), and the budget
+is relative to it: exits with status 1 when the median cost of our own
+part (app import + create_app + first request) is more than
+--budget-ratio times the bare app's, so slow startup shows up as features
+are added without depending on how fast the machine is.
+
+Sources are byte-compiled first, as on a deployed server; otherwise
+every probe would also pay for compiling them (PYTHONDONTWRITEBYTECODE).
+
+It also lists which of the optional subsystems' modules (SQLite for
+tiered storage, tracemalloc for /debug, the import thread pool, ...) got
+loaded; none of them should be until something uses them.
+
+Usage: python bench_startup.py [--runs N] [--budget-ratio R]
+"""
+
+import argparse
+import compileall
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+# Median app import + create_app() + first request allowed, as a multiple
+# of a bare Flask app's create + first request
+STARTUP_BUDGET_RATIO = 3.0
+
+# Modules that only the features which need them should import
+DEFERRED_MODULES = ('sqlite3', 'tracemalloc', 'concurrent.futures',
+                    'tiered', 'profiling', 'imports', 'datasets')
+
+PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import flask
+t1 = time.perf_counter()
+import app
+t2 = time.perf_counter()
+application = app.create_app(json.loads(sys.argv[1]))
+t3 = time.perf_counter()
+status = application.test_client().get(sys.argv[2]).status_code
+t4 = time.perf_counter()
+print(json.dumps({
+    "flask_import": t1 - t0, "app_import": t2 - t1, "create_app": t3 - t2,
+    "first_request": t4 - t3, "status": status,
+    "deferred_loaded": [m for m in json.loads(sys.argv[3]) if m in sys.modules],
+    "built": app.get_state(application).built()
+}))
+"""
+
+BARE_PROBE = """
+import json, sys, time
+import flask
+t0 = time.perf_counter()
+bare = flask.Flask('bare')
+bare.add_url_rule('/users/<int:user_id>', 'user', lambda user_id: ({}, 404))
+status = bare.test_client().get(sys.argv[1]).status_code
+print(json.dumps({"bare_app": time.perf_counter() - t0, "status": status}))
+"""
+
+PHASES = ("flask_import", "app_import", "create_app", "first_request")
+
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def compile_sources():
+    """Byte-compile our modules so probes load them the way a deployed server does"""
+    compileall.compile_dir(HERE, maxlevels=0, quiet=2)
+
+
+def _run_probe(script, *args):
+    start = time.perf_counter()
+    output = subprocess.run(
+        [sys.executable, '-c', script, *args], cwd=HERE, capture_output=True, text=True, check=True
+    ).stdout
+    result = json.loads(output.splitlines()[-1])
+    result["process"] = time.perf_counter() - start
+    return result
+
+
+def probe(config=None, path='/users/1'):
+    """Time one cold start in a fresh interpreter; returns the probe's measurements"""
+    return _run_probe(PROBE, json.dumps(config or {}), path, json.dumps(DEFERRED_MODULES))
+
+
+def probe_bare(path='/users/1'):
+    """Time a bare Flask app's create + first request in a fresh interpreter"""
+    return _run_probe(BARE_PROBE, path)
+
+
+def own_cost(result):
+    """Seconds a probe spent beyond importing Flask"""
+    return result["app_import"] + result["create_app"] + result["first_request"]
+
+
+def startup_ratio(runs=5):
+    """Median cost beyond Flask over the median bare Flask app, plus the probe results"""
+    compile_sources()
+    results, bare = [], []
+    for _ in range(runs):
+        # Interleaved so load on the machine affects both sides alike
+        results.append(probe())
+        bare.append(probe_bare())
+    ratio = (statistics.median(own_cost(result) for result in results)
+             / statistics.median(result["bare_app"] for result in bare))
+    return ratio, results, bare
+
+
+def run_benchmark(runs=10, budget_ratio=STARTUP_BUDGET_RATIO):
+    """Print per-phase cold-start times; return True if within the budget"""
+    ratio, results, bare = startup_ratio(runs)
+    print(f"🧊 Cold start over {runs} fresh interpreters (ms)")
+    print(f"   {'phase':15} {'median':>8} {'best':>8} {'worst':>8}")
+    for phase in PHASES + ("process",):
+        values = [result[phase] * 1000 for result in results]
+        print(f"   {phase:15} {statistics.median(values):8.1f} {min(values):8.1f} {max(values):8.1f}")
+
+    values = [result["bare_app"] * 1000 for result in bare]
+    print(f"   {'bare flask app':15} {statistics.median(values):8.1f} {min(values):8.1f} {max(values):8.1f}")
+
+    ours = statistics.median(own_cost(result) * 1000 for result in results)
+    last = results[-1]
+    print(f"   built on first request: {', '.join(last['built']) or 'nothing'}")
+    print(f"   deferred modules loaded: {', '.join(last['deferred_loaded']) or 'none'}")
+    within = ratio <= budget_ratio
+    print(f"{'✅' if within else '❌'} app import + create_app + first request: "
+          f"{ours:.1f} ms, {ratio:.1f}x a bare Flask app (budget {budget_ratio}x)")
+    return within
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure cold-start time against a budget")
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--budget-ratio', type=float, default=STARTUP_BUDGET_RATIO)
+    args = parser.parse_args(argv)
+    return 0 if run_benchmark(args.runs, args.budget_ratio) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
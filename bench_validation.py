@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Validation benchmark for User Management REST API
+Compares the original validate_user_data() with the schema validator,
+one record at a time and in batch mode. The original only checks that an
+email contains '@' and '.', so it is also run with the validator's email
+regex swapped in: that is the like-for-like baseline.
+
+Usage: python bench_validation.py [number_of_records]
+"""
+
+import gc
+import re
+import sys
+import time
+
+from validation import EMAIL_PATTERN, user_validator
+
+
+def legacy_validate_user_data(data, is_update=False, email_match=None):
+    """The original validate_user_data(), kept here as the baseline.
+
+    With `email_match` the email is checked with it instead of looking for
+    '@' and '.'.
+    """
+    required_fields = ['name', 'email']
+    if not is_update:
+        required_fields.extend(['age'])
+
+    errors = []
+
+    for field in required_fields:
+        if field not in data or not data[field]:
+            errors.append(f"'{field}' is required")
+
+    if 'email' in data and data['email']:
+        if email_match is not None:
+            if email_match(data['email']) is None:
+                errors.append("Invalid email format")
+        elif '@' not in data['email'] or '.' not in data['email']:
+            errors.append("Invalid email format")
+
+    if 'age' in data and data['age'] is not None:
+        if not isinstance(data['age'], int) or data['age'] < 0:
+            errors.append("Age must be a positive integer")
+
+    return errors
+
+
+def build_records(count):
+    """Mostly valid users with every tenth record broken"""
+    records = []
+    for i in range(count):
+        record = {
+            "name": f"User {i}",
+            "email": f"user{i}@example.com",
+            "age": 20 + i % 45,
+            "department": "Engineering"
+        }
+        if i % 10 == 0:
+            record["email"] = "not-an-email"
+        records.append(record)
+    return records
+
+
+def measure(variants, count, repeats=10):
+    """Best wall time of each variant, with the GC paused like timeit.
+
+    The variants take turns on every repeat so that a noisy neighbour
+    slows them all alike instead of skewing one of them.
+    """
+    best = dict.fromkeys(variants, float('inf'))
+    gc.disable()
+    try:
+        for _ in range(repeats):
+            for label, func in variants.items():
+                start = time.perf_counter()
+                func()
+                best[label] = min(best[label], time.perf_counter() - start)
+    finally:
+        gc.enable()
+    for label, elapsed in best.items():
+        print(f"   {label:32} {elapsed * 1000:9.1f} ms  {count / elapsed:12,.0f} records/s")
+    return best
+
+
+def run_benchmark(count=200000):
+    """Run every variant over the same records and print throughput"""
+    records = build_records(count)
+    validate = user_validator.validate
+    email_match = re.compile(EMAIL_PATTERN).match
+
+    print(f"📊 Validating {count:,} records")
+    best = measure({
+        "legacy validate_user_data": lambda: [legacy_validate_user_data(r) for r in records],
+        "legacy with the email regex": lambda: [legacy_validate_user_data(r, email_match=email_match)
+                                                for r in records],
+        "schema validate": lambda: [validate(r) for r in records],
+        "schema validate_many": lambda: user_validator.validate_many(records),
+    }, count)
+
+    for baseline in ("legacy validate_user_data", "legacy with the email regex"):
+        print(f"\n   vs {baseline}: validate {best[baseline] / best['schema validate']:.2f}x, "
+              f"validate_many {best[baseline] / best['schema validate_many']:.2f}x", end="")
+    print()
+
+
+if __name__ == "__main__":
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 200000)
@@ -0,0 +1,392 @@
+#!/usr/bin/env python3
+"""
+Datasets for the User Management REST API
+
+- generate_users(): deterministic synthetic users with configurable
+  department and age distributions, for reproducing production-scale
+  behavior locally
+- write_ndjson() / write_csv(): save generated users as seed files
+- read_users(): fast seed loader for NDJSON/CSV files. NDJSON is read in
+  large buffered blocks and each block is decoded with a single
+  json.loads() call instead of one call per line.
+- iter_user_chunks(): the same formats streamed in fixed-size chunks, for
+  background imports of files too large to hold at once
+
+Named datasets (used at startup via USER_DATASET and by POST /reset):
+    sample           the three built-in demo users
+    empty            no users
+    synthetic-<N>    N generated users (seed 0), e.g. synthetic-100000;
+                     N is capped at MAX_SYNTHETIC_USERS (lower via /reset)
+    <name>           <name>.ndjson or <name>.csv in USER_DATASET_DIR
+
+Usage:
+    python datasets.py generate --count 1000000 --output datasets/large.ndjson
+    python datasets.py load datasets/large.ndjson
+"""
+
+import argparse
+import csv
+import json
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+# Directory searched for <name>.ndjson / <name>.csv seed files
+DATASET_DIR = os.environ.get('USER_DATASET_DIR', 'datasets')
+
+# Block size for buffered NDJSON reads
+READ_BLOCK_SIZE = 16 * 1024 * 1024
+
+# Largest synthetic-<N> dataset that can be named
+MAX_SYNTHETIC_USERS = 1000000
+
+CSV_FIELDS = ['id', 'name', 'email', 'age', 'department', 'created_at', 'updated_at']
+
+DEFAULT_DEPARTMENTS = {
+    "Engineering": 30,
+    "Sales": 20,
+    "Marketing": 15,
+    "Support": 15,
+    "Finance": 8,
+    "HR": 7,
+    "Legal": 5
+}
+
+FIRST_NAMES = [
+    "James", "Mary", "John", "Patricia", "Robert", "Jennifer", "Michael", "Linda",
+    "William", "Elizabeth", "David", "Barbara", "Richard", "Susan", "Joseph", "Jessica",
+    "Thomas", "Sarah", "Charles", "Karen", "Daniel", "Nancy", "Matthew", "Lisa",
+    "Anthony", "Betty", "Mark", "Sandra", "Steven", "Ashley", "Paul", "Emily",
+    "Andrew", "Donna", "Joshua", "Michelle", "Kevin", "Carol", "Brian", "Amanda",
+    "Priya", "Wei", "Aisha", "Carlos", "Yuki", "Omar", "Fatima", "Ivan", "Chen", "Sofia"
+]
+
+LAST_NAMES = [
+    "Smith", "Johnson", "Williams", "Brown", "Jones", "Garcia", "Miller", "Davis",
+    "Rodriguez", "Martinez", "Hernandez", "Lopez", "Gonzalez", "Wilson", "Anderson",
+    "Thomas", "Taylor", "Moore", "Jackson", "Martin", "Lee", "Perez", "Thompson",
+    "White", "Harris", "Sanchez", "Clark", "Ramirez", "Lewis", "Robinson", "Walker",
+    "Young", "Allen", "King", "Wright", "Scott", "Torres", "Nguyen", "Hill", "Flores",
+    "Patel", "Kim", "Singh", "Khan", "Ivanova", "Tanaka", "Mueller", "Rossi", "Silva", "Cohen"
+]
+
+EMAIL_DOMAINS = ["example.com", "example.org", "mail.example.net", "corp.example.com"]
+
+SAMPLE_USERS = [
+    {
+        "name": "John Doe",
+        "email": "john.doe@example.com",
+        "age": 28,
+        "department": "Engineering"
+    },
+    {
+        "name": "Jane Smith",
+        "email": "jane.smith@example.com",
+        "age": 25,
+        "department": "Marketing"
+    },
+    {
+        "name": "Mike Johnson",
+        "email": "mike.johnson@example.com",
+        "age": 32,
+        "department": "Sales"
+    }
+]
+
+
+class UnknownDatasetError(KeyError):
+    """No dataset with this name"""
+
+
+def generate_users(count, seed=0, departments=None, age_mean=38, age_sd=10,
+                   age_min=18, age_max=70, start=datetime(2020, 1, 1)):
+    """Yield `count` deterministic synthetic users with ids 1..count.
+
+    departments maps department name to a relative weight; ages follow a
+    normal distribution clipped to [age_min, age_max]. created_at
+    increases with id, like records created over time. The same
+    arguments always produce the same users.
+    """
+    rng = random.Random(seed)
+    departments = departments or DEFAULT_DEPARTMENTS
+    dept_names = list(departments)
+    dept_weights = list(departments.values())
+    gauss = rng.gauss
+    choice = rng.choice
+
+    created = start
+    chunk = 10000
+    for base in range(1, count + 1, chunk):
+        size = min(chunk, count + 1 - base)
+        for user_id, department in zip(range(base, base + size),
+                                       rng.choices(dept_names, dept_weights, k=size)):
+            first = choice(FIRST_NAMES)
+            last = choice(LAST_NAMES)
+            age = int(round(gauss(age_mean, age_sd)))
+            created += timedelta(seconds=rng.randint(1, 600))
+            timestamp = created.isoformat()
+            yield {
+                "id": user_id,
+                "name": f"{first} {last}",
+                "email": f"{first.lower()}.{last.lower()}{user_id}@{choice(EMAIL_DOMAINS)}",
+                "age": min(max(age, age_min), age_max),
+                "department": department,
+                "created_at": timestamp,
+                "updated_at": timestamp
+            }
+
+
+def sample_users():
+    """The built-in demo users, with ids and fresh timestamps"""
+    users = []
+    for user_id, user_data in enumerate(SAMPLE_USERS, 1):
+        now = datetime.now().isoformat()
+        users.append(dict(user_data, id=user_id, created_at=now, updated_at=now))
+    return users
+
+
+def write_ndjson(path, users):
+    """Write users as newline-delimited JSON and return how many were written"""
+    count = 0
+    dumps = json.JSONEncoder(separators=(',', ':')).encode
+    with open(path, 'w', encoding='utf-8', buffering=READ_BLOCK_SIZE) as f:
+        for user in users:
+            f.write(dumps(user))
+            f.write('\n')
+            count += 1
+    return count
+
+
+def write_csv(path, users):
+    """Write users as CSV with a header row and return how many were written"""
+    count = 0
+    with open(path, 'w', encoding='utf-8', newline='', buffering=READ_BLOCK_SIZE) as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS, extrasaction='ignore')
+        writer.writeheader()
+        for user in users:
+            writer.writerow(user)
+            count += 1
+    return count
+
+
+def _loads_block(lines):
+    """Decode NDJSON lines as one JSON array; None unless that gives one value per line.
+
+    Joining with ',' would otherwise accept a line like '{...},{...}' as
+    two records, so the caller falls back to one json.loads() per line.
+    """
+    try:
+        records = json.loads(b'[' + b','.join(lines) + b']')
+    except ValueError:
+        return None
+    return records if len(records) == len(lines) else None
+
+
+def read_ndjson(path, block_size=READ_BLOCK_SIZE):
+    """Read an NDJSON file into a list of dicts.
+
+    Each block ends at a newline and is turned into one JSON array, so the
+    whole block is parsed by a single C-level json.loads() call. Raises
+    ValueError for a line that isn't exactly one JSON value.
+    """
+    users = []
+    loads = json.loads
+    with open(path, 'rb', buffering=0) as f:
+        tail = b''
+        while True:
+            block = f.read(block_size)
+            if not block:
+                break
+            block = tail + block
+            cut = block.rfind(b'\n') + 1
+            tail = block[cut:]
+            lines = [line for line in block[:cut].split(b'\n') if line.strip()]
+            if lines:
+                records = _loads_block(lines)
+                # One call per line raises for the line that is malformed
+                users.extend([loads(line) for line in lines] if records is None else records)
+        if tail.strip():
+            users.append(loads(tail))
+    return users
+
+
+def read_csv(path):
+    """Read a CSV seed file into a list of dicts, converting id and age to int.
+
+    An empty or missing id is left out, so the store numbers the user.
+    Raises ValueError for an id or age that isn't an integer.
+    """
+    users = []
+    with open(path, 'r', encoding='utf-8', newline='', buffering=READ_BLOCK_SIZE) as f:
+        reader = csv.reader(f)
+        header = next(reader, None)
+        if header is None:
+            return users
+        for line, row in enumerate(reader, 2):
+            if not row:
+                continue
+            user = dict(zip(header, row))
+            try:
+                if user.get('id') in (None, ''):
+                    user.pop('id', None)
+                else:
+                    user['id'] = int(user['id'])
+                age = user.get('age')
+                user['age'] = int(age) if age not in (None, '') else None
+            except ValueError:
+                raise ValueError(f"CSV line {line}: 'id' and 'age' must be integers") from None
+            users.append(user)
+    return users
+
+
+def _csv_import_user(header, row):
+    """Build a user from a CSV row, leaving unparseable numbers for validation to reject"""
+    user = dict(zip(header, row))
+    for field in ('id', 'age'):
+        value = user.get(field)
+        if value in (None, ''):
+            user.pop(field, None)
+        elif value.lstrip('-').isdigit():
+            user[field] = int(value)
+    return user
+
+
+def _parse_ndjson_lines(lines):
+    """Decode NDJSON lines in one json.loads() call, or line by line if any is malformed.
+
+    A malformed line (including one holding several values) is returned as
+    a ValueError in place of its record.
+    """
+    records = _loads_block(lines)
+    if records is None:
+        records = []
+        for line in lines:
+            try:
+                records.append(json.loads(line))
+            except ValueError as e:
+                records.append(ValueError(f"Malformed JSON: {e}"))
+    return records
+
+
+def iter_user_chunks(path, chunk_size=10000):
+    """Yield (users, bytes_read) chunks from an .ndjson/.jsonl or .csv file.
+
+    Only one chunk is held in memory at a time. Malformed NDJSON lines are
+    yielded as ValueError instances in place of their records.
+    """
+    with open(path, 'rb') as f:
+        if path.endswith('.csv'):
+            rows = csv.reader(line.decode('utf-8') for line in f)
+            header = next(rows, None)
+            if header is None:
+                return
+            chunk = []
+            for row in rows:
+                if not row:
+                    continue
+                chunk.append(_csv_import_user(header, row))
+                if len(chunk) == chunk_size:
+                    yield chunk, f.tell()
+                    chunk = []
+            if chunk:
+                yield chunk, f.tell()
+            return
+
+        lines = []
+        for line in f:
+            if line.strip():
+                lines.append(line)
+                if len(lines) == chunk_size:
+                    yield _parse_ndjson_lines(lines), f.tell()
+                    lines = []
+        if lines:
+            yield _parse_ndjson_lines(lines), f.tell()
+
+
+def read_users(path):
+    """Load users from an .ndjson/.jsonl or .csv seed file"""
+    if path.endswith('.csv'):
+        return read_csv(path)
+    return read_ndjson(path)
+
+
+def resolve_dataset(name, max_synthetic=MAX_SYNTHETIC_USERS):
+    """Return the users for a named dataset, or raise UnknownDatasetError.
+
+    Raises ValueError for a synthetic-<N> dataset larger than `max_synthetic`
+    or a seed file that can't be read.
+    """
+    if name == 'sample':
+        return sample_users()
+    if name == 'empty':
+        return []
+    if name.startswith('synthetic-'):
+        count = name[len('synthetic-'):]
+        if count.isdigit():
+            if int(count) > max_synthetic:
+                raise ValueError(f"Dataset '{name}' exceeds the limit of {max_synthetic} users")
+            return list(generate_users(int(count)))
+    if name and os.sep not in name and not name.startswith('.'):
+        for extension in ('.ndjson', '.jsonl', '.csv'):
+            path = os.path.join(DATASET_DIR, name + extension)
+            if os.path.isfile(path):
+                return read_users(path)
+    raise UnknownDatasetError(name)
+
+
+def parse_departments(value):
+    """Parse 'Engineering=5,Sales=3' into {'Engineering': 5.0, 'Sales': 3.0}"""
+    departments = {}
+    for item in value.split(','):
+        name, _, weight = item.partition('=')
+        departments[name.strip()] = float(weight or 1)
+    return departments
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate and load user datasets")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    generate = commands.add_parser('generate', help="write a synthetic dataset")
+    generate.add_argument('--count', type=int, default=100000)
+    generate.add_argument('--seed', type=int, default=0)
+    generate.add_argument('--output', default=os.path.join(DATASET_DIR, 'synthetic.ndjson'))
+    generate.add_argument('--departments', type=parse_departments,
+                          help="weights like Engineering=5,Sales=3")
+    generate.add_argument('--age-mean', type=float, default=38)
+    generate.add_argument('--age-sd', type=float, default=10)
+    generate.add_argument('--age-min', type=int, default=18)
+    generate.add_argument('--age-max', type=int, default=70)
+
+    load = commands.add_parser('load', help="time loading a seed file into the store")
+    load.add_argument('path')
+
+    args = parser.parse_args(argv)
+
+    if args.command == 'generate':
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        users = generate_users(args.count, args.seed, args.departments, args.age_mean,
+                               args.age_sd, args.age_min, args.age_max)
+        start = time.perf_counter()
+        writer = write_csv if args.output.endswith('.csv') else write_ndjson
+        count = writer(args.output, users)
+        print(f"✅ Wrote {count:,} users to {args.output} in {time.perf_counter() - start:.2f}s")
+        return 0
+
+    import app
+    start = time.perf_counter()
+    users = read_users(args.path)
+    parsed = time.perf_counter()
+    # The same path as USER_DATASET and POST /reset: validate, then load
+    app.replace_users(users, validate=True)
+    done = time.perf_counter()
+    print(f"✅ Loaded {len(users):,} users from {args.path}")
+    print(f"   parse: {parsed - start:.2f}s, validate + store + indexes: {done - parsed:.2f}s, "
+          f"total: {done - start:.2f}s ({len(users) / (done - start):,.0f} users/s)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Content negotiation for the User Management REST API
+
+JSON is the default. When the optional `msgpack` package is installed:
+
+- requests whose Accept header prefers application/msgpack get the
+  usual response envelope encoded as MessagePack, and
+- POST/PUT/batch bodies may be sent with Content-Type: application/msgpack.
+
+Without msgpack, Accept: application/msgpack falls back to JSON and a
+MessagePack request body is answered with 415.
+
+Writes also honour `Prefer: return=minimal` (RFC 7240): the client gets
+204 or just the new id instead of the whole record.
+"""
+
+from flask import current_app, jsonify, request
+from werkzeug.exceptions import BadRequest
+
+try:
+    import msgpack
+except ImportError:  # optional dependency
+    msgpack = None
+
+JSON_MIMETYPE = 'application/json'
+MSGPACK_MIMETYPE = 'application/msgpack'
+MSGPACK_MIMETYPES = (MSGPACK_MIMETYPE, 'application/x-msgpack')
+
+
+class UnsupportedBodyError(ValueError):
+    """The request body is in a format this server can't decode"""
+
+
+def msgpack_available():
+    return msgpack is not None
+
+
+def wants_msgpack():
+    """True if the client's Accept header prefers MessagePack over JSON"""
+    # Cheap substring test first: almost every request is plain JSON
+    if msgpack is None or 'msgpack' not in request.environ.get('HTTP_ACCEPT', ''):
+        return False
+    accept = request.accept_mimetypes
+    best = accept.best_match((JSON_MIMETYPE,) + MSGPACK_MIMETYPES)
+    return best in MSGPACK_MIMETYPES
+
+
+def wants_minimal():
+    """True if the client sent Prefer: return=minimal"""
+    prefer = request.environ.get('HTTP_PREFER')
+    if not prefer:
+        return False
+    for preference in prefer.split(','):
+        token = preference.split(';', 1)[0].replace(' ', '').replace('"', '').lower()
+        if token == 'return=minimal':
+            return True
+    return False
+
+
+def is_msgpack_body():
+    """True if the request declares a MessagePack body"""
+    return request.mimetype in MSGPACK_MIMETYPES
+
+
+def has_body():
+    """True if the request body is JSON or MessagePack"""
+    return request.is_json or is_msgpack_body()
+
+
+def read_body():
+    """Decode the request body (JSON or MessagePack).
+
+    Raises UnsupportedBodyError for MessagePack when msgpack isn't
+    installed and ValueError for a malformed JSON or MessagePack body.
+    """
+    if not is_msgpack_body():
+        try:
+            return request.get_json()
+        except BadRequest:
+            raise ValueError("Malformed JSON body")
+    if msgpack is None:
+        raise UnsupportedBodyError("MessagePack bodies need the 'msgpack' package")
+    try:
+        return msgpack.unpackb(request.get_data(cache=False), raw=False)
+    except (msgpack.UnpackException, ValueError) as e:
+        raise ValueError(f"Malformed MessagePack body: {e}")
+
+
+def render(payload, status_code):
+    """Encode a response envelope in the negotiated format"""
+    if wants_msgpack():
+        response = current_app.response_class(
+            msgpack.packb(payload, use_bin_type=True), mimetype=MSGPACK_MIMETYPE
+        )
+    else:
+        response = jsonify(payload)
+    if msgpack is not None:
+        response.vary.add('Accept')
+    return response, status_code
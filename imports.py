@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+Background bulk imports for the User Management REST API
+
+POST /imports hands a file (an upload, or a path under the app's IMPORT_DIR)
+to the ImportManager and returns a job id at once. Jobs run on a small,
+bounded thread pool. Each one streams its file in chunks, validates a
+chunk with the schema validator and writes the valid records through
+UserStore.create_many(), so imported users get ids, timestamps, index
+entries and aggregates exactly as POST /users would give them. Each chunk
+is one store version, and the lock is released between chunks so regular
+writes keep flowing during a long import.
+
+GET /imports/<id> reports progress, throughput and the first errors;
+DELETE /imports/<id> cancels a job after its current chunk (chunks
+already imported are kept).
+"""
+
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+from datasets import iter_user_chunks
+
+# Jobs that may be queued or running at once
+MAX_ACTIVE_IMPORTS = 8
+
+# Finished jobs kept for GET /imports/<id>
+MAX_FINISHED_IMPORTS = 100
+
+# Records validated and written per store lock acquisition
+IMPORT_CHUNK_SIZE = 5000
+
+# Record errors kept per job (the rest are only counted)
+MAX_REPORTED_ERRORS = 100
+
+FINISHED = ('completed', 'failed', 'cancelled')
+
+
+class ImportQueueFullError(Exception):
+    """Too many imports are queued or running"""
+
+
+class ImportJob:
+    """Progress of one import"""
+
+    def __init__(self, source, path, cleanup):
+        self.id = secrets.token_hex(8)
+        self.source = source
+        self.path = path
+        self.cleanup = cleanup
+        self.status = 'queued'
+        self.total_bytes = os.path.getsize(path)
+        self.bytes_read = 0
+        self.processed = 0
+        self.imported = 0
+        self.rejected = 0
+        self.errors = []
+        self.failure = None
+        self.created_at = datetime.now().isoformat()
+        self.started = None
+        self.finished = None
+        self.cancel_requested = threading.Event()
+
+    def reject(self, record, errors):
+        self.rejected += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"record": record, "errors": errors})
+
+    def to_dict(self):
+        end = self.finished or time.monotonic()
+        elapsed = end - self.started if self.started else 0.0
+        return {
+            "id": self.id,
+            "source": self.source,
+            "status": self.status,
+            "created_at": self.created_at,
+            "progress": round(self.bytes_read / self.total_bytes, 4) if self.total_bytes else 1.0,
+            "bytes_read": self.bytes_read,
+            "total_bytes": self.total_bytes,
+            "processed": self.processed,
+            "imported": self.imported,
+            "rejected": self.rejected,
+            "elapsed_seconds": round(elapsed, 3),
+            "records_per_second": round(self.processed / elapsed) if elapsed else 0,
+            "errors": list(self.errors),
+            "failure": self.failure
+        }
+
+
+class ImportManager:
+    """Runs import jobs on a bounded thread pool"""
+
+    def __init__(self, store, validator, workers=2, chunk_size=IMPORT_CHUNK_SIZE):
+        self.store = store
+        self.validator = validator
+        self.chunk_size = chunk_size
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='import')
+        self._lock = threading.Lock()
+        self._jobs = OrderedDict()
+
+    def submit(self, path, source=None, cleanup=False):
+        """Queue an import of `path`; cleanup=True deletes the file afterwards"""
+        with self._lock:
+            active = sum(1 for job in self._jobs.values() if job.status not in FINISHED)
+            if active >= MAX_ACTIVE_IMPORTS:
+                raise ImportQueueFullError(f"At most {MAX_ACTIVE_IMPORTS} imports may run at once")
+            job = ImportJob(source or os.path.basename(path), path, cleanup)
+            self._jobs[job.id] = job
+            self._forget_finished()
+        self._executor.submit(self._run, job)
+        return job
+
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def jobs(self):
+        with self._lock:
+            return list(self._jobs.values())
+
+    def cancel(self, job_id):
+        """Ask a job to stop after its current chunk; None if unknown"""
+        job = self.get(job_id)
+        if job is not None and job.status not in FINISHED:
+            job.cancel_requested.set()
+        return job
+
+    def _forget_finished(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job.status in FINISHED]
+        for job_id in finished[:max(len(finished) - MAX_FINISHED_IMPORTS, 0)]:
+            del self._jobs[job_id]
+
+    def _run(self, job):
+        job.started = time.monotonic()
+        try:
+            if job.cancel_requested.is_set():
+                job.status = 'cancelled'
+                return
+            job.status = 'running'
+            for records, bytes_read in iter_user_chunks(job.path, self.chunk_size):
+                self._import_chunk(job, records)
+                job.bytes_read = bytes_read
+                if job.cancel_requested.is_set():
+                    job.status = 'cancelled'
+                    return
+            job.status = 'completed'
+        except Exception as e:
+            job.status = 'failed'
+            job.failure = f"{type(e).__name__}: {e}"
+        finally:
+            job.finished = time.monotonic()
+            if job.cleanup:
+                try:
+                    os.remove(job.path)
+                except OSError:
+                    pass
+
+    def _import_chunk(self, job, records):
+        first = job.processed + 1
+        problems = {}
+        for position, record in enumerate(records):
+            if isinstance(record, ValueError):
+                problems[position] = {"_body": [str(record)]}
+        parseable = [(position, record) for position, record in enumerate(records)
+                     if position not in problems]
+        invalid = self.validator.validate_many([record for _, record in parseable])
+        for index, errors in invalid:
+            problems[parseable[index][0]] = errors
+
+        valid = [(position, record) for position, record in parseable if position not in problems]
+        created, duplicates = self.store.create_many([record for _, record in valid])
+        for index, error in duplicates:
+            problems[valid[index][0]] = {"email": ["User with this email already exists"]}
+
+        for position in sorted(problems):
+            job.reject(first + position, problems[position])
+        job.imported += len(created)
+        job.processed += len(records)
+
+    def shutdown(self, wait=True):
+        """Cancel running and queued imports after their current chunk and stop the workers"""
+        for job in self.jobs():
+            job.cancel_requested.set()
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,293 @@
+#!/usr/bin/env python3
+"""
+Sorted indexes for the User Management REST API
+
+Keeps users ordered by a field (name, age, created_at) so that sorted
+listings don't have to sort the whole store on every request. Each index
+is a list of small sorted chunks (a flat, B-tree-like layout): inserts and
+removals only shift one chunk, and finding a cursor position is a bisect
+over the chunk maxima followed by a bisect inside one chunk.
+
+Chunks are copy-on-write: freeze() hands out a read-only view sharing
+every chunk, and the live index copies a chunk the first time it changes
+it afterwards, so snapshots cost O(n / CHUNK_SIZE) rather than O(n).
+"""
+
+import base64
+import binascii
+import json
+from bisect import bisect_left, bisect_right, insort
+from operator import itemgetter
+
+# Fields that can be used with GET /users?sort=<field>
+SORTABLE_FIELDS = ('name', 'age', 'created_at')
+
+# Chunk size; chunks are split once they grow past twice this size
+CHUNK_SIZE = 512
+
+
+def sort_value(value):
+    """Map a field value to a comparable (rank, value) pair.
+
+    Numbers sort before strings, anything else is compared by its string
+    form, and missing values always sort last.
+    """
+    if value is None:
+        return (3, 0)
+    if isinstance(value, (int, float)):
+        return (0, value)
+    if isinstance(value, str):
+        return (1, value)
+    return (2, str(value))
+
+
+class SortedIndex:
+    """Ordered (value, id) keys for one user field"""
+
+    def __init__(self, field):
+        self.field = field
+        self._chunks = []
+        self._maxes = []
+        self._owner = []   # generation that owns each chunk (may mutate it)
+        self._gen = 0
+        self._len = 0
+        self._view = None  # frozen view of the current contents, if any
+
+    def __len__(self):
+        return self._len
+
+    def key_for(self, user):
+        """Build the index key for a user record"""
+        rank, value = sort_value(user.get(self.field))
+        return (rank, value, user['id'])
+
+    def add(self, user):
+        """Insert a user into the index"""
+        key = self.key_for(user)
+        self._view = None
+        if not self._chunks:
+            self._chunks.append([key])
+            self._maxes.append(key)
+            self._owner.append(self._gen)
+        else:
+            pos = bisect_left(self._maxes, key)
+            if pos == len(self._maxes):
+                pos -= 1
+                self._writable(pos).append(key)
+                self._maxes[pos] = key
+            else:
+                insort(self._writable(pos), key)
+            self._split(pos)
+        self._len += 1
+
+    def remove(self, user):
+        """Remove a user from the index (no-op if not present)"""
+        key = self.key_for(user)
+        pos = bisect_left(self._maxes, key)
+        if pos == len(self._maxes):
+            return
+        chunk = self._chunks[pos]
+        idx = bisect_left(chunk, key)
+        if idx == len(chunk) or chunk[idx] != key:
+            return
+        self._view = None
+        self._len -= 1
+        if len(chunk) == 1:
+            del self._chunks[pos]
+            del self._maxes[pos]
+            del self._owner[pos]
+            return
+        chunk = self._writable(pos)
+        del chunk[idx]
+        self._maxes[pos] = chunk[-1]
+
+    def clear(self):
+        """Drop every key from the index"""
+        self._chunks = []
+        self._maxes = []
+        self._owner = []
+        self._len = 0
+        self._view = None
+
+    def freeze(self):
+        """Return a read-only view of the index as it is now.
+
+        The view shares all chunks with the live index; the live index
+        starts a new generation so it copies a chunk before its next
+        change to it. The view is reused until the index changes again.
+        Never call add/remove on a frozen view.
+        """
+        if self._view is not None:
+            return self._view
+        view = SortedIndex.__new__(SortedIndex)
+        view.field = self.field
+        view._chunks = list(self._chunks)
+        view._maxes = list(self._maxes)
+        view._owner = None
+        view._gen = None
+        view._len = self._len
+        view._view = view
+        self._view = view
+        self._gen += 1
+        return view
+
+    def _writable(self, pos):
+        """Return chunk `pos`, copying it first if a frozen view may share it"""
+        if self._owner[pos] != self._gen:
+            self._chunks[pos] = list(self._chunks[pos])
+            self._owner[pos] = self._gen
+        return self._chunks[pos]
+
+    def bulk_load(self, users):
+        """Rebuild the index from an iterable of users in O(n log n).
+
+        Users are bucketed by value rank and each bucket is sorted on the
+        bare field value, which keeps the sort on CPython's fast
+        same-type comparisons; ties keep id order because the sort is
+        stable over an id-ordered list.
+        """
+        field = self.field
+        buckets = ([], [], [], [])
+        for user in sorted(users, key=itemgetter('id')):
+            value = user.get(field)
+            cls = value.__class__
+            if cls is str:
+                buckets[1].append(user)
+            elif cls is int or cls is float:
+                buckets[0].append(user)
+            else:
+                buckets[sort_value(value)[0]].append(user)
+
+        keys = []
+        for rank, bucket in enumerate(buckets):
+            if rank == 3:
+                keys.extend((3, 0, user['id']) for user in bucket)
+                continue
+            if rank == 2:
+                keys.extend(sorted(self.key_for(user) for user in bucket))
+                continue
+            bucket.sort(key=itemgetter(field))
+            keys.extend((rank, user[field], user['id']) for user in bucket)
+
+        self._chunks = [keys[i:i + CHUNK_SIZE] for i in range(0, len(keys), CHUNK_SIZE)]
+        self._maxes = [chunk[-1] for chunk in self._chunks]
+        self._owner = [self._gen] * len(self._chunks)
+        self._len = len(keys)
+        self._view = None
+
+    def _split(self, pos):
+        chunk = self._chunks[pos]
+        if len(chunk) <= 2 * CHUNK_SIZE:
+            return
+        # add() already made this chunk writable
+        half = chunk[CHUNK_SIZE:]
+        del chunk[CHUNK_SIZE:]
+        self._chunks.insert(pos + 1, half)
+        self._maxes[pos] = chunk[-1]
+        self._maxes.insert(pos + 1, half[-1])
+        self._owner.insert(pos + 1, self._gen)
+
+    def _locate_offset(self, offset, reverse):
+        """Return (chunk, position) of the offset-th key in iteration order"""
+        if reverse:
+            offset = self._len - 1 - offset
+        for pos, chunk in enumerate(self._chunks):
+            if offset < len(chunk):
+                return pos, offset
+            offset -= len(chunk)
+        return len(self._chunks), 0
+
+    def _locate_after(self, key, reverse):
+        """Return (chunk, position) of the first key past `key` in iteration order"""
+        if reverse:
+            pos = bisect_left(self._maxes, key)
+            if pos == len(self._chunks):
+                pos -= 1
+                return pos, len(self._chunks[pos]) - 1
+            return pos, bisect_left(self._chunks[pos], key) - 1
+        pos = bisect_right(self._maxes, key)
+        if pos == len(self._chunks):
+            return pos, 0
+        return pos, bisect_right(self._chunks[pos], key)
+
+    def _walk(self, pos, idx, reverse):
+        if reverse:
+            while pos >= 0:
+                chunk = self._chunks[pos]
+                while idx >= 0:
+                    yield chunk[idx]
+                    idx -= 1
+                pos -= 1
+                if pos >= 0:
+                    idx = len(self._chunks[pos]) - 1
+        else:
+            while pos < len(self._chunks):
+                chunk = self._chunks[pos]
+                while idx < len(chunk):
+                    yield chunk[idx]
+                    idx += 1
+                pos += 1
+                idx = 0
+
+    def page(self, limit, offset=0, after=None, reverse=False):
+        """Return up to `limit` user IDs in index order.
+
+        Pass `after` (an index key) for cursor paging, which costs
+        O(log n + limit); otherwise `offset` keys are skipped.
+        """
+        if not self._chunks or limit <= 0:
+            return []
+        if after is not None:
+            pos, idx = self._locate_after(after, reverse)
+        elif offset >= self._len:
+            return []
+        else:
+            pos, idx = self._locate_offset(offset, reverse)
+
+        ids = []
+        for key in self._walk(pos, idx, reverse):
+            ids.append(key[2])
+            if len(ids) == limit:
+                break
+        return ids
+
+
+def parse_sort(sort_param):
+    """Parse a ?sort= value like 'name' or '-age' into (field, descending)"""
+    descending = sort_param.startswith('-')
+    field = sort_param.lstrip('-')
+    if field not in SORTABLE_FIELDS:
+        raise ValueError(
+            f"Invalid sort field '{field}'. Allowed: {', '.join(SORTABLE_FIELDS)}"
+        )
+    return field, descending
+
+
+def encode_cursor(field, descending, key):
+    """Encode the last key of a page as an opaque cursor string"""
+    raw = json.dumps([field, descending, list(key)], separators=(',', ':'))
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+# Value types a key of each sort_value() rank may hold
+_RANK_TYPES = ((int, float), str, str, int)
+
+
+def decode_cursor(cursor):
+    """Decode a cursor into (field, descending, key).
+
+    The key is checked to be one sort_value() could have produced, so it
+    compares cleanly against every key in the index.
+    """
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        field, descending, key = json.loads(base64.urlsafe_b64decode(padded))
+        rank, value, user_id = key
+    except (binascii.Error, ValueError, TypeError):
+        raise ValueError("Invalid cursor")
+    if (not isinstance(field, str) or not isinstance(descending, bool)
+            or rank.__class__ is not int or not 0 <= rank <= 3
+            or not isinstance(value, _RANK_TYPES[rank])
+            or user_id.__class__ is not int):
+        raise ValueError("Invalid cursor")
+    return field, descending, (rank, value, user_id)
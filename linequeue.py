@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Queued line writer for the User Management REST API
+
+The request thread only puts an entry on a bounded in-memory queue. A
+background thread takes entries off the queue in batches, renders them as
+lines and appends each batch to the file with a single write. When the
+queue is full (the disk can't keep up) entries are dropped and counted
+rather than slowing requests down.
+
+Used by the access log (accesslog.py) and trace export (tracing.py).
+"""
+
+import atexit
+import os
+import queue
+import threading
+import time
+import weakref
+
+# Entries written per batch at most
+BATCH_SIZE = 1000
+
+# How long the writer waits for more entries before writing a partial batch
+FLUSH_INTERVAL = 0.25
+
+_STOP = object()
+
+# Live writers, for the process-wide fork and exit hooks below
+_writers = weakref.WeakSet()
+
+
+class QueuedLineWriter:
+    """Bounded queue plus a background batch writer appending to `path`.
+
+    `render` turns a queued entry into one line (including its newline);
+    it runs on the writer thread, off the request path.
+    """
+
+    def __init__(self, path, render, queue_size=10000, name='line-writer'):
+        self.path = path
+        self.render = render
+        self.name = name
+        self.queue_size = queue_size
+        self._queue = queue.Queue(queue_size)
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._fd = None
+        self.enqueued = 0
+        self.written = 0
+        self.dropped = 0
+        self.batches = 0
+        _writers.add(self)
+
+    def log(self, entry):
+        """Enqueue one entry without blocking; count it as dropped if the queue is full"""
+        if self._thread is None:
+            self._start()
+        try:
+            self._queue.put_nowait(entry)
+            self.enqueued += 1
+        except queue.Full:
+            self.dropped += 1
+
+    # Writer thread
+
+    def _start(self):
+        with self._start_lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+                self._thread.start()
+
+    def _after_fork(self):
+        self._queue = queue.Queue(self.queue_size)
+        self._start_lock = threading.Lock()
+        self._thread = None
+        self._fd = None
+
+    def _run(self):
+        pending = self._queue
+        try:
+            self._drain(pending)
+        finally:
+            # Only this thread writes to the file, so it closes it too
+            self._close_file()
+
+    def _drain(self, pending):
+        while True:
+            entry = pending.get()
+            if entry is _STOP:
+                return
+            batch = [entry]
+            deadline = time.monotonic() + FLUSH_INTERVAL
+            stop = False
+            while len(batch) < BATCH_SIZE:
+                try:
+                    entry = pending.get(timeout=max(deadline - time.monotonic(), 0))
+                except queue.Empty:
+                    break
+                if entry is _STOP:
+                    stop = True
+                    break
+                batch.append(entry)
+            try:
+                self._write(batch)
+            except OSError:
+                self.dropped += len(batch)
+            if stop:
+                return
+
+    def _write(self, batch):
+        if self._fd is None:
+            # O_APPEND keeps whole batches from different workers from interleaving
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_CREAT | os.O_APPEND, 0o644)
+        data = ''.join(self.render(entry) for entry in batch).encode()
+        os.write(self._fd, data)
+        self.written += len(batch)
+        self.batches += 1
+
+    def _close_file(self):
+        fd, self._fd = self._fd, None
+        if fd is not None:
+            os.close(fd)
+
+    def close(self, timeout=5):
+        """Write whatever is queued and stop the writer thread.
+
+        If the queue can't take the stop request, or the thread is still
+        writing after `timeout`, the file is left open for the thread rather
+        than closed underneath it.
+        """
+        thread = self._thread
+        if thread is not None and thread.is_alive():
+            try:
+                self._queue.put(_STOP, timeout=timeout)
+            except queue.Full:
+                return
+            thread.join(timeout)
+            if thread.is_alive():
+                return
+        self._thread = None
+        self._close_file()
+
+    def stats(self):
+        """Queue and write counters"""
+        return {
+            "enqueued": self.enqueued,
+            "written": self.written,
+            "dropped": self.dropped,
+            "batches": self.batches,
+            "queue_depth": self._queue.qsize(),
+            "queue_size": self.queue_size
+        }
+
+
+def _after_fork_in_child():
+    # Writer threads don't survive fork(); each process starts its own
+    for writer in list(_writers):
+        writer._after_fork()
+
+
+def _close_all():
+    for writer in list(_writers):
+        writer.close()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_after_fork_in_child)
+atexit.register(_close_all)
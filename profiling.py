@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+On-demand profiling and memory introspection for the User Management REST API
+
+Nothing here runs until it is asked for, so there is no cost while idle:
+
+- sample_profile(): a sampling profiler. The calling thread reads every
+  other thread's current stack (sys._current_frames()) at a fixed interval for
+  a few seconds and returns the stacks in collapsed format ("a;b;c 42"),
+  ready for flamegraph.pl, speedscope or inferno. Live request threads
+  are sampled as they run; they are never instrumented.
+- memory_report(): tracemalloc's top allocation sites (tracing only for
+  the requested window, unless PYTHONTRACEMALLOC already enabled it)
+  plus the approximate size of each store structure and of whichever
+  caches (coalesced calls, import jobs) the caller passes in.
+"""
+
+import os
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+# Upper bounds for one profiling / tracing window
+MAX_PROFILE_SECONDS = 60
+MAX_TRACE_SECONDS = 60
+
+# Records sampled when estimating the size of large structures
+SIZE_SAMPLE = 1000
+
+
+def _frame_label(code):
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def sample_profile(seconds, interval=0.005):
+    """Sample all threads' stacks for `seconds`; return collapsed-stack text.
+
+    Each output line is a semicolon-separated stack (outermost frame
+    first, prefixed with the thread name) followed by the number of
+    samples that saw exactly that stack.
+    """
+    own = threading.get_ident()
+    names = {}
+    stacks = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame.f_code))
+                frame = frame.f_back
+            if ident not in names:
+                names.update((thread.ident, thread.name) for thread in threading.enumerate())
+                names.setdefault(ident, f"thread-{ident}")
+            stack.append(names[ident])
+            stacks[';'.join(reversed(stack))] += 1
+        time.sleep(interval)
+    return ''.join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def deep_size(obj, sample=SIZE_SAMPLE):
+    """Approximate size of a container of records/keys in bytes.
+
+    The container itself is measured exactly; its items are sized on a
+    random sample of `sample` entries and extrapolated.
+    """
+    size = sys.getsizeof(obj)
+    items = list(obj.values()) if isinstance(obj, dict) else list(obj)
+    if not items:
+        return size
+    picked = items if len(items) <= sample else random.sample(items, sample)
+    per_item = sum(_flat_size(item) for item in picked) / len(picked)
+    if isinstance(obj, dict):
+        keys = list(obj)
+        picked_keys = keys if len(keys) <= sample else random.sample(keys, sample)
+        per_item += sum(sys.getsizeof(key) for key in picked_keys) / len(picked_keys)
+    return int(size + per_item * len(items))
+
+
+def _flat_size(item):
+    """Size of one record dict / key tuple / object and the values directly inside it"""
+    size = sys.getsizeof(item)
+    if isinstance(item, dict):
+        size += sum(sys.getsizeof(value) for value in item.values())
+    elif isinstance(item, (tuple, list)):
+        size += sum(sys.getsizeof(value) for value in item)
+    elif hasattr(item, '__dict__'):
+        size += _flat_size(vars(item))
+    else:
+        size += sum(sys.getsizeof(getattr(item, name, None)) for name in getattr(item, '__slots__', ()))
+    return size
+
+
+def structure_sizes(store):
+    """Approximate bytes held by each store structure.
+
+    Strings shared between structures (an email is both in its record and
+    in the email index) are counted in each of them. Records and indexes
+    are measured on the latest snapshot and the email index from a
+    sample, so the store lock is never taken and writers are not held up.
+    With tiered storage only records already in memory are looked at:
+    nothing is faulted in from the spill file.
+    """
+    snapshot = store.snapshot()
+    sizes = {}
+    pages = list(snapshot.pages.values())
+    page_dicts = sys.getsizeof(snapshot.pages) + sum(sys.getsizeof(page) for page in pages)
+    if store.tier is None:
+        records = []
+        for page in pages:
+            records.extend(page.values())
+        sizes["records"] = page_dicts + deep_size(records) - sys.getsizeof(records)
+    else:
+        records = store.tier.resident_sample(SIZE_SAMPLE)
+        sizes["records"] = page_dicts + store.tier.stats()["hot_bytes"]
+
+    # The live email index is never copied: its dict is measured directly
+    # and its keys from emails sampled out of the records above
+    email_dict = sys.getsizeof(store._emails)
+    email_count = len(store._emails)
+    picked = records if len(records) <= SIZE_SAMPLE else random.sample(records, SIZE_SAMPLE)
+    per_email = sum(sys.getsizeof(user['email']) for user in picked) / len(picked) if picked else 0
+    sizes["email_index"] = email_dict + int(per_email * email_count)
+    sizes["pinned_pages"] = _pinned_size(store, snapshot)
+
+    for field, index in snapshot.indexes.items():
+        keys = [key for chunk in index._chunks for key in chunk]
+        containers = sys.getsizeof(index._chunks) + sys.getsizeof(index._maxes)
+        containers += sum(sys.getsizeof(chunk) for chunk in index._chunks)
+        sizes[f"sort_index:{field}"] = containers + deep_size(keys) - sys.getsizeof(keys)
+
+    stats = store.stats
+    sizes["aggregates"] = sum(
+        sys.getsizeof(value) for value in (stats.department_counts, stats.age_counts)
+    )
+    return sizes
+
+
+def _pinned_size(store, current):
+    """Bytes of pages (and their records) kept alive only by pinned snapshots"""
+    size = 0
+    seen = set()
+    for pinned, _ in list(store._pinned.values()):
+        for page_no, page in pinned.pages.items():
+            live = current.pages.get(page_no)
+            if page is live or id(page) in seen:
+                continue
+            seen.add(id(page))
+            size += sys.getsizeof(page)
+            if store.tier is not None:
+                # Pages hold revisions; the records are in the tier's hot bytes
+                continue
+            for user_id, user in page.items():
+                if (live is None or live.get(user_id) is not user) and id(user) not in seen:
+                    seen.add(id(user))
+                    size += _flat_size(user)
+    return size
+
+
+def memory_report(store, top=20, trace_seconds=0.0, extra=None):
+    """Top allocation sites plus per-structure sizes.
+
+    If tracemalloc isn't already running it is started for
+    `trace_seconds` (so only allocations made in that window, and still
+    alive at its end, are attributed) and stopped again afterwards.
+    `extra` maps further structure names (caches...) to objects to size.
+    """
+    report = {"tracemalloc": None}
+    started = False
+    try:
+        if not tracemalloc.is_tracing() and trace_seconds > 0:
+            tracemalloc.start()
+            started = True
+            time.sleep(trace_seconds)
+        if tracemalloc.is_tracing():
+            snapshot = tracemalloc.take_snapshot().filter_traces((
+                tracemalloc.Filter(False, tracemalloc.__file__),
+                tracemalloc.Filter(False, "<frozen importlib._bootstrap>"),
+            ))
+            current, peak = tracemalloc.get_traced_memory()
+            report["tracemalloc"] = {
+                "window_seconds": trace_seconds if started else None,
+                "traced_bytes": current,
+                "peak_bytes": peak,
+                "top": [
+                    {
+                        "location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+                        "bytes": stat.size,
+                        "blocks": stat.count
+                    }
+                    for stat in snapshot.statistics('lineno')[:top]
+                ]
+            }
+    finally:
+        # Never leave tracing (and its per-allocation cost) on behind us
+        if started:
+            tracemalloc.stop()
+
+    sizes = structure_sizes(store)
+    for name, obj in (extra or {}).items():
+        sizes[name] = deep_size(obj)
+    report["structures"] = sizes
+    report["total_users"] = store.stats.total
+    report["pinned_snapshots"] = store.pin_stats()["pinned_snapshots"]
+    return report
@@ -0,0 +1,295 @@
+#!/usr/bin/env python3
+"""
+Production server for the User Management REST API
+
+By default the app is served from a single threaded process (HTTP/1.1
+with keep-alive): the in-memory store lives in one process, so ids and
+emails stay unique and every client reads every write.
+
+With --read-only it becomes a pre-fork master for read replicas: it
+imports the app and loads the dataset once, opens the listening socket,
+then forks --workers processes. Workers start with the master's memory
+(including the dataset) shared copy-on-write. Every worker owns a private
+copy of the store, so in this mode writes (POST, PUT, PATCH, DELETE) are
+refused with 503 rather than applied to one copy. --workers above 1
+requires --read-only. Tiered storage (tiered.py) keeps a per-process
+spill file that a forked worker must never share, so it can't be combined
+with --read-only.
+
+Usage:
+    python serve.py --port 5000 --dataset synthetic-100000
+    python serve.py --read-only --workers 4 --dataset synthetic-100000
+
+Signals:
+    SIGTERM, SIGINT  graceful shutdown: stop accepting, finish in-flight
+                     requests, then exit
+    SIGHUP           (--read-only master) graceful restart: fork fresh
+                     workers, then drain the old ones; ignored otherwise
+"""
+
+import argparse
+import gc
+import os
+import signal
+import socket
+import sys
+import threading
+import time
+
+from werkzeug.serving import ThreadedWSGIServer, WSGIRequestHandler
+
+
+class KeepAliveRequestHandler(WSGIRequestHandler):
+    """HTTP/1.1 handler with an idle keep-alive timeout and no per-request log line"""
+
+    protocol_version = "HTTP/1.1"
+    timeout = 5
+
+    def setup(self):
+        super().setup()
+        # Small JSON responses shouldn't wait on Nagle's algorithm
+        if self.connection.family in (socket.AF_INET, socket.AF_INET6):
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+    def log_request(self, code='-', size='-'):
+        pass
+
+
+class DrainingWSGIServer(ThreadedWSGIServer):
+    """Threaded server whose server_close() waits for in-flight requests"""
+
+    daemon_threads = False
+    block_on_close = True
+
+
+def create_listener(host, port, backlog, reuseport=False, listen=True):
+    """Open a TCP listening socket (SO_REUSEPORT when requested)"""
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuseport:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    if listen:
+        sock.listen(backlog)
+    return sock
+
+
+def run_worker(app, options, listener):
+    """Serve requests in a forked worker until SIGTERM, then drain and exit"""
+    if options.reuseport:
+        # The master's socket only reserves the port; accept on our own
+        listener.close()
+        listener = create_listener(options.host, options.port, options.backlog, reuseport=True)
+
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGHUP, signal.SIG_IGN)
+    serve_until_signalled(app, options, listener, (signal.SIGTERM,))
+
+
+def serve_until_signalled(app, options, listener, signals):
+    """Serve on `listener` until one of `signals` arrives, then drain in-flight requests"""
+    handler = type('WorkerRequestHandler', (KeepAliveRequestHandler,), {'timeout': options.keep_alive})
+    server = DrainingWSGIServer(options.host, options.port, app, handler=handler, fd=listener.fileno())
+    listener.close()
+
+    def stop(signum, frame):
+        # shutdown() blocks until serve_forever returns, so it can't run on
+        # the thread that is inside serve_forever
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    for signum in signals:
+        signal.signal(signum, stop)
+
+    server.serve_forever(poll_interval=0.25)
+    server.server_close()
+
+
+class Master:
+    """Forks, supervises and gracefully restarts worker processes"""
+
+    def __init__(self, app, options, on_exit=None):
+        self.app = app
+        self.options = options
+        self.on_exit = on_exit
+        self.workers = {}      # pid -> generation
+        self.generation = 0
+        self.stopping = False
+        self.restart_requested = False
+
+    def run(self):
+        options = self.options
+        # With SO_REUSEPORT each worker binds its own socket; the master only
+        # binds (without listening) to reserve the port and resolve port 0
+        self.listener = create_listener(
+            options.host, options.port, options.backlog,
+            reuseport=options.reuseport, listen=not options.reuseport
+        )
+        options.port = self.listener.getsockname()[1]
+
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+        signal.signal(signal.SIGHUP, self._request_restart)
+
+        mode = "SO_REUSEPORT" if options.reuseport else "shared socket"
+        print(f"🚀 Listening on http://{options.host}:{options.port} "
+              f"({options.workers} read-only workers, {mode}, backlog {options.backlog}, "
+              f"keep-alive {options.keep_alive}s)", flush=True)
+
+        self._spawn_generation()
+        while self.workers:
+            self._reap()
+            if self.stopping:
+                self._drain(list(self.workers))
+                break
+            if self.restart_requested:
+                self.restart_requested = False
+                old = list(self.workers)
+                self._spawn_generation()
+                self._drain(old)
+            time.sleep(0.1)
+
+        self.listener.close()
+        print("⏹️  Server stopped", flush=True)
+
+    def _request_stop(self, signum, frame):
+        self.stopping = True
+
+    def _request_restart(self, signum, frame):
+        self.restart_requested = True
+
+    def _spawn_generation(self):
+        self.generation += 1
+        for _ in range(self.options.workers):
+            self._spawn()
+
+    def _spawn(self):
+        # Keep everything loaded so far out of the cyclic GC so that
+        # collections in the worker don't touch (and un-share) those pages
+        gc.collect()
+        if hasattr(gc, 'freeze'):
+            gc.freeze()
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                run_worker(self.app, self.options, self.listener)
+                if self.on_exit is not None:
+                    # os._exit() skips atexit handlers, so flush explicitly
+                    self.on_exit()
+            except BaseException:
+                code = 1
+                import traceback
+                traceback.print_exc()
+            finally:
+                os._exit(code)
+        self.workers[pid] = self.generation
+
+    def _reap(self):
+        """Collect exited workers and replace any that died unexpectedly"""
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            generation = self.workers.pop(pid, None)
+            if generation == self.generation and not self.stopping:
+                print(f"⚠️  Worker {pid} exited (status {status}); starting a replacement", flush=True)
+                self._spawn()
+
+    def _drain(self, pids):
+        """Ask workers to finish in-flight requests and exit; kill stragglers"""
+        for pid in pids:
+            self._signal(pid, signal.SIGTERM)
+        deadline = time.monotonic() + self.options.graceful_timeout
+        while any(pid in self.workers for pid in pids) and time.monotonic() < deadline:
+            time.sleep(0.05)
+            self._reap()
+        for pid in pids:
+            if pid in self.workers:
+                self._signal(pid, signal.SIGKILL)
+                try:
+                    os.waitpid(pid, 0)
+                except ChildProcessError:
+                    pass
+                self.workers.pop(pid, None)
+
+    @staticmethod
+    def _signal(pid, signum):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Serve the User Management REST API")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=1,
+                        help="worker processes; more than 1 requires --read-only")
+    parser.add_argument('--read-only', action='store_true',
+                        help="fork read-only replica workers that refuse writes with 503")
+    parser.add_argument('--backlog', type=int, default=2048,
+                        help="listen() backlog (capped by net.core.somaxconn)")
+    parser.add_argument('--keep-alive', type=float, default=5,
+                        help="seconds an idle keep-alive connection stays open")
+    parser.add_argument('--graceful-timeout', type=float, default=30,
+                        help="seconds workers get to drain before being killed")
+    parser.add_argument('--reuseport', action='store_true',
+                        help="one SO_REUSEPORT socket per worker instead of a shared socket")
+    parser.add_argument('--dataset', default=os.environ.get('USER_DATASET', 'sample'),
+                        help="named dataset to load before forking (see datasets.py)")
+    options = parser.parse_args(argv)
+    if options.reuseport and not hasattr(socket, 'SO_REUSEPORT'):
+        parser.error("SO_REUSEPORT is not available on this platform")
+    if options.workers < 1:
+        parser.error("--workers must be at least 1")
+    if options.workers > 1 and not options.read_only:
+        parser.error("--workers above 1 requires --read-only: each worker holds its own "
+                     "copy of the store, so writes would split the data")
+    return options
+
+
+def main(argv=None):
+    options = parse_args(argv)
+
+    # Build the app and load the dataset once, before forking
+    import app as api
+    tiered = api.default_config()['STORE_TIER'] == 'tiered'
+    if tiered and options.read_only:
+        # Workers would share (and corrupt) the master's spill file
+        print("❌ Tiered storage (USER_STORE_TIER=tiered) can't be served with --read-only",
+              file=sys.stderr)
+        return 2
+    application = api.create_app({'DATASET': options.dataset, 'READ_ONLY': options.read_only})
+    state = api.get_state(application)
+    print(f"📋 Dataset '{options.dataset}' loaded ({state.store.stats.total:,} users)", flush=True)
+
+    if not options.read_only or not hasattr(os, 'fork'):
+        # A writable store must live in exactly one process (a forked or
+        # re-forked worker would hold a diverging copy, and a tiered spill
+        # file must never be inherited), and without fork() (e.g. Windows)
+        # there is no choice: serve from a single threaded process
+        listener = create_listener(options.host, options.port, options.backlog)
+        options.port = listener.getsockname()[1]
+        mode = "read-only, " if options.read_only else ""
+        print(f"🚀 Listening on http://{options.host}:{options.port} (single process, {mode}"
+              f"backlog {options.backlog}, keep-alive {options.keep_alive}s)", flush=True)
+        if hasattr(signal, 'SIGHUP'):
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        serve_until_signalled(application, options, listener, (signal.SIGTERM, signal.SIGINT))
+        # Flush the logs and remove a temporary spill file
+        state.close()
+        print("⏹️  Server stopped", flush=True)
+        return 0
+
+    Master(application, options, on_exit=state.close).run()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Single-flight request coalescing for the User Management REST API
+
+When many clients ask for the same thing at the same moment, only the
+first request (the leader) computes the response. Requests with the same
+key that arrive while it is still running (followers) wait for it and
+get the same serialized result instead of rebuilding it.
+
+Nothing is cached: as soon as the leader finishes, the key is forgotten
+and the next request computes afresh. Callers include the store version
+in the key, so a follower never receives data older than the version it
+arrived at.
+"""
+
+import threading
+
+
+class _Call:
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Collapses concurrent calls with the same key into one"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls = {}
+        self._counts = {}   # group -> [leaders, followers]
+
+    def do(self, group, key, compute):
+        """Return compute(), shared with every concurrent caller of the same key.
+
+        `group` only labels the statistics (e.g. the route). Returns
+        (result, shared) where shared is True for followers.
+        """
+        with self._lock:
+            counts = self._counts.get(group)
+            if counts is None:
+                counts = self._counts[group] = [0, 0]
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                counts[0] += 1
+                call = self._calls[key] = _Call()
+            else:
+                counts[1] += 1
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result, True
+
+        try:
+            call.result = compute()
+            return call.result, False
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self):
+        """The calls currently being computed (for /debug/memory)"""
+        with self._lock:
+            return list(self._calls.values())
+
+    def stats(self):
+        """Leader/follower counts and coalescing rate per group, for /health"""
+        with self._lock:
+            counts = {group: list(values) for group, values in self._counts.items()}
+            in_flight = len(self._calls)
+        groups = {}
+        for group, (leaders, followers) in counts.items():
+            groups[group] = {
+                "computed": leaders,
+                "coalesced": followers,
+                "coalesced_rate": round(followers / (leaders + followers), 4)
+            }
+        return {"in_flight": in_flight, "routes": groups}
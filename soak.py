@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+"""
+Concurrency soak test for the User Management REST API
+
+Many client threads (optionally in several processes) run a randomized
+mix of creates, reads, updates (PUT and PATCH), deletes and listings for
+a fixed time.
+Emails are drawn from a deliberately small pool, so concurrent creates
+and updates keep racing for the same addresses. Afterwards the harness
+checks the invariants that those races could break:
+
+- every user id is unique and below next_id
+- every email is unique, and the email index maps exactly those emails
+- the user count and aggregates match a fresh rebuild from the records
+- every sort index holds exactly the records' keys, in order
+
+and reports throughput, status codes and latency percentiles per
+operation. Any 5xx response counts as a failure. Against a running
+server (--url) the invariants are checked through the API instead; serve
+it writable (serve.py without --read-only), so there is a single store.
+
+Usage:
+    python soak.py --threads 16 --duration 60              # in-process
+    python soak.py --url http://127.0.0.1:5000 --processes 4 --threads 8 --duration 300
+"""
+
+import argparse
+import http.client
+import json
+import multiprocessing
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+# Relative weights of each operation in the mix
+DEFAULT_MIX = {"create": 25, "get": 35, "update": 10, "patch": 10, "delete": 10, "list": 10}
+
+# Emails come from a pool this size, so writers collide on them often
+EMAIL_POOL = 500
+
+# Statuses each operation may legitimately return
+EXPECTED_STATUSES = {
+    "create": {201, 400},
+    "get": {200, 404},
+    "update": {200, 400, 404},
+    "patch": {200, 400, 404},
+    "delete": {200, 404},
+    "list": {200},
+}
+
+
+class LocalClient:
+    """Calls the app in-process through Flask's test client"""
+
+    def __init__(self, app):
+        self.client = app.test_client()
+
+    def request(self, method, path, body=None):
+        response = self.client.open(path, method=method, json=body)
+        return response.status_code, response.get_json(silent=True)
+
+
+class HTTPClient:
+    """Calls a running server over one keep-alive HTTP connection"""
+
+    def __init__(self, url):
+        parts = urlsplit(url)
+        self.connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+
+    def request(self, method, path, body=None):
+        headers = {}
+        payload = None
+        if body is not None:
+            payload = json.dumps(body)
+            headers["Content-Type"] = "application/json"
+        try:
+            self.connection.request(method, path, payload, headers)
+            response = self.connection.getresponse()
+            data = response.read()
+        except (OSError, http.client.HTTPException):
+            self.connection.close()
+            raise
+        return response.status, json.loads(data) if data else None
+
+
+def run_client(client, seed, deadline, mix, id_hint):
+    """Run random operations until `deadline`; return (latencies, statuses, failures)"""
+    rng = random.Random(seed)
+    ops = list(mix)
+    weights = [mix[op] for op in ops]
+    latencies = {op: [] for op in ops}
+    statuses = Counter()
+    failures = []
+    while time.monotonic() < deadline:
+        op = rng.choices(ops, weights)[0]
+        user_id = rng.randint(1, max(id_hint[0], 1))
+        email = f"soak{rng.randrange(EMAIL_POOL)}@example.com"
+        if op == "create":
+            method, path = "POST", "/users"
+            body = {"name": f"Soak {rng.random():.6f}", "email": email,
+                    "age": rng.randint(18, 80), "department": rng.choice(["A", "B", "C"])}
+        elif op == "get":
+            method, path, body = "GET", f"/users/{user_id}", None
+        elif op == "update":
+            method, path = "PUT", f"/users/{user_id}"
+            body = {"age": rng.randint(18, 80)}
+            if rng.random() < 0.5:
+                body["email"] = email
+            if rng.random() < 0.3:
+                body["name"] = f"Renamed {rng.random():.6f}"
+        elif op == "patch":
+            method, path = "PATCH", f"/users/{user_id}"
+            body = {"department": rng.choice(["A", "B", "C", None])}
+            if rng.random() < 0.5:
+                body["email"] = email
+        elif op == "delete":
+            method, path, body = "DELETE", f"/users/{user_id}", None
+        else:
+            sort = rng.choice(["", "&sort=name", "&sort=-age", "&sort=created_at"])
+            method, path, body = "GET", f"/users?per_page=20&page={rng.randint(1, 5)}{sort}", None
+
+        start = time.perf_counter()
+        try:
+            status, data = client.request(method, path, body)
+        except Exception as e:
+            failures.append(f"{method} {path}: {type(e).__name__}: {e}")
+            continue
+        latencies[op].append(time.perf_counter() - start)
+        statuses[status] += 1
+        if status not in EXPECTED_STATUSES[op]:
+            failures.append(f"{method} {path} -> {status}: {data}")
+        elif op == "create" and status == 201:
+            id_hint[0] = max(id_hint[0], data["data"]["id"])
+    return latencies, statuses, failures
+
+
+def run_threads(make_client, threads, duration, seed, mix):
+    """Run `threads` clients concurrently and merge their results"""
+    deadline = time.monotonic() + duration
+    id_hint = [100]
+    results = [None] * threads
+
+    def worker(index):
+        results[index] = run_client(make_client(), seed * 1000 + index, deadline, mix, id_hint)
+
+    pool = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    for thread in pool:
+        thread.start()
+    for thread in pool:
+        thread.join()
+    return merge(results)
+
+
+def merge(results):
+    latencies, statuses, failures = {}, Counter(), []
+    for op_latencies, op_statuses, op_failures in results:
+        for op, values in op_latencies.items():
+            latencies.setdefault(op, []).extend(values)
+        statuses.update(op_statuses)
+        failures.extend(op_failures)
+    return latencies, statuses, failures
+
+
+def _http_process(args):
+    url, threads, duration, seed, mix = args
+    return run_threads(lambda: HTTPClient(url), threads, duration, seed, mix)
+
+
+def check_invariants(store):
+    """Check a UserStore's internal consistency; return a list of violations"""
+    from aggregates import UserAggregates
+
+    problems = []
+    with store._lock:
+        users = []
+        for page_no, page in store._pages.items():
+            for user_id in page:
+                user = store._get_live(user_id)
+                if user is None or user['id'] != user_id or user_id >> 10 != page_no:
+                    problems.append(f"record {user_id} is misfiled")
+                    continue
+                users.append(user)
+        ids = [user['id'] for user in users]
+        emails = [user['email'] for user in users]
+        if len(set(ids)) != len(ids):
+            problems.append("duplicate user ids")
+        if ids and max(ids) >= store.next_id:
+            problems.append(f"id {max(ids)} is not below next_id {store.next_id}")
+        if len(set(emails)) != len(emails):
+            duplicates = [email for email, count in Counter(emails).items() if count > 1]
+            problems.append(f"duplicate emails: {duplicates[:5]}")
+        if store._emails != {user['email']: user['id'] for user in users}:
+            problems.append("email index does not match the records")
+        if store._count != len(users) or store.snapshot().count != len(users):
+            problems.append(f"count {store._count} != {len(users)} records")
+
+        expected = UserAggregates()
+        expected.rebuild(users)
+        actual, rebuilt = store.stats.to_dict(), expected.to_dict()
+        actual.pop("last_modified")
+        rebuilt.pop("last_modified")
+        if actual != rebuilt:
+            problems.append(f"aggregates {actual} != rebuilt {rebuilt}")
+
+        for field, index in store.indexes.items():
+            keys = [key for chunk in index._chunks for key in chunk]
+            if keys != sorted(index.key_for(user) for user in users):
+                problems.append(f"sort index '{field}' does not match the records")
+            if len(index) != len(keys) or index._maxes != [chunk[-1] for chunk in index._chunks]:
+                problems.append(f"sort index '{field}' bookkeeping is off")
+    return problems
+
+
+def check_api_invariants(client):
+    """Check what a remote server exposes over the API; return violations"""
+    from indexes import sort_value
+
+    problems = []
+    listings = {}
+    for sort in ("name", "age", "created_at"):
+        users, cursor = [], None
+        while True:
+            path = f"/users?sort={sort}&per_page=500" + (f"&cursor={cursor}" if cursor else "")
+            status, data = client.request("GET", path)
+            if status != 200:
+                problems.append(f"GET {path} -> {status}")
+                break
+            users.extend(data["data"]["users"])
+            cursor = data["data"].get("next_cursor")
+            if not cursor:
+                break
+        listings[sort] = users
+        values = [(sort_value(user.get(sort)), user["id"]) for user in users]
+        if values != sorted(values):
+            problems.append(f"listing sorted by {sort} is out of order")
+
+    users = listings["name"]
+    ids = [user["id"] for user in users]
+    if len(set(ids)) != len(ids):
+        problems.append("duplicate user ids")
+    if len({user["email"] for user in users}) != len(users):
+        problems.append("duplicate emails")
+    if any({user["id"] for user in listing} != set(ids) for listing in listings.values()):
+        problems.append("sort indexes disagree about which users exist")
+    _, health = client.request("GET", "/health")
+    if health["data"]["stats"]["total_users"] != len(users):
+        problems.append(f"aggregate total {health['data']['stats']['total_users']} != {len(users)} listed")
+    return problems
+
+
+def percentile(values, fraction):
+    return values[min(int(fraction * len(values)), len(values) - 1)] if values else 0.0
+
+
+def report(latencies, statuses, failures, elapsed, problems):
+    """Print throughput, statuses, latency percentiles and invariant results"""
+    total = sum(len(values) for values in latencies.values())
+    print(f"📊 {total:,} requests in {elapsed:.1f}s ({total / elapsed:,.0f} req/s)")
+    print(f"   statuses: {dict(sorted(statuses.items()))}")
+    print(f"   {'operation':10} {'count':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for op, values in sorted(latencies.items()):
+        values.sort()
+        row = [percentile(values, p) * 1000 for p in (0.5, 0.95, 0.99)] + [(values[-1] if values else 0) * 1000]
+        print(f"   {op:10} {len(values):8,} " + " ".join(f"{v:8.2f}" for v in row))
+    for failure in failures[:10]:
+        print(f"   ❌ {failure}")
+    for problem in problems:
+        print(f"   ❌ invariant: {problem}")
+    if not failures and not problems:
+        print("   ✅ no unexpected responses; all invariants hold")
+
+
+def soak(app=None, store=None, threads=8, duration=10.0, seed=0, mix=None):
+    """Soak an in-process app; return (latencies, statuses, failures, problems, elapsed)"""
+    mix = mix or DEFAULT_MIX
+    start = time.monotonic()
+    latencies, statuses, failures = run_threads(lambda: LocalClient(app), threads, duration, seed, mix)
+    elapsed = time.monotonic() - start
+    return latencies, statuses, failures, check_invariants(store), elapsed
+
+
+def parse_mix(value):
+    """Parse 'create=2,get=5' into operation weights"""
+    mix = {}
+    for item in value.split(','):
+        op, _, weight = item.partition('=')
+        if op.strip() not in EXPECTED_STATUSES:
+            raise argparse.ArgumentTypeError(f"unknown operation '{op}'")
+        mix[op.strip()] = float(weight or 1)
+    return mix
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Soak the API with concurrent random CRUD")
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--processes', type=int, default=1,
+                        help="client processes (only with --url)")
+    parser.add_argument('--duration', type=float, default=30, help="seconds to run")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--mix', type=parse_mix, default=DEFAULT_MIX,
+                        help="operation weights like create=2,get=5,update=2,patch=1,delete=1,list=1")
+    parser.add_argument('--url', help="soak a running server instead of an in-process app")
+    parser.add_argument('--dataset', default='synthetic-1000',
+                        help="dataset loaded before an in-process soak")
+    args = parser.parse_args(argv)
+
+    if args.url:
+        start = time.monotonic()
+        jobs = [(args.url, args.threads, args.duration, args.seed + i, args.mix)
+                for i in range(args.processes)]
+        if args.processes > 1:
+            with multiprocessing.Pool(args.processes) as pool:
+                latencies, statuses, failures = merge(pool.map(_http_process, jobs))
+        else:
+            latencies, statuses, failures = _http_process(jobs[0])
+        elapsed = time.monotonic() - start
+        problems = check_api_invariants(HTTPClient(args.url))
+    else:
+        from app import create_app, get_state
+        application = create_app({'DATASET': args.dataset})
+        latencies, statuses, failures, problems, elapsed = soak(
+            application, get_state(application).store, args.threads, args.duration, args.seed, args.mix
+        )
+
+    report(latencies, statuses, failures, elapsed, problems)
+    return 1 if failures or problems else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
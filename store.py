@@ -0,0 +1,545 @@
+#!/usr/bin/env python3
+"""
+Versioned user store for the User Management REST API
+
+Writers take the store lock, change the live structures and then publish
+an immutable Snapshot of the new version. Readers only ever look at a
+published snapshot, so they never take the lock, never block writers and
+never see a dict change size under them. Each snapshot carries a frozen
+copy of the aggregates, so totals never show a write half applied.
+
+Publishing is cheap because everything is copy-on-write in chunks:
+records live in pages of 1024 ids and the sorted indexes in chunks of
+keys. A snapshot copies only the page/chunk directories; a writer copies
+a page or chunk the first time it touches one that a snapshot may share.
+Records themselves are never modified in place - an update stores a new
+dict - so a snapshot's records stay exactly as they were.
+
+Clients can pin a snapshot with a token to page through one consistent
+version. Unpinned old versions are freed as soon as nothing references
+them; pinned ones once their token expires or is released.
+
+With a record tier (see tiered.py) pages hold revision numbers instead of
+records, and the tier keeps hot records in memory and the rest on disk.
+"""
+
+import gc
+import secrets
+import threading
+import time
+import weakref
+from datetime import datetime
+
+from aggregates import AGGREGATED_FIELDS, UserAggregates
+from indexes import SORTABLE_FIELDS, SortedIndex
+
+# Records are grouped into pages of 2**PAGE_BITS consecutive ids
+PAGE_BITS = 10
+
+# Fields a client may change on an existing user
+UPDATABLE_FIELDS = ('name', 'email', 'age', 'department')
+
+# Pinned snapshots expire after this many idle seconds
+SNAPSHOT_TTL = 300
+
+# Upper bound on pinned snapshots; the least recently used is dropped first
+MAX_PINNED_SNAPSHOTS = 1000
+
+
+class DuplicateEmailError(ValueError):
+    """Another user already has this email"""
+
+
+class UserNotFoundError(KeyError):
+    """No user with this id"""
+
+
+class BatchError(Exception):
+    """A batch operation failed; the whole batch was rolled back"""
+
+    def __init__(self, position, cause):
+        super().__init__(f"operation {position} failed: {cause!r}")
+        self.position = position
+        self.cause = cause
+
+
+class Snapshot:
+    """Read-only view of the store at one version"""
+
+    __slots__ = ('version', 'pages', 'count', 'indexes', 'stats', 'tier', '__weakref__')
+
+    def __init__(self, version, pages, count, indexes, stats, tier=None):
+        self.version = version
+        self.pages = pages
+        self.count = count
+        self.indexes = indexes
+        # Aggregates as of this version (UserAggregates.to_dict())
+        self.stats = stats
+        self.tier = tier
+
+    def __len__(self):
+        return self.count
+
+    def get(self, user_id):
+        """Return the user with this id, or None"""
+        page = self.pages.get(user_id >> PAGE_BITS)
+        if page is None:
+            return None
+        value = page.get(user_id)
+        if self.tier is None or value is None:
+            return value
+        return self.tier.fetch(user_id, value)
+
+    def __iter__(self):
+        if self.tier is None:
+            for page in self.pages.values():
+                yield from page.values()
+            return
+        fetch = self.tier.fetch
+        for page in self.pages.values():
+            for user_id, rev in list(page.items()):
+                yield fetch(user_id, rev)
+
+    def users(self, offset, limit):
+        """Return up to `limit` users in id order, skipping `offset`"""
+        if limit <= 0:
+            return []
+        result = []
+        for page in self.pages.values():
+            if offset >= len(page):
+                offset -= len(page)
+                continue
+            for item in page.items():
+                if offset:
+                    offset -= 1
+                    continue
+                result.append(item)
+                if len(result) == limit:
+                    break
+            if len(result) == limit:
+                break
+        if self.tier is None:
+            return [user for _, user in result]
+        return [self.tier.fetch(user_id, rev) for user_id, rev in result]
+
+
+class UserStore:
+    """All users plus their sorted indexes and aggregates"""
+
+    def __init__(self, tier=None):
+        self.tier = tier
+        self._snapshots = weakref.WeakSet()
+        self._lock = threading.RLock()
+        self._pin_lock = threading.Lock()
+        self._pinned = {}
+        self.indexes = {field: SortedIndex(field) for field in SORTABLE_FIELDS}
+        self.stats = UserAggregates()
+        self._reset_records()
+        self.version = 0
+        self._publish()
+
+    def _reset_records(self):
+        self._pages = {}
+        self._page_owner = {}
+        self._gen = 0
+        self._count = 0
+        self._emails = {}
+        self.next_id = 1
+
+    # Reads
+
+    def snapshot(self):
+        """Return the latest published snapshot (never blocks)"""
+        return self._current
+
+    def get(self, user_id):
+        """Return the current version of a user, or None"""
+        return self._current.get(user_id)
+
+    # Writes
+
+    def create(self, data):
+        """Store a new user built from validated data and return it"""
+        with self._lock:
+            user = self._create(data)
+            self._publish()
+            return user
+
+    def create_many(self, records):
+        """Create users from validated records under one lock and one publish.
+
+        Returns (created, failures) where failures lists (position, error)
+        for records rejected because their email is already taken.
+        """
+        with self._lock:
+            created = []
+            failures = []
+            for position, data in enumerate(records):
+                try:
+                    created.append(self._create(data))
+                except DuplicateEmailError as e:
+                    failures.append((position, e))
+            if created:
+                self._publish()
+            return created, failures
+
+    def update(self, user_id, changes):
+        """Apply validated field changes to a user and return the new version"""
+        with self._lock:
+            user = self._update(user_id, changes)
+            self._publish()
+            return user
+
+    def patch(self, user_id, patch):
+        """Apply a validated JSON Merge Patch; return (user, changed_fields).
+
+        Only fields whose value actually changes are written (null removes
+        one), so only their indexes and aggregates are touched. A patch that
+        changes nothing returns the current record without a new version.
+        """
+        with self._lock:
+            old = self._get_live(user_id)
+            if old is None:
+                raise UserNotFoundError(user_id)
+            changed = [field for field in UPDATABLE_FIELDS
+                       if field in patch and patch[field] != old.get(field)]
+            if not changed:
+                return old, changed
+            email = patch.get('email', old['email'])
+            if email != old['email'] and email in self._emails:
+                raise DuplicateEmailError(email)
+
+            user = dict(old)
+            for field in changed:
+                if patch[field] is None:
+                    del user[field]
+                else:
+                    user[field] = patch[field]
+            user['updated_at'] = datetime.now().isoformat()
+            self._replace(old, user)
+            self._publish()
+            return user, changed
+
+    def delete(self, user_id):
+        """Remove a user and return the deleted record"""
+        with self._lock:
+            user = self._delete(user_id)
+            self._publish()
+            return user
+
+    def batch(self, operations):
+        """Apply (op, user_id, data) operations atomically; return (results, version).
+
+        op is 'create', 'update' or 'delete'. Everything runs under a single
+        lock acquisition and is published as one new version. If any
+        operation fails, the ones before it are undone and BatchError is
+        raised, leaving the store exactly as it was.
+        """
+        with self._lock:
+            undo = []
+            next_id = self.next_id
+            results = []
+            for position, (op, user_id, data) in enumerate(operations):
+                try:
+                    if op == 'create':
+                        user = self._create(data)
+                        undo.append(('create', user))
+                    elif op == 'update':
+                        old = self._get_live(user_id)
+                        user = self._update(user_id, data)
+                        undo.append(('update', old))
+                    elif op == 'delete':
+                        user = self._delete(user_id)
+                        undo.append(('delete', user))
+                    else:
+                        raise ValueError(f"Unknown operation '{op}'")
+                except Exception as e:
+                    self._rollback(undo)
+                    self.next_id = next_id
+                    if isinstance(e, (KeyError, ValueError)):
+                        raise BatchError(position, e) from e
+                    raise
+                results.append(user)
+            if operations:
+                self._publish()
+            return results, self.version
+
+    def load(self, users):
+        """Replace every user at once, rebuilding indexes and aggregates in bulk.
+
+        Records without an id are numbered after the highest existing one
+        and missing timestamps are filled in. Raises ValueError on ids that
+        aren't positive integers and on duplicate ids or emails, leaving the
+        store unchanged.
+        """
+        # Bulk loads allocate millions of objects that all stay alive, so the
+        # cyclic GC would only rescan them over and over
+        gc_was_enabled = gc.isenabled()
+        gc.disable()
+        try:
+            now = datetime.now().isoformat()
+            ids = [user['id'] for user in users if 'id' in user]
+            for user_id in ids:
+                # The exact class test also rejects bool
+                if user_id.__class__ is not int or user_id < 1:
+                    raise ValueError(f"Dataset contains an invalid user ID {user_id!r}; "
+                                     "IDs must be positive integers")
+            next_id = max(ids, default=0) + 1
+            for user in users:
+                if 'id' not in user:
+                    user['id'] = next_id
+                    next_id += 1
+                if 'created_at' not in user:
+                    user['created_at'] = now
+                    user['updated_at'] = now
+                user.setdefault('department', '')
+
+            users = sorted(users, key=lambda user: user['id'])
+            emails = {user['email']: user['id'] for user in users}
+            if len(emails) != len(users):
+                raise ValueError("Dataset contains duplicate emails")
+
+            pages = {}
+            for user in users:
+                pages.setdefault(user['id'] >> PAGE_BITS, {})[user['id']] = user
+            if sum(len(page) for page in pages.values()) != len(users):
+                raise ValueError("Dataset contains duplicate user IDs")
+            if self.tier is not None:
+                revs = iter(self.tier.put_many(users))
+                pages = {page_no: {user_id: next(revs) for user_id in page}
+                         for page_no, page in pages.items()}
+
+            with self._lock:
+                if self.tier is not None:
+                    for page in self._pages.values():
+                        for user_id, rev in page.items():
+                            self.tier.retire(user_id, rev, self.version + 1)
+                self._reset_records()
+                self._pages = pages
+                self._page_owner = dict.fromkeys(pages, self._gen)
+                self._count = len(users)
+                self._emails = emails
+                self.next_id = next_id
+                for index in self.indexes.values():
+                    index.bulk_load(users)
+                self.stats.rebuild(users)
+                self._publish()
+        finally:
+            if gc_was_enabled:
+                gc.enable()
+
+    def _create(self, data):
+        if data['email'] in self._emails:
+            raise DuplicateEmailError(data['email'])
+        now = datetime.now().isoformat()
+        user = {
+            "id": self.next_id,
+            "name": data['name'],
+            "email": data['email'],
+            "age": data['age'],
+            "department": data.get('department', ''),
+            "created_at": now,
+            "updated_at": now
+        }
+        self.next_id += 1
+        self._insert(user)
+        return user
+
+    def _insert(self, user, restore=False):
+        user_id = user['id']
+        page = self._writable_page(user_id >> PAGE_BITS, create=True)
+        page[user_id] = self._page_value(user)
+        if restore:
+            # Put a re-inserted record (and possibly its page) back in id order
+            ordered = sorted(page.items())
+            page.clear()
+            page.update(ordered)
+            self._pages = dict(sorted(self._pages.items()))
+        self._count += 1
+        self._emails[user['email']] = user_id
+        self.stats.add(user)
+        for index in self.indexes.values():
+            index.add(user)
+
+    def _get_live(self, user_id):
+        """Look a user up in the live (writer-side) pages; call under the lock"""
+        page = self._pages.get(user_id >> PAGE_BITS)
+        if page is None:
+            return None
+        value = page.get(user_id)
+        if self.tier is None or value is None:
+            return value
+        return self.tier.fetch(user_id, value)
+
+    def _page_value(self, user):
+        """What a page stores for a record: the record itself, or its tier revision"""
+        return user if self.tier is None else self.tier.put(user)
+
+    def _retire(self, page, user_id):
+        """Tell the tier a record version stops being current at the next version"""
+        if self.tier is not None:
+            self.tier.retire(user_id, page[user_id], self.version + 1)
+
+    def _update(self, user_id, changes):
+        old = self._get_live(user_id)
+        if old is None:
+            raise UserNotFoundError(user_id)
+        changes = {field: changes[field] for field in UPDATABLE_FIELDS if field in changes}
+        email = changes.get('email', old['email'])
+        if email != old['email'] and email in self._emails:
+            raise DuplicateEmailError(email)
+
+        user = dict(old)
+        user.update(changes)
+        user['updated_at'] = datetime.now().isoformat()
+        self._replace(old, user)
+        return user
+
+    def _replace(self, old, user):
+        """Swap one version of a record for another, keeping its position"""
+        user_id = old['id']
+        page = self._writable_page(user_id >> PAGE_BITS)
+        self._retire(page, user_id)
+        page[user_id] = self._page_value(user)
+        if user['email'] != old['email']:
+            del self._emails[old['email']]
+            self._emails[user['email']] = user_id
+        # Every write moves last_modified, but only the aggregates and
+        # indexes over changed fields need touching
+        self.stats.touch()
+        if any(user.get(field) != old.get(field) for field in AGGREGATED_FIELDS):
+            self.stats.remove(old)
+            self.stats.add(user)
+        for field, index in self.indexes.items():
+            if user.get(field) != old.get(field):
+                index.remove(old)
+                index.add(user)
+
+    def _rollback(self, undo):
+        """Undo batch operations, newest first"""
+        for action, user in reversed(undo):
+            if action == 'create':
+                self._delete(user['id'])
+            elif action == 'update':
+                self._replace(self._get_live(user['id']), user)
+            else:
+                self._insert(user, restore=True)
+
+    def _delete(self, user_id):
+        user = self._get_live(user_id)
+        if user is None:
+            raise UserNotFoundError(user_id)
+        page_no = user_id >> PAGE_BITS
+        page = self._writable_page(page_no)
+        self._retire(page, user_id)
+        del page[user_id]
+        if not page:
+            del self._pages[page_no]
+            del self._page_owner[page_no]
+        self._count -= 1
+        del self._emails[user['email']]
+        self.stats.remove(user)
+        for index in self.indexes.values():
+            index.remove(user)
+        return user
+
+    def _writable_page(self, page_no, create=False):
+        """Return a page the writer may modify, copying it if a snapshot shares it"""
+        page = self._pages.get(page_no)
+        if page is None:
+            if not create:
+                return None
+            page = self._pages[page_no] = {}
+            self._page_owner[page_no] = self._gen
+        elif self._page_owner[page_no] != self._gen:
+            page = self._pages[page_no] = dict(page)
+            self._page_owner[page_no] = self._gen
+        return page
+
+    def _publish(self):
+        """Make the current state visible to readers as a new snapshot"""
+        self.version += 1
+        self._current = Snapshot(
+            self.version,
+            dict(self._pages),
+            self._count,
+            {field: index.freeze() for field, index in self.indexes.items()},
+            self.stats.to_dict(),
+            self.tier
+        )
+        # Every page is now shared with that snapshot
+        self._gen += 1
+        if self.tier is not None:
+            self._snapshots.add(self._current)
+            if self.tier.should_vacuum():
+                self.vacuum()
+
+    def vacuum(self):
+        """Drop tiered record versions that no live snapshot can see any more"""
+        if self.tier is None:
+            return 0
+        oldest = min((snapshot.version for snapshot in list(self._snapshots)),
+                     default=self.version)
+        return self.tier.vacuum(oldest)
+
+    def close(self):
+        """Release the record tier's spill file, if any"""
+        if self.tier is not None:
+            self.tier.close()
+
+    def storage_stats(self):
+        """Record storage mode and, when tiered, hit rate and fault latency"""
+        if self.tier is None:
+            return {"mode": "memory"}
+        return self.tier.stats()
+
+    # Pinned snapshots
+
+    def pin(self, snapshot=None):
+        """Pin a snapshot (the latest by default) and return its token"""
+        if snapshot is None:
+            snapshot = self._current
+        token = f"{snapshot.version}.{secrets.token_urlsafe(9)}"
+        with self._pin_lock:
+            self._expire_pins()
+            if len(self._pinned) >= MAX_PINNED_SNAPSHOTS:
+                oldest = min(self._pinned, key=lambda t: self._pinned[t][1])
+                del self._pinned[oldest]
+            self._pinned[token] = [snapshot, time.monotonic() + SNAPSHOT_TTL]
+        return token
+
+    def pinned(self, token):
+        """Return the snapshot pinned under `token`, or None if unknown/expired"""
+        with self._pin_lock:
+            entry = self._pinned.get(token)
+            if entry is None:
+                return None
+            now = time.monotonic()
+            if entry[1] < now:
+                del self._pinned[token]
+                return None
+            entry[1] = now + SNAPSHOT_TTL
+            return entry[0]
+
+    def release(self, token):
+        """Unpin a snapshot so its version can be freed; False if unknown"""
+        with self._pin_lock:
+            return self._pinned.pop(token, None) is not None
+
+    def pin_stats(self):
+        """Pinned snapshot counts for /health"""
+        with self._pin_lock:
+            self._expire_pins()
+            pinned = len(self._pinned)
+            versions = {entry[0].version for entry in self._pinned.values()}
+        return {
+            "version": self.version,
+            "pinned_snapshots": pinned,
+            "pinned_versions": len(versions),
+            "oldest_pinned_version": min(versions) if versions else None
+        }
+
+    def _expire_pins(self):
+        now = time.monotonic()
+        for token in [t for t, entry in self._pinned.items() if entry[1] < now]:
+            del self._pinned[token]
@@ -7,6 +7,13 @@ Tests API functionality and Flask concepts
 import json
 from datetime import datetime
 
+def get_test_client():
+    """Return a Flask test client with the sample data freshly loaded"""
+    from app import app
+    client = app.test_client()
+    client.post('/reset')
+    return client
+
 def test_flask_concepts():
     """Test understanding of Flask concepts"""
     print("🧪 Testing Flask Concepts...")
@@ -146,9 +153,15 @@ def test_http_status_codes():
         },
         {
             "request": "PATCH /users/1",
+            "condition": "Prefer: return=minimal",
+            "status": 204,
+            "description": "No Content - User updated, body omitted"
+        },
+        {
+            "request": "DELETE /users",
             "condition": "Method not supported",
             "status": 405,
-            "description": "Method Not Allowed - Only PUT supported"
+            "description": "Method Not Allowed - Only GET and POST on the collection"
         }
     ]
 
@@ -242,6 +255,1012 @@ def test_memory_storage():
     print(f"\n📊 Final storage state: {len(users_db)} users")
     print("✅ Memory storage test passed!")
 
+def test_sorted_listing():
+    """Test sorted listing and cursor paging backed by the sort indexes"""
+    print("\n🧪 Testing Sorted Listing...")
+
+    client = get_test_client()
+    for i, (name, age) in enumerate([("Zoe", 41), ("Adam", 19), ("Liam", 35)]):
+        client.post('/users', json={"name": name, "email": f"sort{i}@example.com", "age": age})
+
+    data = client.get('/users?sort=name&per_page=100').get_json()['data']
+    names = [user['name'] for user in data['users']]
+    assert names == sorted(names), names
+    print(f"   ✅ sort=name -> {names}")
+
+    data = client.get('/users?sort=-age&per_page=100').get_json()['data']
+    ages = [user['age'] for user in data['users']]
+    assert ages == sorted(ages, reverse=True), ages
+    print(f"   ✅ sort=-age -> {ages}")
+
+    # Walk the whole listing two users at a time with cursors
+    seen = []
+    response = client.get('/users?sort=age&per_page=2').get_json()['data']
+    seen.extend(user['age'] for user in response['users'])
+    while response['next_cursor']:
+        response = client.get(f"/users?cursor={response['next_cursor']}&per_page=2").get_json()['data']
+        seen.extend(user['age'] for user in response['users'])
+    assert seen == sorted(ages), seen
+    print(f"   ✅ cursor paging -> {seen}")
+
+    # Updates and deletes keep the indexes in step
+    client.put("/users/1", json={"name": "John Doe", "email": "john.doe@example.com", "age": 99})
+    client.delete('/users/2')
+    data = client.get('/users?sort=-age&per_page=1').get_json()['data']
+    assert data['users'][0]['id'] == 1 and data['total'] == 5
+    print("   ✅ indexes updated on PUT/DELETE")
+
+    assert client.get('/users?sort=password').status_code == 400
+    assert client.get('/users?cursor=not-a-cursor').status_code == 400
+    from indexes import encode_cursor
+    for key in ([0, "abc", 1], [1, 5, 1], [0, [1], 1], [1, "a", "1"], [7, 0, 1], [True, 1, 1], [0, {}, None]):
+        response = client.get(f"/users?cursor={encode_cursor('age', False, key)}")
+        assert response.status_code == 400, (key, response.status_code)
+    assert client.get(f"/users?cursor={encode_cursor('age', 'x', [0, 1, 1])}").status_code == 400
+    print("   ✅ invalid sort field and cursor rejected")
+
+    print("✅ Sorted listing test passed!")
+
+def test_aggregates():
+    """Test incrementally maintained aggregates and HEAD /users"""
+    print("\n🧪 Testing Aggregates...")
+
+    client = get_test_client()
+    client.post('/users', json={"name": "Ann", "email": "ann@example.com", "age": 50, "department": "Sales"})
+    client.delete('/users/2')
+
+    stats = client.get('/health').get_json()['data']['stats']
+    assert stats['total_users'] == 3
+    assert stats['departments'] == {"Engineering": 1, "Sales": 2}
+    assert stats['age'] == {"min": 28, "max": 50, "sum": 110, "average": 36.67}
+    print(f"   ✅ /health stats: {stats['departments']} ages {stats['age']}")
+
+    response = client.head('/users')
+    assert response.status_code == 200
+    assert response.headers['X-Total-Count'] == '3' and response.data == b''
+    print("   ✅ HEAD /users -> X-Total-Count: 3")
+
+    data = client.get('/users?page=2&per_page=2').get_json()['data']
+    assert data['total'] == 3 and data['pages'] == 2 and len(data['users']) == 1
+    print("   ✅ list totals and page counts read from aggregates")
+
+    print("✅ Aggregates test passed!")
+
+def test_schema_validation():
+    """Test the schema validator, batch mode and API error format"""
+    print("\n🧪 Testing Schema Validation...")
+    from validation import user_validator
+
+    valid_user = {"name": "John Doe", "email": "john@example.com", "age": 25}
+    assert user_validator.validate(valid_user) == {}
+    assert user_validator.validate({"age": 0, "name": "Baby", "email": "b@example.org"}) == {}
+
+    errors = user_validator.validate({"name": "", "email": "a@b", "age": True})
+    assert set(errors) == {"name", "email", "age"}, errors
+    for email in ["a@b", "@example.com", "a@@example.com", "a b@example.com", "a@example."]:
+        assert "email" in user_validator.validate({"name": "x", "email": email, "age": 1}), email
+    print(f"   ✅ per-field errors: {errors}")
+
+    # Updates only check the fields that are present
+    assert user_validator.validate({"age": 30}, partial=True) == {}
+    assert user_validator.validate({"age": -1}, partial=True) == {"age": ["Age must be a positive integer"]}
+    assert user_validator.validate(["not", "a", "dict"]) == {"_body": ["Request body must be a JSON object"]}
+    # ...but a required field that is present as null or "" is rejected, not skipped
+    assert user_validator.validate({"email": None}, partial=True) == {"email": ["'email' is required"]}
+    assert set(user_validator.validate({"name": None, "age": None}, partial=True)) == {"name", "age"}
+    # Optional strings may be "" on create and update alike, but not set to null
+    assert user_validator.validate({"department": ""}, partial=True) == {}
+    assert user_validator.validate(dict(valid_user, department="")) == {}
+    assert user_validator.validate({"department": None}, partial=True) == {"department": ["'department' must be a string"]}
+    assert user_validator.validate({"department": 5}, partial=True) == {"department": ["'department' must be a string"]}
+
+    # The compiled all-valid check agrees with the per-field rules everywhere
+    import itertools
+    from validation import _ABSENT
+    values = [_ABSENT, None, "", "x", "j@example.com", "j@example", 0, 7, -1, True, 1.5]
+    for partial in (False, True):
+        check = user_validator._is_valid_partial if partial else user_validator._is_valid
+        for combo in itertools.product(values, repeat=4):
+            data = {name: value for name, value in zip(user_validator.fields, combo) if value is not _ABSENT}
+            assert check(data) == (user_validator._errors(data, partial) == {}), (data, partial)
+    print(f"   ✅ compiled check matches the field rules on {2 * len(values) ** 4:,} records")
+
+    batch = [valid_user, {"name": "x"}, valid_user, "oops"]
+    failures = user_validator.validate_many(batch)
+    assert [position for position, _ in failures] == [1, 3]
+    assert set(failures[0][1]) == {"email", "age"}
+    print(f"   ✅ validate_many flagged records {[p for p, _ in failures]} of {len(batch)}")
+
+    client = get_test_client()
+    response = client.post('/users', json={"name": "Bad", "email": "bad@", "age": "20"})
+    body = response.get_json()
+    assert response.status_code == 400
+    assert body['errors'] == {"email": ["Invalid email format"], "age": ["Age must be a positive integer"]}
+    print(f"   ✅ API returns structured errors: {body['errors']}")
+
+    response = client.put('/users/1', json={"age": 29})
+    assert response.status_code == 200 and response.get_json()['data']['age'] == 29
+    print("   ✅ partial PUT accepted")
+
+    for body in ({"email": None}, {"email": ""}, {"name": None}, {"name": ""}, {"name": None, "age": None}):
+        assert client.put('/users/1', json=body).status_code == 400, body
+        assert client.patch('/users/1', json=body).status_code == 400, body
+        response = client.post('/batch', json={"operations": [{"op": "update", "id": 1, "data": body}]})
+        assert response.status_code == 400, body
+    user = client.get('/users/1').get_json()['data']
+    assert user['name'] and user['email'] and user['age'] == 29
+    print("   ✅ null and empty name/email rejected by PUT, PATCH and batch updates")
+
+    assert client.put('/users/1', json={"department": ""}).get_json()['data']['department'] == ""
+    assert client.patch('/users/2', json={"department": ""}).status_code == 200
+    response = client.post('/batch', json={"operations": [{"op": "update", "id": 3, "data": {"department": ""}}]})
+    assert response.status_code == 200
+    assert client.get('/health').get_json()['data']['stats']['departments'].get('') == 3
+    print("   ✅ empty department accepted by PUT, PATCH and batch updates")
+
+    print("✅ Schema validation test passed!")
+
+def test_datasets():
+    """Test the synthetic generator, seed file loaders and /reset datasets"""
+    print("\n🧪 Testing Datasets...")
+    import os
+    import tempfile
+    import datasets
+
+    first = list(datasets.generate_users(500, seed=7, departments={"Ops": 1, "Data": 3}, age_min=20, age_max=30))
+    again = list(datasets.generate_users(500, seed=7, departments={"Ops": 1, "Data": 3}, age_min=20, age_max=30))
+    assert first == again
+    assert {user['department'] for user in first} == {"Ops", "Data"}
+    assert all(20 <= user['age'] <= 30 for user in first)
+    assert len({user['email'] for user in first}) == 500
+    print("   ✅ generator is deterministic and honours distributions")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        datasets.write_ndjson(os.path.join(tmp, "team.ndjson"), first)
+        datasets.write_csv(os.path.join(tmp, "team.csv"), first)
+        assert datasets.read_ndjson(os.path.join(tmp, "team.ndjson"), block_size=1000) == first
+        assert datasets.read_csv(os.path.join(tmp, "team.csv")) == first
+        print("   ✅ NDJSON and CSV round trip")
+
+        # Joining a block with ',' must not turn one malformed line into two records
+        with open(os.path.join(tmp, "two-per-line.ndjson"), "w") as f:
+            f.write('{"name": "A"}\n{"name": "B"},{"name": "C"}\n{"name": "D"}\n')
+        try:
+            datasets.read_ndjson(os.path.join(tmp, "two-per-line.ndjson"))
+            raise AssertionError("two values on one line were accepted")
+        except ValueError:
+            pass
+        print("   ✅ a line holding two records is rejected")
+
+        with open(os.path.join(tmp, "string-id.ndjson"), "w") as f:
+            f.write('{"id": "5", "name": "S", "email": "s@example.com", "age": 1}\n')
+        with open(os.path.join(tmp, "no-id.csv"), "w") as f:
+            f.write("name,email,age\nA,a@example.com,1\nB,b@example.com,2\n")
+        with open(os.path.join(tmp, "bad-id.csv"), "w") as f:
+            f.write("id,name,email,age\nx,A,a@example.com,1\n")
+
+        client = get_test_client()
+        old_dir = datasets.DATASET_DIR
+        datasets.DATASET_DIR = tmp
+        try:
+            bad = [client.post(f'/reset?dataset={name}') for name in ("string-id", "bad-id")]
+            numbered = client.post('/reset?dataset=no-id').get_json()['data']
+            data = client.post('/reset', json={"dataset": "team"}).get_json()['data']
+        finally:
+            datasets.DATASET_DIR = old_dir
+        assert [response.status_code for response in bad] == [400, 400]
+        assert "positive integers" in bad[0].get_json()['message']
+        assert numbered['total_users'] == 2
+        assert data == {"total_users": 500, "dataset": "team"}
+        assert client.get('/users/500').get_json()['data']['email'] == first[-1]['email']
+        print("   ✅ /reset restored the 'team' seed file; bad ids are a 400, missing ids numbered")
+
+    assert client.post('/reset?dataset=synthetic-50').get_json()['data']['total_users'] == 50
+    new_user = client.post('/users', json={"name": "New", "email": "new@example.com", "age": 30}).get_json()['data']
+    assert new_user['id'] == 51
+    assert client.get('/users?sort=age&per_page=100').get_json()['data']['total'] == 51
+    assert client.post('/reset?dataset=nope').status_code == 404
+    assert client.post('/reset?dataset=synthetic-1000000000').status_code == 400
+    assert client.post('/reset?dataset=synthetic-100001').status_code == 400
+    assert client.get('/users?per_page=100').get_json()['data']['total'] == 51
+    assert client.post('/reset').get_json()['data']['total_users'] == 3
+    print("   ✅ synthetic-N (capped), unknown and default datasets")
+
+    print("✅ Datasets test passed!")
+
+def test_snapshots():
+    """Test pinned MVCC snapshots for consistent paging during writes"""
+    print("\n🧪 Testing Snapshots...")
+    import random
+    from store import UserStore
+
+    # Copy-on-write: a snapshot must not change while the store does
+    store = UserStore()
+    store.load([{"name": f"U{i}", "email": f"u{i}@example.com", "age": i % 60} for i in range(3000)])
+    snapshot = store.snapshot()
+    before = [dict(user) for user in snapshot]
+    before_by_age = snapshot.indexes['age'].page(5000)
+    rng = random.Random(1)
+    for i in range(2000):
+        user_id = rng.randint(1, store.next_id - 1)
+        if store.get(user_id) is None:
+            continue
+        action = rng.choice(["update", "delete", "create"])
+        if action == "update":
+            store.update(user_id, {"age": rng.randint(0, 90), "name": f"N{i}"})
+        elif action == "delete":
+            store.delete(user_id)
+        else:
+            store.create({"name": f"C{i}", "email": f"c{i}@example.com", "age": 40})
+    assert [dict(user) for user in snapshot] == before and len(snapshot) == 3000
+    assert snapshot.indexes['age'].page(5000) == before_by_age
+    latest = store.snapshot()
+    assert latest.version > snapshot.version
+    assert latest.indexes['age'].page(10 ** 6) == [
+        user['id'] for user in sorted(latest, key=lambda u: (u['age'], u['id']))
+    ]
+    print(f"   ✅ snapshot v{snapshot.version} unchanged after writes up to v{latest.version}")
+
+    client = get_test_client()
+    first = client.get('/users?snapshot=new&per_page=2').get_json()['data']
+    token = first['snapshot']
+    client.delete('/users/1')
+    client.post('/users', json={"name": "Late", "email": "late@example.com", "age": 44})
+    second = client.get(f'/users?snapshot={token}&page=2&per_page=2').get_json()['data']
+    ids = [user['id'] for user in first['users'] + second['users']]
+    assert ids == [1, 2, 3] and second['total'] == 3 and second['version'] == first['version']
+    print(f"   ✅ pinned paging saw ids {ids} despite a concurrent delete and create")
+
+    live = client.get('/users?per_page=10').get_json()['data']
+    assert [user['id'] for user in live['users']] == [2, 3, 4]
+    assert client.head(f'/users?snapshot={token}').headers['X-Total-Count'] == '3'
+
+    assert client.delete(f'/snapshots/{token}').status_code == 200
+    assert client.get(f'/users?snapshot={token}').status_code == 410
+    assert client.get('/health').get_json()['data']['store']['pinned_snapshots'] == 0
+    print("   ✅ released snapshot is gone (410) and no longer pinned")
+
+    # An empty snapshot is still the one that gets pinned, and it keeps its
+    # own frozen aggregates
+    store = UserStore()
+    empty = store.snapshot()
+    store.create({"name": "A", "email": "a@example.com", "age": 1})
+    assert store.pinned(store.pin(empty)) is empty
+    assert empty.stats['total_users'] == 0 and store.snapshot().stats['total_users'] == 1
+    for query in ('per_page=0', 'per_page=-1', 'page=0', 'page=-2&per_page=5'):
+        assert client.get(f'/users?{query}').status_code == 400, query
+    print("   ✅ empty snapshots pin correctly; non-positive page/per_page rejected")
+
+    print("✅ Snapshots test passed!")
+
+def test_batch():
+    """Test the atomic POST /batch endpoint"""
+    print("\n🧪 Testing Batch Operations...")
+
+    client = get_test_client()
+    response = client.post('/batch', json={"operations": [
+        {"op": "create", "data": {"name": "Ann", "email": "ann@example.com", "age": 30}},
+        {"op": "update", "id": 1, "data": {"email": "john@new.example.com"}},
+        {"op": "create", "data": {"name": "Old John", "email": "john.doe@example.com", "age": 60}},
+        {"op": "delete", "id": 2}
+    ]})
+    body = response.get_json()
+    assert response.status_code == 200, body
+    assert [r['status'] for r in body['data']['results']] == [201, 200, 201, 200]
+    assert body['data']['results'][2]['data']['id'] == 5
+    assert client.head('/users').headers['X-Total-Count'] == '4'
+    print(f"   ✅ mixed batch applied at version {body['data']['version']}")
+
+    before = client.get('/users?per_page=100').get_json()['data']['users']
+    stats_before = client.get('/health').get_json()['data']['stats']
+    response = client.post('/batch', json={"operations": [
+        {"op": "delete", "id": 1},
+        {"op": "update", "id": 3, "data": {"age": 77, "email": "moved@example.com"}},
+        {"op": "create", "data": {"name": "Dup", "email": "moved@example.com", "age": 20}}
+    ]})
+    assert response.status_code == 400
+    assert response.get_json()['errors'][0]['operation'] == 2
+    after = client.get('/users?per_page=100').get_json()['data']['users']
+    assert after == before
+    stats_after = client.get('/health').get_json()['data']['stats']
+    stats_before.pop('last_modified'), stats_after.pop('last_modified')
+    assert stats_after == stats_before
+    assert [u['id'] for u in client.get('/users?sort=age&per_page=100').get_json()['data']['users']] == [1, 4, 3, 5]
+    print("   ✅ failing batch rolled back records, indexes and aggregates")
+
+    response = client.post('/batch', json={"operations": [{"op": "delete", "id": 999}]})
+    assert response.status_code == 404
+    response = client.post('/batch', json={"operations": [{"op": "create", "data": {"name": "x"}}, {"op": "drop"}]})
+    assert response.status_code == 400 and len(response.get_json()['errors']) == 2
+    print("   ✅ unknown ids and malformed operations rejected")
+
+    print("✅ Batch test passed!")
+
+def test_serve_prefork():
+    """Test serve.py: read-only pre-fork replicas, graceful restart, shutdown"""
+    print("\n🧪 Testing Pre-fork Server...")
+    import os
+    import re
+    import signal
+    import subprocess
+    import sys
+    import urllib.error
+    import urllib.request
+
+    import app as api
+
+    replica = api.create_app({'READ_ONLY': True, 'DATASET': 'sample'}).test_client()
+    writes = [('post', '/users'), ('put', '/users/1'), ('patch', '/users/1'), ('delete', '/users/1'),
+              ('post', '/batch'), ('post', '/imports'), ('post', '/reset')]
+    for method, path in writes:
+        assert getattr(replica, method)(path, json={"age": 1}).status_code == 503, path
+    assert replica.get('/users/1').status_code == 200 and replica.head('/users').status_code == 200
+    print(f"   ✅ READ_ONLY app refuses all {len(writes)} write routes, still serves reads")
+
+    if not hasattr(os, 'fork'):
+        print("   ⏭️  fork() not available, skipping")
+        return
+
+    server = subprocess.Popen(
+        [sys.executable, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'serve.py'),
+         '--host', '127.0.0.1', '--port', '0', '--read-only', '--workers', '2',
+         '--dataset', 'synthetic-200'],
+        stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True
+    )
+    try:
+        port = None
+        while port is None:
+            line = server.stdout.readline()
+            assert line, "server exited before listening"
+            match = re.search(r':(\d+) \(2 read-only workers', line)
+            port = match and int(match.group(1))
+        url = f"http://127.0.0.1:{port}"
+
+        response = urllib.request.urlopen(url + '/users?per_page=1')
+        assert json.loads(response.read())['data']['total'] == 200
+        print(f"   ✅ 2 workers serving the preloaded dataset on port {port}")
+
+        request = urllib.request.Request(
+            url + '/users', data=json.dumps({"name": "D", "email": "dup@example.com", "age": 1}).encode(),
+            headers={"Content-Type": "application/json"}, method='POST')
+        for _ in range(4):
+            try:
+                urllib.request.urlopen(request)
+                raise AssertionError("a read-only replica accepted a write")
+            except urllib.error.HTTPError as e:
+                assert e.code == 503
+        print("   ✅ replicas refuse writes with 503 instead of splitting the store")
+
+        server.send_signal(signal.SIGHUP)
+        assert urllib.request.urlopen(url + '/health').status == 200
+        print("   ✅ still serving across a graceful restart")
+
+        server.send_signal(signal.SIGTERM)
+        assert server.wait(timeout=30) == 0
+        print("   ✅ graceful shutdown exited cleanly")
+    finally:
+        if server.poll() is None:
+            server.kill()
+        server.stdout.close()
+
+    # Several workers only as read-only replicas
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'serve.py')
+    refused = subprocess.run([sys.executable, script, '--workers', '2'],
+                             capture_output=True, text=True, timeout=30)
+    assert refused.returncode == 2 and 'requires --read-only' in refused.stderr
+    print("   ✅ --workers 2 without --read-only refused")
+
+    # Tiered storage never forks: one process, and replicas are refused
+    env = dict(os.environ, USER_STORE_TIER='tiered')
+    refused = subprocess.run([sys.executable, script, '--read-only'], env=env,
+                             capture_output=True, text=True, timeout=30)
+    assert refused.returncode == 2 and "can't be served with --read-only" in refused.stderr
+    # Both the default worker count and an explicit --workers 1 serve it
+    for workers in ([], ['--workers', '1']):
+        server = subprocess.Popen([sys.executable, script, '--host', '127.0.0.1', '--port', '0', *workers],
+                                  env=env, stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        try:
+            line = ''
+            while 'Listening' not in line:
+                line = server.stdout.readline()
+                assert line, "server exited before listening"
+            assert '(single process, backlog 2048' in line
+            port = int(re.search(r':(\d+) ', line).group(1))
+            url = f"http://127.0.0.1:{port}"
+            spill_file = json.loads(urllib.request.urlopen(url + '/health').read())['data']['storage']['spill_file']
+            assert os.path.exists(spill_file)
+
+            server.send_signal(signal.SIGTERM)
+            assert server.wait(timeout=30) == 0
+            assert not os.path.exists(spill_file)
+        finally:
+            if server.poll() is None:
+                server.kill()
+            server.stdout.close()
+    print("   ✅ tiered storage is served from a single process (default and --workers 1)")
+    print("   ✅ SIGTERM drained it and removed its spill file")
+
+    print("✅ Pre-fork server test passed!")
+
+def test_tiered_storage():
+    """Test tiered storage: bounded hot LRU with an on-disk spill file"""
+    print("\n🧪 Testing Tiered Storage...")
+    import os
+    import random
+    from store import UserStore
+    from tiered import TieredRecords
+
+    # Run the same writes against an all-in-memory and a tiered store
+    users = [{"name": f"U{i}", "email": f"u{i}@example.com", "age": i % 60} for i in range(3000)]
+    memory = UserStore()
+    tier = TieredRecords(max_bytes=64 * 1024)
+    tiered = UserStore(tier)
+    memory.load([dict(user) for user in users])
+    tiered.load([dict(user) for user in users])
+    snapshot = tiered.snapshot()
+    before = [dict(user) for user in snapshot]
+
+    # Timestamps differ between the two stores by a few microseconds
+    strip = lambda user: {k: v for k, v in user.items() if not k.endswith('_at')}
+    rng = random.Random(2)
+    for i in range(3000):
+        user_id = rng.randint(1, memory.next_id - 1)
+        if memory.get(user_id) is None:
+            continue
+        action = rng.choice(["update", "delete", "create", "get"])
+        changes = {"age": rng.randint(0, 90), "name": f"N{i}"}
+        for store in (memory, tiered):
+            if action == "update":
+                store.update(user_id, changes)
+            elif action == "delete":
+                store.delete(user_id)
+            elif action == "create":
+                store.create({"name": f"C{i}", "email": f"c{i}@example.com", "age": 40})
+        if action == "get":
+            assert strip(tiered.get(user_id)) == strip(memory.get(user_id))
+
+    assert [strip(u) for u in tiered.snapshot()] == [strip(u) for u in memory.snapshot()]
+    assert [dict(user) for user in snapshot] == before
+    assert tiered.stats.to_dict()['total_users'] == memory.stats.to_dict()['total_users']
+    print("   ✅ tiered store matches the in-memory store; old snapshot unchanged")
+
+    stats = tiered.storage_stats()
+    assert stats['hot_bytes'] <= stats['max_hot_bytes'] and stats['faults'] > 0
+    assert stats['spilled_records'] > 0 and 0 < stats['hit_rate'] < 1
+    print(f"   ✅ {stats['hot_records']} hot records, hit rate {stats['hit_rate']}, "
+          f"avg fault {stats['avg_fault_ms']}ms")
+
+    del snapshot
+    tiered.vacuum()
+    rows = tier._db.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+    assert rows <= tiered.snapshot().count and tier.stats()['pending_vacuum'] == 0
+    print(f"   ✅ superseded versions vacuumed ({rows} rows on disk)")
+
+    # Sizing a tiered store reads nothing from disk and leaves the LRU alone
+    from profiling import structure_sizes
+    before = tier.stats()
+    sizes = structure_sizes(tiered)
+    assert tier.stats() == before and sizes['email_index'] > 0
+    print("   ✅ memory report sized the tiered store without faulting records in")
+
+    tier.close()
+    assert not os.path.exists(tier.path)
+    assert memory.storage_stats() == {"mode": "memory"}
+
+    print("✅ Tiered storage test passed!")
+
+def test_tracing():
+    """Test per-request phase tracing, OTLP export and the slow-request log"""
+    print("\n🧪 Testing Request Tracing...")
+    import logging
+    import os
+    import tempfile
+    import threading
+    import app as api
+
+    client = get_test_client()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'traces.jsonl')
+        records = []
+        handler = logging.Handler()
+        handler.emit = records.append
+        logging.getLogger('user_api.slow').addHandler(handler)
+        api.tracer.path, api.tracer.slow_ms = path, 0
+        try:
+            response = client.post('/users', headers={"X-Request-ID": "req-42"},
+                                   json={"name": "Trace", "email": "trace@example.com", "age": 33})
+            assert response.status_code == 201 and response.headers['X-Request-ID'] == 'req-42'
+            generated = client.get('/users/1').headers['X-Request-ID']
+            assert len(generated) == 32
+            traceparent = "00-" + "ab" * 16 + "-" + "cd" * 8 + "-01"
+            client.get('/users?per_page=2', headers={"traceparent": traceparent})
+            # Requests only enqueued their traces; a background thread writes them
+            assert api.tracer.stats()['enqueued'] == 3 and api.tracer.stats()['dropped'] == 0
+            assert any(thread.name == 'trace-export' for thread in threading.enumerate())
+        finally:
+            api.tracer.path, api.tracer.slow_ms = None, 500.0
+            api.tracer.close()
+            logging.getLogger('user_api.slow').removeHandler(handler)
+
+        with open(path) as f:
+            traces = [json.loads(line)['resourceSpans'][0]['scopeSpans'][0]['spans'] for line in f]
+    assert len(traces) == 3
+    root, *phases = traces[0]
+    assert root['name'] == 'POST /users' and root['kind'] == 2
+    assert [p['name'] for p in phases] == ['parse', 'validate', 'store', 'serialize']
+    assert all(p['parentSpanId'] == root['spanId'] and p['traceId'] == root['traceId'] for p in phases)
+    assert int(root['startTimeUnixNano']) <= int(phases[0]['startTimeUnixNano'])
+    assert traces[2][0]['traceId'] == "ab" * 16 and traces[2][0]['parentSpanId'] == "cd" * 8
+    print(f"   ✅ OTLP spans exported: {[p['name'] for p in phases]}")
+
+    assert len(records) == 3
+    message = records[0].getMessage()
+    assert 'req-42' in message and '"validate"' in message and '"other"' in message
+    print("   ✅ slow requests logged with their phase breakdown")
+
+    print("✅ Tracing test passed!")
+
+def test_debug_endpoints():
+    """Test the guarded /debug/profile and /debug/memory endpoints"""
+    print("\n🧪 Testing Debug Endpoints...")
+    import re
+    import threading
+    import app as api
+
+    client = get_test_client()
+    assert client.get('/debug/memory').status_code == 404
+    api.app.config['DEBUG_TOKEN'] = 'secret'
+    try:
+        assert client.get('/debug/memory', headers={"X-Debug-Token": "wrong"}).status_code == 403
+        headers = {"X-Debug-Token": "secret"}
+        assert client.get('/debug/profile?seconds=0', headers=headers).status_code == 400
+        print("   ✅ disabled without USER_DEBUG_TOKEN, 403 on a wrong token")
+
+        stop = threading.Event()
+
+        def traffic():
+            other = api.app.test_client()
+            while not stop.is_set():
+                other.get('/users?sort=name')
+
+        worker = threading.Thread(target=traffic)
+        worker.start()
+        try:
+            response = client.get('/debug/profile?seconds=0.3&interval_ms=2', headers=headers)
+        finally:
+            stop.set()
+            worker.join()
+        assert response.status_code == 200 and response.mimetype == 'text/plain'
+        lines = response.get_data(as_text=True).splitlines()
+        assert lines and all(re.fullmatch(r'[^ ].* \d+', line) for line in lines)
+        assert any('get_all_users' in line for line in lines)
+        print(f"   ✅ profile captured {len(lines)} distinct stacks from live traffic")
+
+        # A pinned snapshot keeps the pages a later write replaced
+        api.store.pin()
+        client.put('/users/1', json={"name": "Pinned Away", "email": "john@example.com", "age": 31})
+        report = client.get('/debug/memory?trace_seconds=0.05&top=5', headers=headers).get_json()['data']
+        structures = report['structures']
+        assert {"records", "email_index", "sort_index:name", "aggregates", "pinned_pages",
+                "single_flight_calls"} <= set(structures)
+        assert all(size > 0 for size in structures.values())
+        assert report['tracemalloc']['window_seconds'] == 0.05 and len(report['tracemalloc']['top']) <= 5
+        import tracemalloc
+        assert not tracemalloc.is_tracing()
+
+        # Tracing is switched off again even when the report fails
+        from profiling import memory_report
+        original = tracemalloc.take_snapshot
+        tracemalloc.take_snapshot = lambda: 1 / 0
+        try:
+            memory_report(api.store, 5, 0.01)
+            raise AssertionError("memory_report should have failed")
+        except ZeroDivisionError:
+            pass
+        finally:
+            tracemalloc.take_snapshot = original
+        assert not tracemalloc.is_tracing()
+        print(f"   ✅ memory report: {structures}")
+    finally:
+        api.app.config['DEBUG_TOKEN'] = None
+
+    print("✅ Debug endpoints test passed!")
+
+def test_msgpack_negotiation():
+    """Test MessagePack content negotiation (JSON stays the default)"""
+    print("\n🧪 Testing MessagePack Negotiation...")
+    import formats
+
+    client = get_test_client()
+    response = client.get('/users/1')
+    assert response.mimetype == 'application/json'
+
+    # Malformed JSON is a client error on every route that reads a body
+    for method, path in (('post', '/users'), ('put', '/users/1'), ('patch', '/users/1'),
+                         ('post', '/batch'), ('post', '/imports')):
+        response = getattr(client, method)(path, data='{"name": ', content_type='application/json')
+        assert response.status_code == 400, (method, path, response.status_code)
+        assert response.get_json()['message'] == 'Malformed JSON body'
+    print("   ✅ malformed JSON gets 400 on POST, PUT, PATCH, batch and imports")
+
+    if not formats.msgpack_available():
+        response = client.get('/users/1', headers={"Accept": "application/msgpack"})
+        assert response.mimetype == 'application/json'
+        response = client.post('/users', data=b'\x80', content_type='application/msgpack')
+        assert response.status_code == 415
+        print("   ⏭️  msgpack not installed: JSON fallback and 415 for MessagePack bodies")
+        print("✅ MessagePack negotiation test passed!")
+        return
+
+    import msgpack
+    accept = {"Accept": "application/msgpack"}
+    response = client.get('/users/1', headers=accept)
+    assert response.mimetype == 'application/msgpack' and 'Accept' in response.vary
+    body = msgpack.unpackb(response.data, raw=False)
+    assert body['error'] is False and body['data'] == client.get('/users/1').get_json()['data']
+    print(f"   ✅ GET with Accept: application/msgpack ({len(response.data)} bytes)")
+
+    packed = msgpack.packb({"name": "Pack", "email": "pack@example.com", "age": 31})
+    response = client.post('/users', data=packed, content_type='application/msgpack', headers=accept)
+    created = msgpack.unpackb(response.data, raw=False)
+    assert response.status_code == 201 and created['data']['name'] == 'Pack'
+    response = client.put(f"/users/{created['data']['id']}", data=msgpack.packb({"age": 32}),
+                          content_type='application/msgpack')
+    assert response.mimetype == 'application/json' and response.get_json()['data']['age'] == 32
+    batch = msgpack.packb({"operations": [{"op": "delete", "id": created['data']['id']}]})
+    assert client.post('/batch', data=batch, content_type='application/msgpack').status_code == 200
+    print("   ✅ POST, PUT and batch accept MessagePack bodies")
+
+    response = client.post('/users', data=b'\xc1', content_type='application/msgpack', headers=accept)
+    assert response.status_code == 400 and msgpack.unpackb(response.data)['error'] is True
+    response = client.post('/users', data=msgpack.packb({"name": "X"}),
+                           content_type='application/msgpack', headers=accept)
+    assert response.status_code == 400 and 'email' in msgpack.unpackb(response.data)['errors']
+    print("   ✅ malformed and invalid bodies get the usual error envelope")
+
+    print("✅ MessagePack negotiation test passed!")
+
+def test_imports():
+    """Test background imports: upload, local path, progress, errors, cancellation"""
+    print("\n🧪 Testing Background Imports...")
+    import io
+    import os
+    import tempfile
+    import time
+    import app as api
+    from datasets import generate_users, write_ndjson
+
+    def wait(job_id):
+        for _ in range(500):
+            job = client.get(f'/imports/{job_id}').get_json()['data']
+            if job['status'] in ('completed', 'failed', 'cancelled'):
+                return job
+            time.sleep(0.01)
+        raise AssertionError(f"import {job_id} did not finish")
+
+    client = get_test_client()
+    with tempfile.TemporaryDirectory() as directory:
+        old_dir, old_chunk = api.app.config['IMPORT_DIR'], api.importer.chunk_size
+        api.app.config['IMPORT_DIR'], api.importer.chunk_size = directory, 100
+        try:
+            users = [dict(user, email=f"imported{user['id']}@example.com") for user in generate_users(450)]
+            users[10]['age'] = -1
+            users[20]['email'] = users[30]['email']
+            lines = [json.dumps(user) for user in users]
+            lines.insert(5, '{"name": broken')
+            # Two records on one line are one malformed line, not two records
+            lines.append(lines[-1].replace('imported450', 'extra1') + ',' + lines[-1].replace('imported450', 'extra2'))
+            with open(os.path.join(directory, 'batch.ndjson'), 'w') as f:
+                f.write('\n'.join(lines) + '\n')
+
+            response = client.post('/imports', json={"path": "batch.ndjson"})
+            assert response.status_code == 202
+            job = wait(response.get_json()['data']['id'])
+            assert job['status'] == 'completed' and job['progress'] == 1.0
+            assert job['processed'] == 452 and job['imported'] == 448 and job['rejected'] == 4
+            assert [error['record'] for error in job['errors']] == [6, 12, 32, 452]
+            assert 'email' in job['errors'][2]['errors'] and 'age' in job['errors'][1]['errors']
+            assert client.get('/users?per_page=1').get_json()['data']['total'] == 3 + 448
+            assert api.store.indexes['name'].freeze().page(1000).__len__() == 451
+            print(f"   ✅ path import: {job['imported']} imported, {job['rejected']} rejected "
+                  f"({job['records_per_second']:,} records/s)")
+
+            csv_body = "name,email,age,department\nCsv One,csv1@example.com,41,Ops\nCsv Two,csv2@example.com,x,Ops\n"
+            response = client.post('/imports', data={"file": (io.BytesIO(csv_body.encode()), 'people.csv')},
+                                   content_type='multipart/form-data')
+            job = wait(response.get_json()['data']['id'])
+            assert job['source'] == 'people.csv' and job['imported'] == 1 and job['rejected'] == 1
+            created = client.get('/users?sort=-created_at&per_page=1').get_json()['data']['users'][0]
+            assert created['email'] == 'csv1@example.com' and created['id'] == 452
+            print("   ✅ CSV upload imported through the store like POST /users")
+
+            assert client.post('/imports', json={"path": "../etc/passwd"}).status_code == 400
+            assert client.post('/imports', json={"path": "missing.ndjson"}).status_code == 404
+            assert client.get('/imports/nope').status_code == 404
+
+            write_ndjson(os.path.join(directory, 'big.ndjson'), (
+                dict(user, email=f"big{user['id']}@example.com") for user in generate_users(5000)))
+            with api.store._lock:
+                # The job blocks writing its first chunk until we cancel it
+                job_id = client.post('/imports', json={"path": "big.ndjson"}).get_json()['data']['id']
+                while client.get(f'/imports/{job_id}').get_json()['data']['status'] != 'running':
+                    time.sleep(0.005)
+                assert client.delete(f'/imports/{job_id}').status_code == 200
+            job = wait(job_id)
+            assert job['status'] == 'cancelled' and job['imported'] == 100 and job['progress'] < 1
+            print("   ✅ cancelled import stopped after its current chunk")
+            assert job_id in [job['id'] for job in client.get('/imports').get_json()['data']['imports']]
+        finally:
+            api.app.config['IMPORT_DIR'], api.importer.chunk_size = old_dir, old_chunk
+
+    print("✅ Imports test passed!")
+
+def test_single_flight():
+    """Test coalescing of identical concurrent reads"""
+    print("\n🧪 Testing Single-flight Reads...")
+    import threading
+    import time
+    import app as api
+
+    client = get_test_client()
+    route = '/users/<int:user_id>'
+    before = api.single_flight.stats()['routes'].get(route, {"computed": 0, "coalesced": 0})
+    original_get = api.store.get
+    gate = threading.Event()
+    calls = []
+
+    def slow_get(user_id):
+        calls.append(user_id)
+        gate.wait(2)
+        return original_get(user_id)
+
+    def fetch(results, index):
+        results[index] = api.app.test_client().get('/users/2')
+
+    api.store.get = slow_get
+    try:
+        results = [None] * 20
+        threads = [threading.Thread(target=fetch, args=(results, i)) for i in range(20)]
+        for thread in threads:
+            thread.start()
+        time.sleep(0.2)
+        gate.set()
+        for thread in threads:
+            thread.join()
+    finally:
+        api.store.get = original_get
+
+    assert all(r.status_code == 200 for r in results)
+    assert len({r.get_data() for r in results}) == 1 and len(calls) < 20
+    assert len({r.headers['X-Request-ID'] for r in results}) == 20
+    stats = client.get('/health').get_json()['data']['single_flight']['routes'][route]
+    assert stats['computed'] - before['computed'] == len(calls)
+    assert stats['coalesced'] - before['coalesced'] == 20 - len(calls)
+    print(f"   ✅ 20 concurrent GET /users/2 -> {len(calls)} computation(s), "
+          f"coalesced rate {stats['coalesced_rate']}")
+
+    # A write changes the store version, so the next read computes afresh
+    before = client.get('/users/2').get_json()['data']
+    client.put('/users/2', json={"age": 61})
+    assert client.get('/users/2').get_json()['data']['age'] == 61 != before['age']
+    tokens = {client.get('/users?snapshot=new').get_json()['data']['snapshot'] for _ in range(3)}
+    assert len(tokens) == 3
+    print("   ✅ writes and new snapshot pins are never served a shared result")
+
+    print("✅ Single-flight test passed!")
+
+def test_access_log():
+    """Test the queued JSON-lines access log: batching, sampling, drops"""
+    print("\n🧪 Testing Access Log...")
+    import os
+    import tempfile
+    import threading
+    import app as api
+    from accesslog import AccessLogger
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'access.jsonl')
+        logged = api.create_app({'ACCESS_LOG': path, 'DATASET': 'sample'})
+        access_log = api.get_state(logged).access_log
+        client = logged.test_client()
+        client.get('/users/1?fields=all', headers={"X-Request-ID": "log-1", "User-Agent": "tests"})
+        client.get('/users/999')
+        client.post('/users', json={"name": "Log", "email": "log@example.com", "age": 30})
+        access_log.sample_rate = 0.0
+        client.get('/users/1')
+        assert access_log.sampled_out == 1
+        access_log.close()
+        # Durations don't depend on tracing
+        untraced = api.create_app({'ACCESS_LOG': path, 'TRACING': False, 'DATASET': 'sample'})
+        untraced.test_client().get('/users/2', headers={"X-Request-ID": "log-2"})
+        api.get_state(untraced).close()
+        # Without ACCESS_LOG the app neither hooks into requests nor builds a logger
+        quiet = api.create_app()
+        assert quiet.test_client().get('/health').get_json()['data']['access_log'] == {"enabled": False}
+        assert 'access_log' not in api.get_state(quiet).built()
+        assert not any(isinstance(getattr(hook, '__self__', None), AccessLogger)
+                       for hook in quiet.after_request_funcs.get(None, []))
+
+        with open(path) as f:
+            entries = [json.loads(line) for line in f]
+        untraced_entry = entries.pop()
+        assert untraced_entry['request_id'] == 'log-2' and untraced_entry['duration_ms'] > 0
+        assert [(e['method'], e['path'], e['status']) for e in entries] == [
+            ('GET', '/users/1', 200), ('GET', '/users/999', 404), ('POST', '/users', 201)]
+        first = entries[0]
+        assert first['query'] == 'fields=all' and first['request_id'] == 'log-1'
+        assert first['user_agent'] == 'tests' and first['duration_ms'] > 0 and first['bytes'] > 0
+        print(f"   ✅ {len(entries)} JSON lines written in the background, 1 sampled out")
+        print("   ✅ duration and request id logged with tracing off")
+
+        # A stalled writer fills the queue; further entries are dropped and counted
+        stalled, release = threading.Event(), threading.Event()
+        logger = AccessLogger(os.path.join(tmp, 'stalled.jsonl'), queue_size=3)
+        original_write = logger._write
+        logger._write = lambda batch: (stalled.set(), release.wait(5), original_write(batch))
+        entry = (0.0, 'GET', '/users/1', '', 200, 1000, 10, None, None, None)
+        logger.log(entry)
+        assert stalled.wait(5)
+        for i in range(20):
+            logger.log(entry)
+        stats = logger.stats()
+        assert stats['enqueued'] == 4 and stats['dropped'] == 17 and stats['queue_depth'] == 3
+        # close() gives up on a writer that is still busy and leaves it its file
+        logger.close(timeout=0.1)
+        assert logger._thread is not None and logger._thread.is_alive()
+        release.set()
+        logger.close()
+        assert logger.stats()['written'] == stats['enqueued'] and logger._fd is None
+        print(f"   ✅ full queue: {stats['dropped']} dropped, {stats['enqueued']} written later")
+
+        # One process-wide fork/exit hook; writers are tracked weakly, not kept alive
+        import gc
+        import linequeue
+        before = len(linequeue._writers)
+        writers = [AccessLogger(os.path.join(tmp, f'w{i}.jsonl')) for i in range(5)]
+        assert len(linequeue._writers) == before + 5
+        del writers
+        gc.collect()
+        assert len(linequeue._writers) == before
+        print("   ✅ writers are released once unused; no per-writer fork/exit hooks")
+
+    print("✅ Access log test passed!")
+
+def test_soak():
+    """Test a short concurrent soak: no unexpected statuses, invariants hold"""
+    print("\n🧪 Testing Concurrency Soak...")
+    import app as api
+    from soak import check_invariants, soak
+
+    latencies, statuses, failures, problems, elapsed = soak(
+        api.app, api.store, threads=8, duration=1.0, seed=7
+    )
+    assert not failures, failures[:3]
+    assert not problems, problems
+    assert statuses[201] and statuses[200] and all(latencies.values())
+    total = sum(len(values) for values in latencies.values())
+    print(f"   ✅ {total} requests from 8 threads in {elapsed:.1f}s, invariants hold")
+
+    # The checker does notice a broken index
+    api.store.indexes['age'].add({"id": 10 ** 9, "age": 1})
+    try:
+        assert any("'age'" in problem for problem in check_invariants(api.store))
+    finally:
+        api.store.indexes['age'].remove({"id": 10 ** 9, "age": 1})
+    assert not check_invariants(api.store)
+    print("   ✅ a corrupted sort index is reported")
+
+    print("✅ Soak test passed!")
+
+def test_app_factory():
+    """Test create_app(): independent instances, lazy subsystems, config switches"""
+    print("\n🧪 Testing App Factory...")
+    import os
+    import sqlite3
+    import tempfile
+    import app as api
+    from bench_startup import STARTUP_BUDGET_RATIO, own_cost, startup_ratio
+
+    first, second = api.create_app(), api.create_app({'DATASET': 'sample'})
+    state = api.get_state(first)
+    assert state.built() == ['tracer']
+    assert first.test_client().get('/users/1').status_code == 404
+    assert state.built() == ['single_flight', 'store', 'tracer']
+    client = second.test_client()
+    assert client.get('/users/1').status_code == 200
+    client.post('/users', json={"name": "Factory", "email": "factory@example.com", "age": 40})
+    assert api.get_state(first).store.stats.total == 0 and api.get_state(second).store.stats.total == 4
+    print(f"   ✅ separate stores; built on first request: {state.built()}")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        spill_path = os.path.join(tmp, 'spill.db')
+        plain = api.create_app({'TRACING': False, 'SINGLE_FLIGHT': False, 'DATASET': 'sample',
+                                'STORE_TIER': 'tiered', 'STORE_HOT_MB': 1,
+                                'STORE_SPILL_PATH': spill_path})
+        response = plain.test_client().get('/users/2')
+        assert response.status_code == 200 and 'X-Request-ID' not in response.headers
+        health = plain.test_client().get('/health').get_json()['data']
+        assert health['single_flight']['routes'] == {} and health['storage']['mode'] == 'tiered'
+        print("   ✅ tracing and coalescing switched off, tiered storage chosen by config")
+
+        plain_state = api.get_state(plain)
+        importer = plain_state.importer
+        plain_state.close()
+        assert importer._executor._shutdown
+        try:
+            plain_state.store.tier._db.execute("SELECT 1")
+            raise AssertionError("spill file still open after close()")
+        except sqlite3.ProgrammingError:
+            pass
+    print("   ✅ close() stopped the importer and closed the store")
+
+    ratio, cold, bare = startup_ratio(runs=5)
+    assert all(result['status'] == 404 and result['deferred_loaded'] == [] for result in cold)
+    assert all(result['status'] == 404 for result in bare)
+    assert ratio <= STARTUP_BUDGET_RATIO, f"cold start {ratio:.1f}x a bare Flask app"
+    cost = min(own_cost(result) for result in cold) * 1000
+    print(f"   ✅ cold start {ratio:.1f}x a bare Flask app (best {cost:.1f} ms beyond Flask), "
+          f"no optional subsystem imported")
+
+    print("✅ App factory test passed!")
+
+def test_patch_and_minimal_returns():
+    """Test PATCH with JSON Merge Patch and Prefer: return=minimal on writes"""
+    print("\n🧪 Testing PATCH and Minimal Returns...")
+    import app as api
+
+    client = get_test_client()
+    store = api.store
+    merge_patch = {"Content-Type": "application/merge-patch+json"}
+    before = store.snapshot()
+    response = client.patch('/users/1', data=json.dumps({"age": 31, "department": None, "id": 99}),
+                            headers=merge_patch)
+    assert response.status_code == 200
+    user = response.get_json()['data']
+    assert user['id'] == 1 and user['age'] == 31 and 'department' not in user
+    after = store.snapshot()
+    assert after.indexes['name'] is before.indexes['name']
+    assert after.indexes['age'] is not before.indexes['age']
+    assert store.stats.department_counts[''] == 1
+    print("   ✅ merge patch changed age, removed department, left the name index alone")
+
+    version = store.version
+    response = client.patch('/users/1', json={"name": user['name'], "age": 31})
+    assert response.status_code == 200 and store.version == version
+    assert response.get_json()['message'].endswith('unchanged')
+    assert client.patch('/users/1', json={"email": None}).get_json()['errors'] == {
+        "email": ["'email' is required and cannot be removed"]}
+    assert client.patch('/users/1', json=[1]).status_code == 400
+    assert client.patch('/users/1', json={"email": "jane.smith@example.com"}).status_code == 400
+    assert client.patch('/users/999', json={"age": 1}).status_code == 404
+    print("   ✅ no-op patch publishes nothing; removals, bad bodies and duplicates rejected")
+
+    minimal = {"Prefer": "return=minimal"}
+    response = client.post('/users', json={"name": "Min", "email": "min@example.com", "age": 20},
+                           headers=minimal)
+    new_id = response.get_json()['id']
+    assert response.status_code == 201 and response.get_json() == {"id": new_id}
+    assert response.headers['Location'] == f'/users/{new_id}'
+    assert response.headers['Preference-Applied'] == 'return=minimal'
+    for method, body in (('put', {"age": 21}), ('patch', {"age": 22}), ('delete', None)):
+        response = getattr(client, method)(f'/users/{new_id}', json=body, headers=minimal)
+        assert response.status_code == 204 and response.data == b''
+        assert 'Content-Type' not in response.headers
+    assert client.get(f'/users/{new_id}').status_code == 404
+    full = client.put('/users/1', json={"age": 32})
+    assert full.status_code == 200 and 'Preference-Applied' not in full.headers
+    print(f"   ✅ return=minimal: 201 {{id}} + Location, then 204s (vs {len(full.data)} bytes for PUT)")
+
+    for method in ('put', 'patch'):
+        modified = client.get('/health').get_json()['data']['stats']['last_modified']
+        departments = dict(store.stats.department_counts)
+        assert getattr(client, method)('/users/1', json={"name": f"Renamed {method}"}).status_code == 200
+        stats = client.get('/health').get_json()['data']['stats']
+        assert stats['last_modified'] > modified and stats['departments'] == departments
+    print("   ✅ name-only PUT and PATCH still move last_modified")
+
+    print("✅ PATCH and minimal returns test passed!")
+
 def run_all_tests():
     """Run all test functions"""
     print("🚀 Running User Management REST API Tests")
@@ -253,7 +1272,24 @@ def run_all_tests():
         test_data_validation,
         test_http_status_codes,
         test_json_handling,
-        test_memory_storage
+        test_memory_storage,
+        test_sorted_listing,
+        test_aggregates,
+        test_schema_validation,
+        test_datasets,
+        test_snapshots,
+        test_batch,
+        test_serve_prefork,
+        test_tiered_storage,
+        test_tracing,
+        test_debug_endpoints,
+        test_msgpack_negotiation,
+        test_imports,
+        test_single_flight,
+        test_access_log,
+        test_soak,
+        test_app_factory,
+        test_patch_and_minimal_returns
     ]
 
     passed = 0
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Tiered record storage for the User Management REST API
+
+In tiered mode the store keeps only small revision numbers in its pages.
+The records themselves live here: a bounded in-memory LRU of hot records
+in front of an on-disk SQLite spill file. Records are written to disk
+lazily, when the LRU evicts them, and faulted back in on access.
+
+Every stored version of a record gets its own revision, and rows are
+keyed by (id, rev), so a snapshot always reads the exact versions it was
+published with. Superseded revisions are vacuumed once no live snapshot
+can still see them.
+
+Configuration (create_app() settings, see app.default_config()):
+    STORE_TIER        'memory' (default) or 'tiered'
+    STORE_HOT_MB      approximate memory budget for hot records (64)
+    STORE_SPILL_PATH  spill file path (a temporary file by default)
+"""
+
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+# Vacuum superseded revisions once this many are waiting
+VACUUM_THRESHOLD = 1000
+
+
+def estimate_size(user):
+    """Approximate resident size of a record dict in bytes"""
+    size = sys.getsizeof(user)
+    for key, value in user.items():
+        size += sys.getsizeof(value)
+    return size
+
+
+class TieredRecords:
+    """Hot LRU of records backed by a SQLite spill file"""
+
+    def __init__(self, max_bytes=64 * 1024 * 1024, path=None):
+        self.max_bytes = max_bytes
+        self._owns_file = path is None
+        if path is None:
+            handle, path = tempfile.mkstemp(prefix='users-spill-', suffix='.sqlite')
+            os.close(handle)
+        elif os.path.exists(path):
+            # The spill file is only a cache of this process's memory
+            os.remove(path)
+        self.path = path
+
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=OFF")
+        self._db.execute("PRAGMA synchronous=OFF")
+        self._db.execute(
+            "CREATE TABLE records (id INTEGER, rev INTEGER, data TEXT, "
+            "PRIMARY KEY (id, rev)) WITHOUT ROWID"
+        )
+
+        self._hot = OrderedDict()     # (id, rev) -> [record, size, dirty]
+        self._hot_bytes = 0
+        self._next_rev = 1
+        self._garbage = []            # (id, rev, superseded_at_version)
+
+        self.hits = 0
+        self.faults = 0
+        self.evictions = 0
+        self.spills = 0
+        self.fault_seconds = 0.0
+        self.max_fault_seconds = 0.0
+
+    # Writer side (called under the store lock)
+
+    def put(self, user):
+        """Store a new record version and return its revision"""
+        with self._lock:
+            rev = self._next_rev
+            self._next_rev += 1
+            self._remember((user['id'], rev), user, dirty=True)
+            return rev
+
+    def put_many(self, users):
+        """Store many records at once, straight to disk; return their revisions.
+
+        The highest ids (the most recently created users) are then kept
+        hot, up to the memory budget.
+        """
+        with self._lock:
+            first = self._next_rev
+            self._next_rev += len(users)
+            dumps = json.JSONEncoder(separators=(',', ':')).encode
+            self._db.execute("BEGIN")
+            self._db.executemany(
+                "INSERT INTO records VALUES (?, ?, ?)",
+                ((user['id'], first + i, dumps(user)) for i, user in enumerate(users))
+            )
+            self._db.execute("COMMIT")
+
+            revs = list(range(first, first + len(users)))
+            for i in range(len(users) - 1, -1, -1):
+                user = users[i]
+                size = estimate_size(user)
+                if self._hot_bytes + size > self.max_bytes:
+                    break
+                self._hot[(user['id'], revs[i])] = [user, size, False]
+                self._hot.move_to_end((user['id'], revs[i]), last=False)
+                self._hot_bytes += size
+            return revs
+
+    def retire(self, user_id, rev, version):
+        """Mark a revision superseded from store `version` on"""
+        self._garbage.append((user_id, rev, version))
+
+    def should_vacuum(self):
+        return len(self._garbage) >= VACUUM_THRESHOLD
+
+    def vacuum(self, oldest_live_version):
+        """Drop revisions no snapshot at or after `oldest_live_version` can see"""
+        with self._lock:
+            keep = []
+            dead = []
+            for entry in self._garbage:
+                (dead if entry[2] <= oldest_live_version else keep).append(entry)
+            self._garbage = keep
+            for user_id, rev, _ in dead:
+                entry = self._hot.pop((user_id, rev), None)
+                if entry is not None:
+                    self._hot_bytes -= entry[1]
+            if dead:
+                self._db.executemany(
+                    "DELETE FROM records WHERE id = ? AND rev = ?",
+                    ((user_id, rev) for user_id, rev, _ in dead)
+                )
+            return len(dead)
+
+    # Reader side
+
+    def fetch(self, user_id, rev):
+        """Return the record for (id, rev), faulting it in from disk if cold"""
+        key = (user_id, rev)
+        with self._lock:
+            entry = self._hot.get(key)
+            if entry is not None:
+                self._hot.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+
+            start = time.perf_counter()
+            row = self._db.execute(
+                "SELECT data FROM records WHERE id = ? AND rev = ?", key
+            ).fetchone()
+            if row is None:
+                return None
+            user = json.loads(row[0])
+            self._remember(key, user, dirty=False)
+            elapsed = time.perf_counter() - start
+            self.faults += 1
+            self.fault_seconds += elapsed
+            self.max_fault_seconds = max(self.max_fault_seconds, elapsed)
+            return user
+
+    def _remember(self, key, user, dirty):
+        size = estimate_size(user)
+        self._hot[key] = [user, size, dirty]
+        self._hot_bytes += size
+        self._evict()
+
+    def _evict(self):
+        """Spill least recently used records until under the memory budget"""
+        spill = []
+        while self._hot_bytes > self.max_bytes and len(self._hot) > 1:
+            (user_id, rev), (user, size, dirty) = self._hot.popitem(last=False)
+            self._hot_bytes -= size
+            self.evictions += 1
+            if dirty:
+                spill.append((user_id, rev, json.dumps(user, separators=(',', ':'))))
+        if spill:
+            self._db.executemany("INSERT OR REPLACE INTO records VALUES (?, ?, ?)", spill)
+            self.spills += len(spill)
+
+    def resident_sample(self, count):
+        """Up to `count` records already in memory, picked at random.
+
+        Nothing is read from disk and the LRU order and hit counters are
+        left alone, so sizing the store doesn't change what it measures.
+        """
+        with self._lock:
+            entries = list(self._hot.values())
+        if len(entries) > count:
+            entries = random.sample(entries, count)
+        return [entry[0] for entry in entries]
+
+    def stats(self):
+        """Hit rate, fault latency and residency for /health"""
+        with self._lock:
+            lookups = self.hits + self.faults
+            return {
+                "mode": "tiered",
+                "hot_records": len(self._hot),
+                "hot_bytes": self._hot_bytes,
+                "max_hot_bytes": self.max_bytes,
+                "hits": self.hits,
+                "faults": self.faults,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else None,
+                "avg_fault_ms": round(self.fault_seconds / self.faults * 1000, 3) if self.faults else None,
+                "max_fault_ms": round(self.max_fault_seconds * 1000, 3),
+                "evictions": self.evictions,
+                "spilled_records": self.spills,
+                "pending_vacuum": len(self._garbage),
+                "spill_file": self.path
+            }
+
+    def close(self):
+        """Close the spill file (and remove it if it was a temporary file)"""
+        with self._lock:
+            self._db.close()
+            if self._owns_file and os.path.exists(self.path):
+                os.remove(self.path)
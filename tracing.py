@@ -0,0 +1,277 @@
+#!/usr/bin/env python3
+"""
+Per-request phase tracing for the User Management REST API
+
+Every request gets a root span, and routes wrap their phases (JSON
+parsing, validation, store access, serialization) in child spans:
+
+    with span('validate'):
+        errors = user_validator.validate(data)
+
+A span is two perf_counter_ns() calls and a list append; nothing else
+happens until the request finishes. Then the trace is:
+
+- exported as one line of OpenTelemetry (OTLP/JSON) to the Tracer's
+  path (create_app's TRACE_FILE), when that is set, through a bounded
+  queue and a background writer (linequeue.py), so requests never wait
+  on the disk, and
+- logged with its phase breakdown on the 'user_api.slow' logger when the
+  request took longer than slow_ms (SLOW_REQUEST_MS, 500 by default).
+
+Requests are correlated through the X-Request-ID header, which is echoed
+on every response (and generated when the client didn't send one). A
+W3C traceparent header, if present, supplies the trace and parent span.
+"""
+
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+from contextvars import ContextVar
+
+from flask import request
+
+from linequeue import QueuedLineWriter
+
+SERVICE_NAME = 'user-management-api'
+
+REQUEST_ID_HEADER = 'X-Request-ID'
+REQUEST_ID_ENVIRON = 'HTTP_X_REQUEST_ID'
+
+TRACE_ID = re.compile(r'[0-9a-f]{32}\Z')
+TRACEPARENT = re.compile(r'00-([0-9a-f]{32})-([0-9a-f]{16})-[0-9a-f]{2}\Z')
+
+# Finished traces waiting to be exported; more are dropped and counted
+TRACE_QUEUE_SIZE = 10000
+
+# OTLP span kinds
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+
+slow_log = logging.getLogger('user_api.slow')
+
+# Trace and span ids only need to be unique, not unpredictable, so they
+# come from a (urandom-seeded) PRNG rather than a syscall per request
+_ids = random.Random()
+if hasattr(os, 'register_at_fork'):
+    # Forked workers (serve.py) must not repeat each other's ids
+    os.register_at_fork(after_in_child=_ids.seed)
+
+
+def new_id(bits):
+    """A random hex id of `bits` bits"""
+    return f"{_ids.getrandbits(bits):0{bits // 4}x}"
+
+
+class Trace:
+    """Timings for one request: the root span plus flat phase spans"""
+
+    __slots__ = ('trace_id', 'span_id', 'parent_id', 'request_id',
+                 'start_unix_ns', 'start_ns', 'end_ns', 'phases', 'name', 'status')
+
+    def __init__(self, request_id, trace_id, parent_id=''):
+        self.request_id = request_id
+        self.trace_id = trace_id
+        self.span_id = new_id(64)
+        self.parent_id = parent_id
+        self.start_unix_ns = time.time_ns()
+        self.start_ns = time.perf_counter_ns()
+        self.end_ns = None
+        self.phases = []   # (name, start_ns, end_ns)
+        self.name = None
+        self.status = None
+
+    @property
+    def duration_ms(self):
+        return (self.end_ns - self.start_ns) / 1e6
+
+    def breakdown(self):
+        """Milliseconds per phase name, plus time outside any phase as 'other'"""
+        totals = {}
+        for name, start, end in self.phases:
+            totals[name] = totals.get(name, 0) + (end - start)
+        other = (self.end_ns - self.start_ns) - sum(totals.values())
+        breakdown = {name: round(ns / 1e6, 3) for name, ns in totals.items()}
+        breakdown['other'] = round(max(other, 0) / 1e6, 3)
+        return breakdown
+
+
+class _Phase:
+    __slots__ = ('trace', 'name', 'start')
+
+    def __init__(self, trace, name):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, *exc):
+        self.trace.phases.append((self.name, self.start, time.perf_counter_ns()))
+        return False
+
+
+class _NoPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NO_PHASE = _NoPhase()
+
+_current = ContextVar('trace', default=None)
+
+
+def span(name):
+    """Time a phase of the current request (a no-op outside a traced request)"""
+    trace = _current.get()
+    if trace is None:
+        return _NO_PHASE
+    return _Phase(trace, name)
+
+
+def record_phase(name, start_ns):
+    """Record a phase that started at `start_ns` (perf_counter_ns) and ends now"""
+    trace = _current.get()
+    if trace is not None:
+        trace.phases.append((name, start_ns, time.perf_counter_ns()))
+
+
+def current_trace():
+    """The trace of the request being handled on this thread, or None"""
+    return _current.get()
+
+
+class Tracer:
+    """Starts, finishes, exports and slow-logs request traces for a Flask app"""
+
+    def __init__(self, path=None, slow_ms=500.0, queue_size=TRACE_QUEUE_SIZE):
+        self.path = path
+        self.slow_ms = slow_ms
+        self.queue_size = queue_size
+        self._writer = None
+        self._writer_lock = threading.Lock()
+
+    def init_app(self, app):
+        app.before_request(self._start)
+        app.after_request(self._finish)
+        app.teardown_request(self._clear)
+
+    def _start(self):
+        # Read the WSGI environ directly; it is much cheaper than request.headers
+        environ = request.environ
+        request_id = environ.get(REQUEST_ID_ENVIRON)
+        traceparent = environ.get('HTTP_TRACEPARENT')
+        match = TRACEPARENT.match(traceparent) if traceparent else None
+        if match:
+            trace = Trace(request_id or match.group(1), match.group(1), match.group(2))
+        elif request_id is None:
+            request_id = new_id(128)
+            trace = Trace(request_id, request_id)
+        elif TRACE_ID.match(request_id):
+            trace = Trace(request_id, request_id)
+        else:
+            trace = Trace(request_id, new_id(128))
+        _current.set(trace)
+
+    def _finish(self, response):
+        trace = _current.get()
+        if trace is None:
+            return response
+        trace.end_ns = time.perf_counter_ns()
+        rule = request.url_rule.rule if request.url_rule is not None else request.path
+        trace.name = f"{request.method} {rule}"
+        trace.status = response.status_code
+        response.headers[REQUEST_ID_HEADER] = trace.request_id
+
+        if self.path:
+            self.export(trace)
+        if trace.duration_ms >= self.slow_ms:
+            slow_log.warning(
+                "Slow request %s %s -> %s in %.1fms [request_id=%s] phases: %s",
+                request.method, request.full_path.rstrip('?'), trace.status,
+                trace.duration_ms, trace.request_id, json.dumps(trace.breakdown())
+            )
+        return response
+
+    def _clear(self, exc=None):
+        _current.set(None)
+
+    def export(self, trace):
+        """Queue the trace to be appended to the trace file as one OTLP/JSON line"""
+        writer = self._writer
+        if writer is None:
+            with self._writer_lock:
+                if self._writer is None:
+                    self._writer = QueuedLineWriter(self.path, format_trace, self.queue_size,
+                                                    name='trace-export')
+                writer = self._writer
+        writer.log(trace)
+
+    def stats(self):
+        """Export queue counters (None until a trace has been exported)"""
+        writer = self._writer
+        return writer.stats() if writer is not None else None
+
+    def close(self):
+        """Write the queued traces and close the trace file"""
+        with self._writer_lock:
+            writer, self._writer = self._writer, None
+        if writer is not None:
+            writer.close()
+
+
+def _attribute(key, value):
+    if isinstance(value, bool):
+        return {"key": key, "value": {"boolValue": value}}
+    if isinstance(value, int):
+        return {"key": key, "value": {"intValue": str(value)}}
+    return {"key": key, "value": {"stringValue": str(value)}}
+
+
+def format_trace(trace):
+    """Render a finished trace as one OTLP/JSON line"""
+    return json.dumps(to_otlp(trace), separators=(',', ':')) + '\n'
+
+
+def to_otlp(trace):
+    """Render a finished trace as an OTLP/JSON ExportTraceServiceRequest"""
+    base_unix = trace.start_unix_ns - trace.start_ns
+    spans = [{
+        "traceId": trace.trace_id,
+        "spanId": trace.span_id,
+        "parentSpanId": trace.parent_id,
+        "name": trace.name,
+        "kind": KIND_SERVER,
+        "startTimeUnixNano": str(trace.start_unix_ns),
+        "endTimeUnixNano": str(base_unix + trace.end_ns),
+        "attributes": [
+            _attribute("http.request_id", trace.request_id),
+            _attribute("http.status_code", trace.status)
+        ],
+        "status": {"code": 2 if trace.status >= 500 else 0}
+    }]
+    for name, start, end in trace.phases:
+        spans.append({
+            "traceId": trace.trace_id,
+            "spanId": new_id(64),
+            "parentSpanId": trace.span_id,
+            "name": name,
+            "kind": KIND_INTERNAL,
+            "startTimeUnixNano": str(base_unix + start),
+            "endTimeUnixNano": str(base_unix + end)
+        })
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": [_attribute("service.name", SERVICE_NAME)]},
+            "scopeSpans": [{"scope": {"name": "tracing"}, "spans": spans}]
+        }]
+    }
@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Schema-driven request validation for the User Management REST API
+
+The user schema is declared once and turned into a flat table of field
+rules (exact type checks, bounds and a precompiled email regex). From the
+same rules each validator also compiles a straight-line check that only
+answers "is this record valid?": type and bound tests first, regexes
+last, no per-field loop and no error dict. Valid records (the common
+case) take only that path; the first failure falls back to the
+rule-by-rule pass that builds the structured per-field errors.
+"""
+
+import re
+
+# Local part, a single '@' and at least two non-empty dot-separated domain
+# labels. Written without nested optional groups so match() never backtracks
+# much; it is used with re.match, hence the trailing \Z and no leading ^.
+EMAIL_PATTERN = r'[A-Za-z0-9._%+\-]+@[A-Za-z0-9\-]+(?:\.[A-Za-z0-9\-]+)+\Z'
+
+# Field rules for user records. 'required' applies to creates; on partial
+# updates every field may be left out, but a required one that is present
+# as null or "" is still rejected.
+USER_SCHEMA = {
+    'name': {
+        'type': str,
+        'required': True,
+        'message': "'name' must be a non-empty string"
+    },
+    'email': {
+        'type': str,
+        'required': True,
+        'pattern': EMAIL_PATTERN,
+        'message': "Invalid email format"
+    },
+    'age': {
+        'type': int,
+        'required': True,
+        'min': 0,
+        'message': "Age must be a positive integer"
+    },
+    'department': {
+        'type': str,
+        'required': False,
+        'message': "'department' must be a string"
+    }
+}
+
+
+# Marks a field that is absent from the data (as opposed to null)
+_ABSENT = object()
+
+
+class SchemaValidator:
+    """Validator driven by a schema dict like USER_SCHEMA"""
+
+    def __init__(self, schema):
+        self.fields = tuple(schema)
+        self.required = tuple(name for name, spec in schema.items() if spec.get('required', False))
+        # One flat rule per field, with its regex compiled once
+        self._rules = tuple(
+            (
+                name,
+                spec['type'],
+                spec.get('required', False),
+                re.compile(spec['pattern']).match if 'pattern' in spec else None,
+                spec.get('min'),
+                spec['message'],
+                f"'{name}' is required",
+            )
+            for name, spec in schema.items()
+        )
+        self._is_valid = self._compile_check(partial=False)
+        self._is_valid_partial = self._compile_check(partial=True)
+
+    def _compile_check(self, partial):
+        """Build a function returning True iff _errors(data, partial) is empty"""
+        namespace = {'_ABSENT': _ABSENT}
+        checks, patterns = [], []
+        for index, (name, kind, required, match, minimum, _, _) in enumerate(self._rules):
+            value, kind_name = f"v{index}", f"kind{index}"
+            namespace[kind_name] = kind
+            if kind is str and required:
+                test = f"{value}.__class__ is not {kind_name} or not {value}"
+            elif kind is str:
+                # Optional strings may be ""
+                test = f"{value}.__class__ is not {kind_name}"
+            elif minimum is not None:
+                namespace[f"min{index}"] = minimum
+                test = f"{value}.__class__ is not {kind_name} or {value} < min{index}"
+            else:
+                test = f"{value}.__class__ is not {kind_name}"
+            if not required and not partial:
+                # Optional fields may be left out or null on a create
+                lookup, test = f"get({name!r})", f"{value} is not None and ({test})"
+            elif partial:
+                # Partial updates may leave any field out
+                lookup, test = f"get({name!r}, _ABSENT)", f"{value} is not _ABSENT and ({test})"
+            else:
+                lookup = f"get({name!r})"
+            checks.append(f"    {value} = {lookup}\n    if {test}:\n        return False")
+            if match is not None:
+                namespace[f"match{index}"] = match
+                skip = f"{value} is not _ABSENT and " if partial else f"{value} is not None and " if not required else ""
+                patterns.append(f"    if {skip}match{index}({value}) is None:\n        return False")
+        source = "def check(data):\n    get = data.get\n" + "\n".join(checks + patterns) + "\n    return True\n"
+        exec(compile(source, f"<{'partial ' if partial else ''}schema check>", 'exec'), namespace)
+        return namespace['check']
+
+    def _errors(self, data, partial):
+        errors = {}
+        get = data.get
+        for name, kind, required, match, minimum, message, missing in self._rules:
+            value = get(name, _ABSENT)
+            # The exact class test also rejects bool for int fields
+            if value.__class__ is kind:
+                if kind is str:
+                    if value and (match is None or match(value) is not None):
+                        continue
+                elif minimum is None or value >= minimum:
+                    continue
+            # Partial updates may leave a field out; a required field that
+            # is present as null or "" is still missing. Optional strings
+            # may be "", and only a create may leave them null.
+            if value is _ABSENT:
+                if required and not partial:
+                    errors[name] = [missing]
+            elif required and (value is None or value == ''):
+                errors[name] = [missing]
+            elif value is None:
+                if partial:
+                    errors[name] = [message]
+            elif value != '' or kind is not str:
+                errors[name] = [message]
+        return errors
+
+    def validate(self, data, partial=False):
+        """Validate one record and return {field: [messages]} (empty when valid)"""
+        if data.__class__ is not dict:
+            return {'_body': ['Request body must be a JSON object']}
+        if (self._is_valid_partial if partial else self._is_valid)(data):
+            return {}
+        return self._errors(data, partial)
+
+    def validate_patch(self, patch):
+        """Validate a JSON Merge Patch (RFC 7396) for a record.
+
+        null removes a field, which only optional fields allow; any other
+        value is checked as in a partial update.
+        """
+        if patch.__class__ is not dict:
+            return {'_body': ['Merge patch must be a JSON object']}
+        errors = self._errors({name: value for name, value in patch.items() if value is not None}, True)
+        for name in self.required:
+            if name in patch and patch[name] is None:
+                errors[name] = [f"'{name}' is required and cannot be removed"]
+        return errors
+
+    def validate_many(self, records, partial=False):
+        """Validate a list of records; return (position, errors) for the invalid ones.
+
+        Runs the compiled check inline for each record and builds errors
+        only for the records that fail it.
+        """
+        failures = []
+        is_valid = self._is_valid_partial if partial else self._is_valid
+        errors = self._errors
+        for position, data in enumerate(records):
+            if data.__class__ is not dict:
+                failures.append((position, {'_body': ['Record must be a JSON object']}))
+            elif not is_valid(data):
+                failures.append((position, errors(data, partial)))
+        return failures
+
+
+def flatten_errors(errors):
+    """Turn {field: [messages]} into a flat list of messages"""
+    return [message for messages in errors.values() for message in messages]
+
+
+user_validator = SchemaValidator(USER_SCHEMA)